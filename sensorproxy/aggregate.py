@@ -0,0 +1,164 @@
+import logging
+import math
+import threading
+import time
+
+from array import array
+
+logger = logging.getLogger(__name__)
+
+
+def _format_ts(ts: float) -> str:
+    """Format a time like the time column of sensors."""
+
+    formatted = time.strftime("%Y-%m-%dT%H%M%S", time.gmtime(ts))
+    fraction_us = int(ts % 1 * 10**6)
+    if fraction_us:
+        formatted += ".{:06d}".format(fraction_us)
+
+    return formatted
+
+
+class _WindowStats:
+    """Incremental statistics of all value columns of one tag combination."""
+
+    def __init__(self, columns: int):
+        self.count = array("l", [0] * columns)
+        self.mean = array("d", [0.0] * columns)
+        self.m2 = array("d", [0.0] * columns)
+        self.min = array("d", [math.inf] * columns)
+        self.max = array("d", [-math.inf] * columns)
+
+    def add(self, values: []):
+        for i, value in enumerate(values):
+            # only numeric values are aggregated
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+
+            # Welford's online algorithm
+            self.count[i] += 1
+            delta = value - self.mean[i]
+            self.mean[i] += delta / self.count[i]
+            self.m2[i] += delta * (value - self.mean[i])
+
+            if value < self.min[i]:
+                self.min[i] = value
+            if value > self.max[i]:
+                self.max[i] = value
+
+    def values(self):
+        values = []
+        for i, count in enumerate(self.count):
+            if count == 0:
+                values += [None] * len(WindowAggregator.STATISTICS)
+                continue
+
+            stddev = math.sqrt(self.m2[i] / count)
+            values += [self.mean[i], self.min[i], self.max[i], count, stddev]
+
+        return values
+
+
+class WindowAggregator:
+    """Aggregates rows to mean, min, max, count and stddev per time window.
+
+    Windows are aligned to multiples of `window_s`, rows with differing tag
+    columns (prefixed by `tag_prefix`) are aggregated separately. Aggregates
+    of a window are returned by the first `add` after the window is over, or
+    by `expire` if no further rows arrive. Aggregated rows are timestamped
+    with the start of their window.
+    """
+
+    STATISTICS = ["mean", "min", "max", "count", "stddev"]
+
+    def __init__(self, header: [str], window_s: float, tag_prefix: str = "#"):
+        """
+        Args:
+            header ([str]): header of the rows, starting with the time column
+            window_s (float): duration of a window in seconds
+            tag_prefix (str): prefix of tag columns in the header
+        """
+
+        self.window_s = window_s
+
+        self._tag_cols = [num for num, name in enumerate(header)
+                          if num > 0 and name.startswith(tag_prefix)]
+        self._val_cols = [num for num, name in enumerate(header)
+                          if num > 0 and not name.startswith(tag_prefix)]
+
+        self.header = [header[0]] + [header[num] for num in self._tag_cols]
+        for num in self._val_cols:
+            self.header += ["{} ({})".format(header[num], stat)
+                            for stat in WindowAggregator.STATISTICS]
+
+        self._window_start = None
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def add(self, row: [], now: float = None) -> [[]]:
+        """Add a row to the current window.
+
+        Args:
+            row ([]): row matching the header
+            now (float): time of the row, defaults to the current time
+
+        Returns:
+            [[]]: aggregated rows of the previous window, if it is over
+        """
+
+        if now is None:
+            now = time.time()
+        window_start = now - now % self.window_s
+
+        with self._lock:
+            rows = []
+            if self._window_start is not None and window_start != self._window_start:
+                rows = self._flush()
+            self._window_start = window_start
+
+            tags = tuple(row[num] for num in self._tag_cols)
+            if tags not in self._windows:
+                self._windows[tags] = _WindowStats(len(self._val_cols))
+            self._windows[tags].add([row[num] for num in self._val_cols])
+
+        return rows
+
+    def expire(self, now: float = None) -> [[]]:
+        """Aggregated rows of the current window, if it is over.
+
+        Args:
+            now (float): current time, defaults to the current time
+        """
+
+        if now is None:
+            now = time.time()
+
+        with self._lock:
+            if self._window_start is None or now < self._window_start + self.window_s:
+                return []
+            return self._flush()
+
+    def flush(self) -> [[]]:
+        """Aggregated rows of the current window, starting a new one."""
+
+        with self._lock:
+            return self._flush()
+
+    @property
+    def idle(self) -> bool:
+        """Whether no window is open."""
+
+        return self._window_start is None
+
+    def _flush(self):
+        if self._window_start is None:
+            return []
+
+        ts = _format_ts(self._window_start)
+        rows = [[ts, *tags] + stats.values()
+                for tags, stats in self._windows.items()]
+        self._windows = {}
+        self._window_start = None
+
+        logger.debug("aggregated window into {} rows".format(len(rows)))
+        return rows
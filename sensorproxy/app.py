@@ -1,5 +1,10 @@
 #!/usr/bin/env python3
 
+import time
+
+# taken before loading any module, to report the startup time
+_startup_ts = time.perf_counter()
+
 import argparse
 import datetime
 import http.server
@@ -7,9 +12,9 @@ import json
 import logging
 import os
 import platform
+import resource
 import socketserver
 import threading
-import time
 import yaml
 import subprocess
 import sys
@@ -17,22 +22,18 @@ import sys
 import schedule
 from pytimeparse import parse as parse_time
 
-import sensorproxy.sensors.illumination
-import sensorproxy.sensors.audio
+# sensor modules, the lift and influx are imported only if configured,
+# as they depend on hardware-specific libraries
 import sensorproxy.sensors.base
-import sensorproxy.sensors.cellular
-import sensorproxy.sensors.energy
-import sensorproxy.sensors.environment
-import sensorproxy.sensors.logger
-import sensorproxy.sensors.optical
-import sensorproxy.sensors.random
-import sensorproxy.sensors.rsync
-import sensorproxy.sensors.sink
-import sensorproxy.sensors.system
-
-from sensorproxy.lift import Lift
+import sensorproxy.simulation
+import sensorproxy.wifi
+
 from sensorproxy.wifi import WiFiManager
-from sensorproxy.influx import InfluxDBSensorClient
+from sensorproxy.catalog import Catalog
+from sensorproxy.engine import AsyncEngine
+from sensorproxy.bus import ReadingBus, CSVWriter, InfluxWriter, IngestWriter, RingBuffer
+from sensorproxy.scheduling import MeteringRunner, planned_ts
+from sensorproxy.locks import LockManager
 
 logger = logging.getLogger(__name__)
 
@@ -66,15 +67,23 @@ class SensorProxy:
 
         self._init_identifiers(**config)
         self._init_storage(**config)
+        self._init_time_precision(**config)
+        self._init_simulation(**config)
+        self._init_locks(**config)
         # self._init_local_log(**config)
         # the optionals has to be init first, as sensors depend on the existence of a lift
         self._init_optionals(**config)
         self._init_sensors(**config)
 
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        logger.info("started in {:.2f}s, {} modules loaded, max RSS {:.1f} MiB".format(
+            time.perf_counter() - _startup_ts, len(sys.modules), usage.ru_maxrss / 1024))
+
         logger.info(f"loading metering file '{metering_path}'")
         with open(metering_path) as metering_file:
             self.meterings = yaml.load(metering_file, Loader=yaml.Loader)
 
+        self.runners = {}
         self._test_metering()
 
         if not test:
@@ -109,6 +118,15 @@ class SensorProxy:
 
         logger.info(f"using storage at '{storage_path}'")
 
+    def _init_time_precision(self, time_precision="s", **kwargs):
+        try:
+            sensorproxy.sensors.base.Sensor.set_time_precision(time_precision)
+        except sensorproxy.sensors.base.SensorConfigurationException as e:
+            raise ConfigurationException(e)
+
+        self.time_precision = time_precision
+        logger.info("timestamps with precision '{}'".format(time_precision))
+
     def _init_local_log(self, storage_path=".", log_level="INFO", **kwargs):
         if log_level.upper() not in logging._nameToLevel:
             logger.warn("log level '{}' is not in {}, defaulting to INFO".format(
@@ -117,7 +135,7 @@ class SensorProxy:
 
         log_level_num = logging._nameToLevel[log_level.upper()]
         log_path = os.path.join(
-            storage_path, sensorproxy.sensors.base.Sensor.time_repr()+"_sensorproxy.txt")
+            storage_path, sensorproxy.sensors.base.Sensor.time_repr("s")+"_sensorproxy.txt")
 
         handler = logging.FileHandler(log_path, mode="w")
         handler.setLevel(log_level_num)
@@ -131,16 +149,58 @@ class SensorProxy:
         logger.info("local {} log is written to {}".format(
             log_level, log_path))
 
-    def _init_optionals(self, wifi=None, lift=None, influx=None, **kwargs):
+    def _init_simulation(self, simulation=None, lift=None, **kwargs):
+        self.simulated_lift = None
+
+        simulation = sensorproxy.simulation.enabled(simulation)
+        if simulation is None:
+            return
+
+        gpio = sensorproxy.simulation.install(**simulation)
+
+        if lift and "lift" in simulation:
+            self.simulated_lift = sensorproxy.simulation.LiftSimulator(
+                gpio, lift["height"],
+                hall_bottom_pin=lift.get("hall_bottom_pin", 5),
+                hall_top_pin=lift.get("hall_top_pin", 6),
+                **(simulation["lift"] or {}))
+
+            # the lift is configured to connect to the simulator
+            lift["ip"], lift["port"] = self.simulated_lift.address
+
+    def _init_locks(self, locks={}, **kwargs):
+        self.locks = LockManager(**(locks or {}))
+
+    def _init_optionals(self, wifi=None, lift=None, influx=None, catalog=None, async_engine=None, energy_budget=None,
+                        ingest=None, ingest_server=None, bus={}, storage=None, **kwargs):
+        self.engine = None
+        if async_engine is not None:
+            self.engine = AsyncEngine(self, **(async_engine or {}))
+
+        self.catalog = None
+        if catalog:
+            # catalog: true uses the default location in the storage path
+            if not isinstance(catalog, dict):
+                catalog = {"path": os.path.join(
+                    self.storage_path, "catalog.sqlite")}
+            self.catalog = Catalog(**catalog)
+
+            # index files recorded before the catalog existed
+            if not self.catalog.storage():
+                self.catalog.scan(self.storage_path_node, self.hostname)
+
         self.wifi_mgr = None
         if wifi:
-            self.wifi_mgr = WiFiManager(**wifi)
+            self.wifi_mgr = WiFiManager(
+                lock=self.locks.lock(["wifi"], name="wifi"), **wifi)
             logger.info("managing wifi '{}'".format(self.wifi_mgr.interface))
 
         self.lift = None
         if lift:
+            from sensorproxy.lift import Lift
             try:
-                self.lift = Lift(self.wifi_mgr, **lift)
+                self.lift = Lift(self.wifi_mgr, lock=self.locks.lock(
+                    ["lift"], name="lift"), **lift)
                 logger.info("using lift '{}'".format(self.lift.wifi.ssid))
             except Exception as e:
                 logger.warn(
@@ -148,22 +208,85 @@ class SensorProxy:
 
         self.influx = None
         if influx:
-            self.influx = InfluxDBSensorClient(**influx)
+            from sensorproxy.influx import InfluxDBSensorClient
+            self.influx = InfluxDBSensorClient(
+                time_precision=self.time_precision, **influx)
             logger.info("using influx at '{}'".format(influx["host"]))
 
+        self.budget = None
+        if energy_budget is not None:
+            from sensorproxy.budget import EnergyBudget
+            self.budget = EnergyBudget(
+                charging=self._is_charging, **(energy_budget or {}))
+
+        self.ingest = None
+        if ingest:
+            from sensorproxy.ingest import IngestSender
+            self.ingest = IngestSender(**ingest)
+
+        self.ingest_server = None
+        if ingest_server is not None:
+            from sensorproxy.ingest import IngestServer
+            self.ingest_server = IngestServer(self, **(ingest_server or {}))
+
+        self.storage = None
+        if storage:
+            from sensorproxy.storage import StorageManager
+            self.storage = StorageManager(
+                self.storage_path_node, catalog=self.catalog, **storage)
+
+        self._init_bus(**(bus or {}))
+
+    def _init_bus(self, csv={}, influx={}, ingest={}, ring=None):
+        """Subscribe the outputs to the reading bus, options are passed to the subscribers."""
+
+        self.bus = ReadingBus()
+        self.bus.subscribe(CSVWriter(**csv))
+        if self.storage:
+            self.bus.subscribe(self.storage.subscriber())
+        if self.influx:
+            self.bus.subscribe(InfluxWriter(self.influx, **influx))
+        if self.ingest:
+            self.bus.subscribe(IngestWriter(self.ingest, **ingest))
+
+        self.ring = None
+        if ring is not None:
+            self.ring = self.bus.subscribe(RingBuffer(**(ring or {})))
+
     def _init_sensors(self, sensors={}, **kwargs):
         self.sensors = {}
+        self.charging_indicator = None
         for name, params in sensors.items():
-            sensor_cls = sensorproxy.sensors.base.classes[params["type"]]
+            sensor_cls = sensorproxy.sensors.base.get_sensor_class(
+                params["type"])
             sensor = sensor_cls(self, name, **params)
             self.sensors[name] = sensor
 
             logger.info("added sensor '{}' ({})".format(name, params["type"]))
 
-            if isinstance(sensor, sensorproxy.sensors.energy.ChargingIndicator):
+            # compared by name, to not import the energy module if unused
+            if "ChargingIndicator" in [c.__name__ for c in type(sensor).__mro__]:
+                self.charging_indicator = sensor
                 if self.lift:
                     self.lift.charging_indicator = sensor
 
+        # workers build their own instances of the sensors, before meterings are started
+        for name, sensor in self.sensors.items():
+            if sensor._isolated:
+                sensor._isolated.start(sensors[name])
+
+    def _is_charging(self):
+        """Charging state read from the charging indicator, None if there is none.
+
+        The pin is read directly, so the scheduler thread does not wait for
+        sensor locks and no rows are recorded for the checks.
+        """
+
+        if not self.charging_indicator:
+            return None
+
+        return self.charging_indicator.is_charging()
+
     def _reset_lift(self):
         if not self.lift:
             return
@@ -226,17 +349,26 @@ class SensorProxy:
             logger.debug("Testing metering '{}'".format(name))
             self._run_metering(name, metering, test=True)
 
-    def _run_metering(self, name, metering, test=False):
+    def _run_metering(self, name, metering, test=False, deadline_ts=None):
+        """Run a metering, returns False if it was stopped at its deadline."""
+
         logger.info("Running metering {}".format(name))
 
         if (not "heights" in metering) or (self.lift == None) or test:
-            self._record_sensors_threaded(metering["sensors"], test=test)
+            self._record_sensors(metering["sensors"], test=test)
         else:
             try:
                 self.lift.connect()
                 height_last = None
 
+                completed = True
                 for height_request in metering["heights"]:
+                    if deadline_ts is not None and time.time() > deadline_ts:
+                        logger.warn("Metering {} exceeded its deadline, skipping remaining heights.".format(
+                            name))
+                        completed = False
+                        break
+
                     height_reached = self.lift.move_to(height_request)
                     if height_last == height_reached:
                         logger.info("Last height ({}m) matches reached height ({}m), skipping metering. (requested: {}m, max: {}m)".format(
@@ -245,17 +377,35 @@ class SensorProxy:
 
                     logger.info(
                         "Running metering {} at {}m.".format(name, height_reached))
-                    self._record_sensors_threaded(
-                        metering["sensors"], test=test)
+                    self._record_sensors(metering["sensors"], test=test)
 
                 logger.info(
                     "Metering {} is done, moving back to bottom.".format(name))
                 self.lift.move_to(0.0)
                 self.lift.disconnect()
 
+                return completed
+
             except Exception as e:
                 logger.error("Metering {} failed: {}".format(name, e))
-                self._record_sensors_threaded(metering["sensors"], test=test)
+                self._record_sensors(metering["sensors"], test=test)
+
+        return True
+
+    def _record_sensors(self, sensors: {str: dict}, test: bool):
+        if self.engine and not test:
+            height = self.lift._current_height_m if self.lift else None
+            self.engine.record_sensors(sensors, height)
+            self._log_health(sensors)
+        else:
+            self._record_sensors_threaded(sensors, test=test)
+
+    def _log_health(self, sensors: {str: dict}):
+        for name in sensors:
+            health = self.sensors[name].health.as_dict()
+            if health["state"] != sensorproxy.sensors.base.SensorHealth.CLOSED:
+                logger.warn("Sensor '{}' is {} ({} consecutive failures)".format(
+                    name, health["state"], health["consecutive_failures"]))
 
     def _record_sensors_threaded(self, sensors: {str: dict}, test: bool):
         meter_threads = []
@@ -274,6 +424,19 @@ class SensorProxy:
             logger.debug("Waiting for {} to finish...".format(t.sensor.name))
             t.join()
 
+        self._log_health(sensors)
+
+    def health(self):
+        """Health state of all configured sensors, by sensor name."""
+
+        return {name: sensor.health.as_dict() for name, sensor in self.sensors.items()}
+
+    def workers(self):
+        """Worker process statistics of isolated sensors, by sensor name."""
+
+        return {name: sensor._isolated.stats() for name, sensor in self.sensors.items()
+                if sensor._isolated}
+
     def _record_sensor(
         self,
         sensor: sensorproxy.sensors.base.Sensor,
@@ -299,6 +462,22 @@ class SensorProxy:
             logger.error(
                 "Sensor '{}' is not available: {}".format(sensor.name, e))
 
+    def _start_background(self, func, *args):
+        if self.engine:
+            self.engine.submit(func, *args)
+        else:
+            run_threaded(func, *args)
+
+    def schedule_stats(self):
+        """Firing statistics of all scheduled meterings, by metering name."""
+
+        return {name: runner.stats() for name, runner in self.runners.items()}
+
+    def lock_stats(self):
+        """Contention and wait times of the shared resources, by resource name."""
+
+        return self.locks.stats()
+
     def _schedule_metering(self, name: str, metering: dict):
         # default values for start and end (whole day)
         start = 0
@@ -317,13 +496,32 @@ class SensorProxy:
             )
         )
 
+        runner = MeteringRunner(
+            name,
+            run=lambda deadline_ts: self._run_metering(
+                name, metering, deadline_ts=deadline_ts),
+            start=self._start_background,
+            overrun=metering["schedule"].get("overrun", "skip"),
+            max_concurrent=metering["schedule"].get("max_concurrent", 1),
+            deadline=metering["schedule"].get("deadline"),
+            queue_size=metering["schedule"].get("queue_size", 10),
+            budget=self.budget,
+        )
+        self.runners[name] = runner
+        if self.budget:
+            self.budget.register(name, heights="heights" in metering,
+                                 power_w=metering["schedule"].get("power_w"))
+
+        def fire(at_time):
+            runner.fire(planned_ts(at_time))
+
         def schedule_day_second(day_second):
             ts = datetime.datetime.fromtimestamp(day_second)
             time = ts.time()
 
             s = schedule.every().day
             s.at_time = time
-            s.do(run_threaded, self._run_metering, name, metering)
+            s.do(fire, time)
 
         if start < end:
             for day_second in range(start, end, interval):
@@ -399,6 +597,10 @@ def main():
 
     if args.test:
         proxy.test_interactive()
+        # queued readings are published before exiting
+        proxy.bus.close(timeout=10)
+        if proxy.catalog:
+            proxy.catalog.flush()
         logger.info("Testing finished")
         return
 
@@ -0,0 +1,380 @@
+"""Bulk import of recorded CSV files into InfluxDB, e.g. after a rebuild of the database.
+
+Files of a storage tree (`<hostname>/<class>/<file>.csv`) are converted in a
+pool of processes and written by several concurrent writers, limited to a
+global rate. Completed files are appended to a progress file, so an
+interrupted backfill resumes where it stopped.
+"""
+
+import argparse
+import collections
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+import yaml
+from influxdb import InfluxDBClient
+
+from sensorproxy.influx import csv_points, merge_schema, widen, INFLUX_PRECISIONS
+from sensorproxy.sensors.base import Sensor
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """Token bucket shared by all writers, limiting the written points per second."""
+
+    def __init__(self, rate: float):
+        """
+        Args:
+            rate (float): points per second, None for no limit
+        """
+
+        self.rate = rate
+        self._tokens = rate or 0
+        self._ts = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, count: int):
+        if not self.rate:
+            return
+
+        with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.rate, self._tokens +
+                                   (now - self._ts) * self.rate)
+                self._ts = now
+
+                # batches larger than the bucket are let through once it is full
+                if self._tokens >= min(count, self.rate):
+                    self._tokens -= count
+                    return
+
+                time.sleep((min(count, self.rate) - self._tokens) / self.rate)
+
+
+class Progress:
+    """Completed files of a backfill, appended to a JSON lines file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.completed = set()
+
+        if os.path.exists(path):
+            with open(path) as progress_file:
+                for line in progress_file:
+                    try:
+                        self.completed.add(tuple(json.loads(line)))
+                    except ValueError:
+                        # an interrupted append leaves a partial line
+                        continue
+
+        self._file = open(path, "a")
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(path: str):
+        stat = os.stat(path)
+        return (path, stat.st_size, int(stat.st_mtime))
+
+    def done(self, path: str):
+        return Progress.key(path) in self.completed
+
+    def complete(self, key: tuple):
+        with self._lock:
+            self._file.write(json.dumps(key) + "\n")
+            self._file.flush()
+            self.completed.add(key)
+
+    def close(self):
+        self._file.close()
+
+
+def find_files(storage_path: str, progress: Progress = None, _class: str = None):
+    """Find CSV files named according to the convention below a storage path.
+
+    Returns:
+        [(str, str, dict)]: path, hostname and parsed metadata of each file, oldest first
+    """
+
+    files = []
+    for dir_path, _, file_names in os.walk(storage_path):
+        for file_name in file_names:
+            if not file_name.endswith(".csv") or file_name.startswith("."):
+                continue
+
+            path = os.path.join(dir_path, file_name)
+            metadata = Sensor._parse_file_path(path)
+            if metadata is None:
+                continue
+            if _class and metadata["_class"] != _class:
+                continue
+            if progress and progress.done(path):
+                continue
+
+            hostname = os.path.relpath(path, storage_path).split(os.sep)[0]
+            files.append((path, hostname, metadata))
+
+    return sorted(files, key=lambda f: f[2]["ts"])
+
+
+def _convert(path: str, measurement: str, tag_prefix: str, time_precision: str, schema: {str: type}):
+    """Convert a file to points in a worker process, starting from the known schema."""
+
+    merge_schema(measurement, schema)
+    points = csv_points(path, measurement, tag_prefix, time_precision)
+
+    return points, merge_schema(measurement)
+
+
+def _widen(points: [dict], schema: {str: type}):
+    """Cast fields to the widest type seen in all processes."""
+
+    for point in points:
+        fields = point["fields"]
+        for name, value in fields.items():
+            fields[name] = widen(value, schema.get(name))
+
+
+class Backfill:
+    """Converts files in a process pool and writes them with concurrent writers."""
+
+    def __init__(self, influx: dict, processes: int = None, writers: int = 4,
+                 batch_size: int = 5000, rate: float = None, retries: int = 3,
+                 progress: Progress = None, time_precision: str = "s"):
+        """
+        Args:
+            influx (dict): influx configuration, as in the static configuration
+            processes (int): conversion processes, defaults to the number of CPUs
+            writers (int): concurrent writers
+            batch_size (int): points per write
+            rate (float): maximum points per second of all writers
+            retries (int): attempts of a failing write
+            progress (Progress): progress of the backfill
+            time_precision (str): precision of the written times (s, ms, us, ns)
+        """
+
+        influx = dict(influx)
+        influx.pop("spool", None)
+        self.tag_prefix = influx.pop("tag_prefix", "#")
+        self.influx = influx
+
+        self.processes = processes
+        self.writers = writers
+        self.batch_size = batch_size
+        self.rate_limiter = RateLimiter(rate)
+        self.retries = retries
+        self.progress = progress
+        self.time_precision = time_precision
+
+        self.files = 0
+        self.failed_files = 0
+        self.points = 0
+        self.bytes = 0
+
+        # remaining batches and failure of each file in flight
+        self._pending = {}
+        self._queue = queue.Queue(maxsize=writers * 2)
+        self._lock = threading.Lock()
+
+    def _write_batches(self):
+        client = InfluxDBClient(**self.influx)
+
+        while True:
+            batch = self._queue.get()
+            if batch is None:
+                return
+
+            key, points, tags = batch
+            self.rate_limiter.acquire(len(points))
+
+            for attempt in range(self.retries):
+                try:
+                    client.write_points(points, tags=tags, batch_size=self.batch_size,
+                                        time_precision=INFLUX_PRECISIONS[self.time_precision])
+                    failed = False
+                    break
+                except Exception as e:
+                    failed = True
+                    logger.warn("Writing {} points of '{}' failed (attempt {}/{}): {}".format(
+                        len(points), key[0], attempt + 1, self.retries, e))
+                    time.sleep(2 ** attempt)
+
+            self._batch_done(key, len(points), failed)
+
+    def _batch_done(self, key: tuple, count: int, failed: bool):
+        with self._lock:
+            state = self._pending[key]
+            state["batches"] -= 1
+            state["failed"] |= failed
+            if not failed:
+                self.points += count
+            if state["batches"] > 0:
+                return
+
+            del self._pending[key]
+            if state["failed"]:
+                self.failed_files += 1
+                return
+            self.files += 1
+            self.bytes += key[1]
+
+        if self.progress:
+            self.progress.complete(key)
+
+    def _enqueue(self, key: tuple, points: [dict], tags: dict):
+        batches = [points[i:i + self.batch_size]
+                   for i in range(0, len(points), self.batch_size)] or [[]]
+
+        with self._lock:
+            self._pending[key] = {"batches": len(batches), "failed": False}
+
+        for batch in batches:
+            if batch:
+                self._queue.put((key, batch, tags))
+            else:
+                self._batch_done(key, 0, False)
+
+    def stats(self, elapsed_s: float):
+        return {
+            "files": self.files,
+            "failed_files": self.failed_files,
+            "points": self.points,
+            "megabytes": self.bytes / 1024**2,
+            "elapsed_s": elapsed_s,
+            "points_per_s": self.points / elapsed_s if elapsed_s else 0.0,
+            "files_per_s": self.files / elapsed_s if elapsed_s else 0.0,
+        }
+
+    def _submit(self, executor, file: (str, str, dict)):
+        path, _, metadata = file
+        measurement = metadata["_class"]
+        return executor.submit(_convert, path, measurement, self.tag_prefix,
+                               self.time_precision, merge_schema(measurement))
+
+    def _converted(self, path: str, hostname: str, metadata: dict, future):
+        try:
+            points, schema = future.result()
+        except Exception as e:
+            logger.error("Converting '{}' failed: {}".format(path, e))
+            with self._lock:
+                self.failed_files += 1
+            return
+
+        # merge the schema of the worker and cast to the widest types seen
+        _widen(points, merge_schema(metadata["_class"], schema))
+
+        tags = {
+            "hostname": hostname,
+            "id": metadata["_id"],
+            "sensor": metadata["_sensor"],
+        }
+        self._enqueue(Progress.key(path), points, tags)
+
+    def run(self, files: [(str, str, dict)], report_interval_s: float = 10):
+        """Backfill files, as returned by `find_files`.
+
+        Returns:
+            dict: throughput statistics
+        """
+
+        logger.info("backfilling {} files with {} writers".format(
+            len(files), self.writers))
+
+        threads = [threading.Thread(target=self._write_batches, daemon=True)
+                   for _ in range(self.writers)]
+        for thread in threads:
+            thread.start()
+
+        start_ts = time.monotonic()
+        report_ts = start_ts
+
+        processes = self.processes or os.cpu_count() or 1
+        with ProcessPoolExecutor(processes) as executor:
+            # conversions run ahead of the writers by a bounded number of files
+            lead = processes * 2
+            remaining = iter(files)
+            in_flight = collections.deque()
+
+            while True:
+                while len(in_flight) < lead:
+                    file = next(remaining, None)
+                    if file is None:
+                        break
+                    in_flight.append((file, self._submit(executor, file)))
+                if not in_flight:
+                    break
+
+                (path, hostname, metadata), future = in_flight.popleft()
+                self._converted(path, hostname, metadata, future)
+
+                if time.monotonic() - report_ts > report_interval_s:
+                    report_ts = time.monotonic()
+                    logger.info("{files} files, {points} points ({points_per_s:.0f} points/s)".format(
+                        **self.stats(report_ts - start_ts)))
+
+        for _ in threads:
+            self._queue.put(None)
+        for thread in threads:
+            thread.join()
+
+        return self.stats(time.monotonic() - start_ts)
+
+
+def main():
+    from sensorproxy.app import setup_logging
+
+    parser = argparse.ArgumentParser(
+        description="Backfill recorded CSV files into InfluxDB.")
+    parser.add_argument("storage_path", help="storage tree to backfill")
+    parser.add_argument(
+        "-c", "--config", help="config file containing the influx configuration (yml)", default="/boot/sensorproxy.yml")
+    parser.add_argument(
+        "--class", dest="_class", help="only backfill files of this sensor class")
+    parser.add_argument(
+        "-p", "--processes", help="conversion processes", type=int, default=None)
+    parser.add_argument(
+        "-w", "--writers", help="concurrent writers", type=int, default=4)
+    parser.add_argument(
+        "-b", "--batch-size", help="points per write", type=int, default=5000)
+    parser.add_argument(
+        "-r", "--rate", help="maximum points per second", type=float, default=None)
+    parser.add_argument(
+        "--progress", help="progress file, defaults to .backfill-progress.jsonl in the storage path")
+    parser.add_argument(
+        "-v", "--verbose", help="verbose output", action="count", default=0)
+    args = parser.parse_args()
+
+    setup_logging(args.verbose)
+
+    with open(args.config) as config_file:
+        config = yaml.load(config_file, Loader=yaml.Loader)
+    if not config.get("influx"):
+        parser.error("no influx configured in '{}'".format(args.config))
+
+    progress = Progress(args.progress or os.path.join(
+        args.storage_path, ".backfill-progress.jsonl"))
+    files = find_files(args.storage_path, progress, args._class)
+    print("{} files to backfill, {} already completed".format(
+        len(files), len(progress.completed)))
+
+    backfill = Backfill(config["influx"], args.processes, args.writers,
+                        args.batch_size, args.rate, progress=progress,
+                        time_precision=config.get("time_precision", "s"))
+    try:
+        stats = backfill.run(files)
+    finally:
+        progress.close()
+
+    print("backfilled {files} files ({failed_files} failed), {points} points, {megabytes:.1f} MiB "
+          "in {elapsed_s:.1f}s: {points_per_s:.0f} points/s, {files_per_s:.1f} files/s".format(**stats))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+import logging
+import threading
+import time
+
+from pytimeparse import parse as parse_time
+
+logger = logging.getLogger(__name__)
+
+
+class EnergyBudget:
+    """Energy account deciding whether a metering may run.
+
+    The budget is a bucket of `capacity_wh`, drained by the estimated energy
+    of every metering run and refilled with `recharge_w` unless the charging
+    indicator reports not charging; if the charging state is unknown, the
+    budget only limits the average power to `recharge_w`. The energy of a metering is its power draw
+    times its duration, which is learned from previous runs.
+
+    While charging, all meterings run. Otherwise a metering is deferred if
+    the budget cannot pay for it; expensive meterings are deferred already if
+    they would use up the `reserve` kept for cheap ones. Deferring firings
+    effectively scales the intervals of expensive meterings with the budget.
+    """
+
+    def __init__(self, charging=None, capacity_wh: float = 10, recharge_w: float = 5,
+                 default_power_w: float = 1, lift_power_w: float = 10, reserve: float = 0.3,
+                 expensive_wh: float = 0.05, check_interval: str = "5m", smoothing: float = 0.3):
+        """
+        Args:
+            charging (callable): returns whether the system is charging, None if unknown
+            capacity_wh (float): size of the budget
+            recharge_w (float): budget refill rate while charging or if the state is unknown
+            default_power_w (float): power draw of meterings without heights
+            lift_power_w (float): power draw of meterings with heights
+            reserve (float): fraction of the budget kept for cheap meterings
+            expensive_wh (float): energy above which a metering is expensive
+            check_interval (str): interval between charging state checks
+            smoothing (float): weight of the latest run in the learned durations
+        """
+
+        self.charging = charging
+        self.capacity_wh = capacity_wh
+        self.recharge_w = recharge_w
+        self.default_power_w = default_power_w
+        self.lift_power_w = lift_power_w
+        self.reserve = reserve
+        self.expensive_wh = expensive_wh
+        self.check_interval_s = parse_time(check_interval)
+        self.smoothing = smoothing
+
+        self.level_wh = capacity_wh
+        self.consumed_wh = 0.0
+        self.is_charging = None
+
+        self._power_w = {}
+        self._duration_s = {}
+        self._runs = {}
+        self._deferred = {}
+
+        self._updated_ts = time.time()
+        self._checked_ts = None
+        self._lock = threading.Lock()
+
+        logger.info("energy budget of {}Wh, recharging with {}W".format(
+            capacity_wh, recharge_w))
+
+    def register(self, name: str, heights: bool = False, power_w: float = None):
+        """Register a metering and its power draw.
+
+        Args:
+            name (str): name of the metering
+            heights (bool): whether the metering moves the lift
+            power_w (float): power draw, defaults by the use of the lift
+        """
+
+        if power_w is None:
+            power_w = self.lift_power_w if heights else self.default_power_w
+
+        self._power_w[name] = power_w
+        self._runs[name] = 0
+        self._deferred[name] = 0
+
+    def _check_charging(self, now: float):
+        if self.charging is None:
+            return
+        if self._checked_ts is not None and now - self._checked_ts < self.check_interval_s:
+            return
+
+        self._checked_ts = now
+        try:
+            charging = self.charging()
+            self.is_charging = None if charging is None else bool(charging)
+        except Exception as e:
+            logger.warn("charging state is not available: {}".format(e))
+            self.is_charging = None
+
+    def _update(self):
+        now = time.time()
+        elapsed_s = now - self._updated_ts
+        self._updated_ts = now
+
+        # the charging state is assumed for the whole time since the last update,
+        # an unknown state refills the budget to not starve meterings forever
+        if self.is_charging is not False:
+            self.level_wh = min(self.capacity_wh,
+                                self.level_wh + self.recharge_w * elapsed_s / 3600)
+
+        self._check_charging(now)
+
+    def estimate_wh(self, name: str) -> float:
+        """Estimated energy of a metering run, 0 until its duration is known."""
+
+        return self._power_w.get(name, self.default_power_w) * \
+            self._duration_s.get(name, 0) / 3600
+
+    def allow(self, name: str) -> bool:
+        """Decide whether a metering may run now."""
+
+        with self._lock:
+            self._update()
+            if self.is_charging:
+                return True
+
+            cost_wh = self.estimate_wh(name)
+            available_wh = self.level_wh
+            if cost_wh > self.expensive_wh:
+                available_wh -= self.reserve * self.capacity_wh
+
+            if cost_wh <= available_wh:
+                return True
+
+            self._deferred[name] = self._deferred.get(name, 0) + 1
+
+        logger.info("metering '{}' deferred, needs {:.3f}Wh of {:.3f}Wh left".format(
+            name, cost_wh, self.level_wh))
+        return False
+
+    def consume(self, name: str, duration_s: float):
+        """Account a finished metering run and learn its duration."""
+
+        with self._lock:
+            self._update()
+
+            if name in self._duration_s:
+                self._duration_s[name] += self.smoothing * \
+                    (duration_s - self._duration_s[name])
+            else:
+                self._duration_s[name] = duration_s
+
+            used_wh = self._power_w.get(
+                name, self.default_power_w) * duration_s / 3600
+            self.level_wh = max(0.0, self.level_wh - used_wh)
+            self.consumed_wh += used_wh
+            self._runs[name] = self._runs.get(name, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            self._update()
+            return {
+                "level_wh": self.level_wh,
+                "consumed_wh": self.consumed_wh,
+                "charging": self.is_charging,
+                "meterings": {name: {
+                    "power_w": power_w,
+                    "duration_s": self._duration_s.get(name),
+                    "estimate_wh": self.estimate_wh(name),
+                    "runs": self._runs.get(name, 0),
+                    "deferred": self._deferred.get(name, 0),
+                } for name, power_w in self._power_w.items()},
+            }
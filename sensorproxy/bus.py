@@ -0,0 +1,471 @@
+"""In-process bus distributing the readings of sensors to their outputs.
+
+Sensors publish a `Reading` per successful read, subscribers (CSV files,
+InfluxDB, ingest, ring buffers or streams) consume them. Subscribers with a
+queue are run in a thread of their own, so slow outputs do not delay the
+measurement; their policy decides what happens if the queue is full.
+"""
+
+import collections
+import logging
+import threading
+import time
+
+from abc import abstractmethod
+
+logger = logging.getLogger(__name__)
+
+Reading = collections.namedtuple(
+    "Reading", ["sensor", "ts", "reading", "row", "height_m", "options"])
+Reading.__doc__ = """A reading of a sensor.
+
+Args:
+    sensor (Sensor): the recorded sensor
+    ts (str): time of the reading
+    reading ([object]): values of the reading, matching the sensor header
+    row ([object]): row as written to the CSV file
+    height_m (float): height of the reading, if recorded at a height
+    options (dict): options of the metering, e.g. influx_publish
+"""
+
+
+class Subscriber:
+    """Consumer of readings of the bus.
+
+    Subscribers without a queue handle readings in the thread of the
+    publishing sensor. Otherwise readings are queued and handled in batches
+    by a consumer thread; if the queue is full, the policy applies:
+
+    - block: the sensor waits for the subscriber, at most `block_timeout`
+    - drop_oldest: the oldest queued reading is dropped
+    - drop_newest: the new reading is dropped
+
+    Failures of required subscribers without a queue are raised to the
+    publishing sensor, so the read counts as failed.
+    """
+
+    POLICIES = ["block", "drop_oldest", "drop_newest"]
+
+    def __init__(self, name: str, queue_size: int = 0, policy: str = "drop_oldest",
+                 batch_size: int = 100, block_timeout: float = None, sensors: [str] = None,
+                 threaded: bool = True, required: bool = False, tick_interval: float = None):
+        """
+        Args:
+            name (str): name of the subscriber, used in logs and statistics
+            queue_size (int): queued readings, 0 handles readings immediately
+            policy (str): policy if the queue is full, one of block, drop_oldest, drop_newest
+            batch_size (int): maximum readings handled at once
+            block_timeout (float): seconds the block policy waits before dropping
+            sensors ([str]): names of sensors to receive readings of, None for all
+            threaded (bool): consume the queue in a thread of its own
+            required (bool): raise failures to the publisher, if there is no queue
+            tick_interval (float): seconds between calls of `tick` by the consumer thread
+        """
+
+        if policy not in Subscriber.POLICIES:
+            raise ValueError("policy '{}' is not in {}".format(
+                policy, Subscriber.POLICIES))
+
+        self.name = name
+        self.queue_size = queue_size
+        self.policy = policy
+        self.batch_size = batch_size
+        self.block_timeout = block_timeout
+        self.sensors = set(sensors) if sensors is not None else None
+        self.required = required
+        self.tick_interval = tick_interval
+
+        self.received = 0
+        self.handled = 0
+        self.dropped = 0
+        self.failed = 0
+        self.max_queued = 0
+
+        self._queue = collections.deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+        self._thread = None
+        if queue_size and threaded:
+            self._thread = threading.Thread(target=self._consume, daemon=True)
+            self._thread.start()
+
+    def accepts(self, reading: Reading) -> bool:
+        return self.sensors is None or reading.sensor.name in self.sensors
+
+    @abstractmethod
+    def handle(self, reading: Reading):
+        """Handle a single reading, to be implemented by subscribers."""
+
+        pass
+
+    def handle_batch(self, readings: [Reading]):
+        """Handle queued readings, implemented by subscribers benefiting from batches."""
+
+        for reading in readings:
+            self.handle(reading)
+
+    def tick(self):
+        """Called every `tick_interval` by the consumer thread, e.g. to expire held back readings."""
+
+        pass
+
+    def flush(self):
+        """Handle readings held back by the subscriber, called on close."""
+
+        pass
+
+    def _call(self, hook):
+        try:
+            hook()
+        except Exception as e:
+            logger.error("Subscriber '{}' failed in {}: {}".format(
+                self.name, hook.__name__, e))
+
+    def _handle(self, readings: [Reading]):
+        try:
+            self.handle_batch(readings)
+            self.handled += len(readings)
+        except Exception as e:
+            self.failed += len(readings)
+            logger.error("Subscriber '{}' failed to handle {} readings: {}".format(
+                self.name, len(readings), e))
+            if self.required and not self.queue_size:
+                raise
+
+    def offer(self, reading: Reading):
+        """Pass a reading to the subscriber, applying the policy if its queue is full."""
+
+        self.offer_batch([reading])
+
+    def offer_batch(self, readings: [Reading]):
+        """Pass readings to the subscriber, subscribers without a queue handle them at once."""
+
+        self.received += len(readings)
+        if not self.queue_size:
+            return self._handle(readings)
+
+        for reading in readings:
+            self._enqueue(reading)
+
+    def _enqueue(self, reading: Reading):
+        with self._cond:
+            if len(self._queue) >= self.queue_size and self.policy == "block":
+                self._cond.wait_for(lambda: len(self._queue) < self.queue_size or self._closed,
+                                    timeout=self.block_timeout)
+
+            if len(self._queue) >= self.queue_size:
+                self.dropped += 1
+                if self.policy == "drop_newest":
+                    return
+                self._queue.popleft()
+
+            self._queue.append(reading)
+            self.max_queued = max(self.max_queued, len(self._queue))
+            self._cond.notify_all()
+
+    def _take(self, timeout: float = None) -> [Reading]:
+        """Take a batch of queued readings, waiting for the first at most `timeout`."""
+
+        with self._cond:
+            self._cond.wait_for(lambda: self._queue or self._closed, timeout)
+            batch = [self._queue.popleft() for _ in
+                     range(min(self.batch_size, len(self._queue)))]
+            # publishers blocked by a full queue may continue
+            self._cond.notify_all()
+            return batch
+
+    def _consume(self):
+        tick_ts = time.monotonic()
+
+        while True:
+            batch = self._take(self.tick_interval)
+            if batch:
+                self._handle(batch)
+
+            if self.tick_interval and time.monotonic() - tick_ts >= self.tick_interval:
+                tick_ts = time.monotonic()
+                self._call(self.tick)
+
+            if not batch and self._closed:
+                self._call(self.flush)
+                return
+
+    def close(self, timeout: float = None):
+        """Stop the subscriber after handling the queued readings."""
+
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+        if self._thread:
+            self._thread.join(timeout)
+        else:
+            self._call(self.flush)
+
+    def stats(self):
+        return {
+            "received": self.received,
+            "handled": self.handled,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "queued": len(self._queue),
+            "max_queued": self.max_queued,
+        }
+
+
+class CSVWriter(Subscriber):
+    """Appends readings to the CSV file of their sensor and indexes sensor files.
+
+    The CSV file is the primary record of a reading, so failures are raised
+    to the publishing sensor by default.
+    """
+
+    def __init__(self, name: str = "csv", required: bool = True, **kwargs):
+        Subscriber.__init__(self, name, required=required, **kwargs)
+
+    def handle(self, reading: Reading):
+        self.handle_batch([reading])
+
+    def handle_batch(self, readings: [Reading]):
+        rows = collections.OrderedDict()
+        for reading in readings:
+            rows.setdefault(reading.sensor, []).append(reading.row)
+
+        for sensor, sensor_rows in rows.items():
+            sensor._write_rows(sensor_rows)
+
+        for reading in readings:
+            self._catalog_add(reading)
+
+    @staticmethod
+    def _catalog_add(reading: Reading):
+        sensor = reading.sensor
+
+        # files of FileSensors are indexed with the height they were recorded at
+        if "File path" in sensor._header_sensor:
+            sensor_file_path = reading.reading[sensor._header_sensor.index(
+                "File path")]
+            if sensor_file_path:
+                sensor._catalog_add(sensor_file_path, reading.height_m)
+
+
+class InfluxWriter(Subscriber):
+    """Publishes readings of meterings with `influx_publish` to InfluxDB.
+
+    Queued readings of a sensor are written at once, readings of sensors
+    with an aggregation window are aggregated before. Windows are written
+    once they are over, even if no further reading arrives, and on close.
+    """
+
+    def __init__(self, influx, name: str = "influx", queue_size: int = 1000, tick_interval: float = 1,
+                 **kwargs):
+        """
+        Args:
+            influx (InfluxDBSensorClient): client to publish with
+        """
+
+        self.influx = influx
+        # sensors by aggregator with an open window
+        self._aggregators = {}
+        Subscriber.__init__(self, name, queue_size=queue_size,
+                            tick_interval=tick_interval, **kwargs)
+
+    def accepts(self, reading: Reading) -> bool:
+        return reading.options.get("influx_publish", False) and Subscriber.accepts(self, reading)
+
+    def handle_batch(self, readings: [Reading]):
+        rows = collections.OrderedDict()
+
+        for reading in readings:
+            sensor = reading.sensor
+            header = sensor.header
+            new_rows = [reading.row]
+
+            # the metering may override the aggregation window of the sensor
+            aggregate = reading.options.get("aggregate") or sensor.aggregate
+            if aggregate:
+                aggregator = sensor._aggregator(aggregate)
+                header = aggregator.header
+                new_rows = aggregator.add(reading.row)
+                self._aggregators[aggregator] = sensor
+
+            rows.setdefault((sensor, tuple(header)), []).extend(new_rows)
+
+        self._publish(rows)
+
+    def _expire(self, flush: bool):
+        rows = collections.OrderedDict()
+
+        for aggregator, sensor in list(self._aggregators.items()):
+            expired = aggregator.flush() if flush else aggregator.expire()
+            rows.setdefault((sensor, tuple(aggregator.header)), []).extend(expired)
+            if aggregator.idle:
+                del self._aggregators[aggregator]
+
+        self._publish(rows)
+
+    def tick(self):
+        self._expire(flush=False)
+
+    def flush(self):
+        self._expire(flush=True)
+
+    def _publish(self, rows: {(object, tuple): [[]]}):
+        for (sensor, header), sensor_rows in rows.items():
+            if not sensor_rows:
+                continue
+
+            try:
+                self.influx.publish_rows(
+                    header=list(header),
+                    rows=sensor_rows,
+                    _class=sensor.__class__.__name__,
+                    _hostname=sensor.proxy.hostname,
+                    _id=sensor.proxy.id,
+                    _sensor=sensor.name,
+                )
+            except Exception as e:
+                logger.warn("Publishing on infux failed: {}".format(
+                    e), {"influx_publish": False})
+
+
+class IngestWriter(Subscriber):
+    """Passes readings to the ingest sender, unless disabled by `ingest_publish`."""
+
+    def __init__(self, ingest, name: str = "ingest", **kwargs):
+        """
+        Args:
+            ingest (IngestSender): sender buffering the readings
+        """
+
+        self.ingest = ingest
+        Subscriber.__init__(self, name, **kwargs)
+
+    def accepts(self, reading: Reading) -> bool:
+        return reading.options.get("ingest_publish", True) and Subscriber.accepts(self, reading)
+
+    def handle(self, reading: Reading):
+        sensor = reading.sensor
+        self.ingest.send(sensor.header, [reading.row], sensor.__class__.__name__,
+                         sensor.proxy.hostname, sensor.proxy.id, sensor.name)
+
+
+class RingBuffer(Subscriber):
+    """Keeps the latest readings of each sensor, e.g. for a live view."""
+
+    def __init__(self, name: str = "ring", size: int = 100, **kwargs):
+        """
+        Args:
+            size (int): readings kept per sensor
+        """
+
+        self.size = size
+        self._readings = {}
+        self._lock = threading.Lock()
+        Subscriber.__init__(self, name, **kwargs)
+
+    def handle(self, reading: Reading):
+        with self._lock:
+            if reading.sensor.name not in self._readings:
+                self._readings[reading.sensor.name] = collections.deque(
+                    maxlen=self.size)
+            self._readings[reading.sensor.name].append(reading)
+
+    def latest(self, sensor: str, count: int = None) -> [Reading]:
+        """Latest readings of a sensor, oldest first."""
+
+        with self._lock:
+            readings = list(self._readings.get(sensor, []))
+        return readings[-count:] if count else readings
+
+
+class ReadingBus:
+    """Distributes published readings to the subscribers."""
+
+    def __init__(self):
+        self.subscribers = []
+        self.published = 0
+        self._lock = threading.Lock()
+
+    def subscribe(self, subscriber: Subscriber) -> Subscriber:
+        with self._lock:
+            self.subscribers = self.subscribers + [subscriber]
+        logger.debug("subscriber '{}' added".format(subscriber.name))
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self._lock:
+            self.subscribers = [s for s in self.subscribers
+                                if s is not subscriber]
+
+    def publish(self, reading: Reading):
+        self.publish_batch([reading])
+
+    def publish_batch(self, readings: [Reading]):
+        """Publish readings, subscribers without a queue handle them at once.
+
+        Raises:
+            Exception: the first failure of a required subscriber, after all
+                subscribers were offered the readings
+        """
+
+        self.published += len(readings)
+        error = None
+
+        # subscribers are replaced on change, iterating needs no lock
+        for subscriber in self.subscribers:
+            accepted = [r for r in readings if subscriber.accepts(r)]
+            if not accepted:
+                continue
+
+            try:
+                subscriber.offer_batch(accepted)
+            except Exception as e:
+                error = error or e
+
+        if error:
+            raise error
+
+    def stream(self, sensors: [str] = None, queue_size: int = 1000, policy: str = "drop_oldest",
+               timeout: float = None):
+        """Iterate over readings published from now on.
+
+        Args:
+            sensors ([str]): names of sensors to receive readings of, None for all
+            queue_size (int): readings queued while the consumer is busy
+            policy (str): policy if the queue is full
+            timeout (float): stop after no reading was published for this time
+
+        Yields:
+            Reading: published readings
+        """
+
+        subscriber = self.subscribe(Subscriber(
+            "stream", queue_size=queue_size, policy=policy, sensors=sensors, threaded=False))
+
+        try:
+            while True:
+                batch = subscriber._take(timeout)
+                if not batch:
+                    return
+                for reading in batch:
+                    subscriber.handled += 1
+                    yield reading
+        finally:
+            self.unsubscribe(subscriber)
+            subscriber.close()
+
+    def close(self, timeout: float = None):
+        """Stop all subscribers, handling the queued readings before."""
+
+        deadline_ts = time.time() + timeout if timeout is not None else None
+        for subscriber in self.subscribers:
+            remaining = max(0, deadline_ts - time.time()) if deadline_ts else None
+            subscriber.close(remaining)
+
+    def stats(self):
+        return {
+            "published": self.published,
+            "subscribers": {s.name: s.stats() for s in self.subscribers},
+        }
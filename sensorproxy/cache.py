@@ -0,0 +1,156 @@
+import json
+import logging
+import threading
+import time
+import urllib.error
+import urllib.request
+
+logger = logging.getLogger(__name__)
+
+
+class NotModified(Exception):
+    """Exception: the remote resource did not change since the last fetch."""
+    pass
+
+
+class TTLCache:
+    """Caches the result of a fetch function for a time to live.
+
+    Concurrent callers share a single fetch. If fetching fails, the last
+    value is served as stale until `max_stale_s` is exceeded.
+    """
+
+    def __init__(self, ttl_s: float, max_stale_s: float = None):
+        """
+        Args:
+            ttl_s (float): seconds a fetched value is served without refetching
+            max_stale_s (float): seconds a value is served if fetching fails,
+                forever if None
+        """
+
+        self.ttl_s = ttl_s
+        self.max_stale_s = max_stale_s
+
+        self.value = None
+        self.fetched_ts = None
+
+        self.hits = 0
+        self.fetches = 0
+        self.failures = 0
+
+        self._cond = threading.Condition()
+        self._fetching = False
+        self._error = None
+
+    def get(self, fetch):
+        """Get the cached value, fetching it if expired.
+
+        Args:
+            fetch (callable): called with the previous value, returns the new
+                value or raises NotModified
+
+        Raises:
+            Exception: the exception of fetch, if there is no value to serve
+
+        Returns:
+            (object, bool): the value and whether it is stale
+        """
+
+        with self._cond:
+            while True:
+                if self._fresh():
+                    self.hits += 1
+                    return self.value, False
+                if not self._fetching:
+                    break
+
+                # another thread is fetching already, wait for its result
+                self._cond.wait_for(lambda: not self._fetching)
+                if self._error is not None and not self._fresh():
+                    return self._stale(self._error)
+                # the fetched value may be expired already, e.g. with a ttl of 0
+
+            self._fetching = True
+            previous = self.value
+
+        try:
+            self.fetches += 1
+            value = fetch(previous)
+            error = None
+        except NotModified:
+            value = previous
+            error = None
+        except Exception as e:
+            error = e
+
+        with self._cond:
+            self._fetching = False
+            self._error = error
+            if error is None:
+                self.value = value
+                self.fetched_ts = time.time()
+            self._cond.notify_all()
+
+            if error is None:
+                return self.value, False
+            return self._stale(error)
+
+    def _fresh(self):
+        return self.fetched_ts is not None and \
+            self.fetched_ts + self.ttl_s > time.time()
+
+    def _stale(self, error):
+        self.failures += 1
+        if self.fetched_ts is None:
+            raise error
+
+        age_s = time.time() - self.fetched_ts
+        if self.max_stale_s is not None and age_s > self.max_stale_s:
+            raise error
+
+        logger.warn("fetching failed, serving {}s old value: {}".format(
+            round(age_s), error))
+        return self.value, True
+
+
+class HTTPJSONResource:
+    """Fetches a JSON document, using conditional requests if supported by the server."""
+
+    def __init__(self, uri: str, timeout_s: float = 10, headers: dict = {}):
+        """
+        Args:
+            uri (str): address of the JSON document
+            timeout_s (float): timeout of a request
+            headers (dict): additional request headers
+        """
+
+        self.uri = uri
+        self.timeout_s = timeout_s
+        self.headers = headers
+
+        self._etag = None
+        self._last_modified = None
+
+    def __call__(self, previous=None):
+        request = urllib.request.Request(self.uri)
+        for key, value in self.headers.items():
+            request.add_header(key, value)
+
+        if previous is not None:
+            if self._etag:
+                request.add_header("If-None-Match", self._etag)
+            if self._last_modified:
+                request.add_header("If-Modified-Since", self._last_modified)
+
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout_s) as response:
+                body = response.read().decode()
+                self._etag = response.headers.get("ETag")
+                self._last_modified = response.headers.get("Last-Modified")
+        except urllib.error.HTTPError as e:
+            if e.code == 304 and previous is not None:
+                logger.debug("{} not modified".format(self.uri))
+                raise NotModified()
+            raise
+
+        return json.loads(body)
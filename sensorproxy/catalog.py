@@ -0,0 +1,250 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from pytimeparse import parse as parse_time
+
+logger = logging.getLogger(__name__)
+
+
+class Catalog:
+    """SQLite index of all recorded files.
+
+    Files are indexed by host, id, sensor class, sensor name, time range,
+    height and size, together with their upload and ingest state. Files are
+    added once they are created, appended rows only extend their time range
+    and size in memory, which is written in batches every `flush_interval`
+    and before queries. So queries and storage accounting do not need to scan
+    directories, while recording does not wait for the database.
+    """
+
+    COLUMNS = ["path", "hostname", "id", "class", "sensor", "start_ts",
+               "end_ts", "height", "size", "uploaded", "ingested"]
+
+    def __init__(self, path: str, flush_interval: str = "1m"):
+        """
+        Args:
+            path (str): path of the SQLite database
+            flush_interval (str): maximum delay of time ranges and sizes of appended files
+        """
+
+        self.path = path
+        self.flush_interval_s = parse_time(flush_interval)
+        self._lock = threading.Lock()
+
+        # latest write by path of appended files, not yet written to the database
+        self._pending = {}
+        self._flushed_ts = time.time()
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        # a crash may lose the latest transactions, but never corrupts the database
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        with self._db:
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS files (
+                    path TEXT PRIMARY KEY,
+                    hostname TEXT,
+                    id TEXT,
+                    class TEXT,
+                    sensor TEXT,
+                    start_ts REAL,
+                    end_ts REAL,
+                    height REAL,
+                    size INTEGER,
+                    uploaded INTEGER DEFAULT 0,
+                    ingested INTEGER DEFAULT 0
+                )""")
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS files_sensor ON files (sensor, start_ts)")
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS files_class ON files (class, start_ts)")
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS files_state ON files (uploaded, ingested)")
+
+        logger.info("using file catalog at '{}'".format(path))
+
+    def add(self, path: str, hostname: str, _id: str, _class: str, _sensor: str,
+            ts: float = None, height: float = None, size: int = None, ingested: bool = False):
+        """Add a file or extend its time range, if it is already indexed.
+
+        Args:
+            path (str): path of the file
+            ts (float): time of the written data, defaults to now
+            height (float): height the data was recorded at
+            size (int): size of the file, read from disk if None
+        """
+
+        if ts is None:
+            ts = time.time()
+        if size is None:
+            size = os.path.getsize(path)
+
+        with self._lock, self._db:
+            self._db.execute("""
+                INSERT INTO files (path, hostname, id, class, sensor, start_ts, end_ts, height, size, ingested)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (path) DO UPDATE SET
+                    start_ts = MIN(start_ts, excluded.start_ts),
+                    end_ts = MAX(end_ts, excluded.end_ts),
+                    size = excluded.size
+                """, (path, hostname, _id, _class, _sensor, ts, ts, height, size, int(ingested)))
+
+    def touch(self, path: str, ts: float = None):
+        """Extend the time range and size of an indexed file, after rows were appended.
+
+        Args:
+            path (str): path of the file
+            ts (float): time of the written data, defaults to now
+        """
+
+        if ts is None:
+            ts = time.time()
+
+        with self._lock:
+            self._pending[path] = max(ts, self._pending.get(path, ts))
+            if time.time() - self._flushed_ts >= self.flush_interval_s:
+                self._flush()
+
+    def _flush(self):
+        updates = []
+        for path, ts in self._pending.items():
+            try:
+                updates.append((ts, os.path.getsize(path), path))
+            except FileNotFoundError:
+                pass
+
+        with self._db:
+            self._db.executemany("""
+                UPDATE files SET end_ts = MAX(end_ts, ?), size = ? WHERE path = ?
+                """, updates)
+
+        self._pending = {}
+        self._flushed_ts = time.time()
+
+    def flush(self):
+        """Write the pending time ranges and sizes of appended files."""
+
+        with self._lock:
+            self._flush()
+
+    def move(self, path: str, new_path: str):
+        """Update the path of a moved file."""
+
+        with self._lock, self._db:
+            self._pending.pop(path, None)
+            self._db.execute("DELETE FROM files WHERE path = ?", (new_path,))
+            self._db.execute(
+                "UPDATE files SET path = ? WHERE path = ?", (new_path, path))
+
+    def remove(self, path: str):
+        with self._lock, self._db:
+            self._pending.pop(path, None)
+            self._db.execute("DELETE FROM files WHERE path = ?", (path,))
+
+    def mark(self, paths: [str], uploaded: bool = None, ingested: bool = None):
+        """Set the upload and / or ingest state of files."""
+
+        with self._lock, self._db:
+            for column, value in [("uploaded", uploaded), ("ingested", ingested)]:
+                if value is None:
+                    continue
+                self._db.executemany(
+                    "UPDATE files SET {} = ? WHERE path = ?".format(column),
+                    [(int(value), path) for path in paths])
+
+    def mark_uploaded_missing(self, prefix: str):
+        """Mark files below a path as uploaded, if they were removed by the upload.
+
+        Returns:
+            int: number of files marked
+        """
+
+        paths = [row["path"] for row in self.query(path_prefix=prefix, uploaded=False)
+                 if not os.path.exists(row["path"])]
+        self.mark(paths, uploaded=True)
+
+        return len(paths)
+
+    def query(self, hostname: str = None, _class: str = None, _sensor: str = None,
+              start_ts: float = None, end_ts: float = None,
+              min_height: float = None, max_height: float = None,
+              uploaded: bool = None, ingested: bool = None, path_prefix: str = None):
+        """Query indexed files, all conditions are optional.
+
+        Args:
+            start_ts (float): files containing data after this time
+            end_ts (float): files containing data before this time
+
+        Returns:
+            [dict]: the matching files, oldest first
+        """
+
+        conditions = []
+        args = []
+        for condition, arg in [
+                ("hostname = ?", hostname),
+                ("class = ?", _class),
+                ("sensor = ?", _sensor),
+                ("end_ts >= ?", start_ts),
+                ("start_ts <= ?", end_ts),
+                ("height >= ?", min_height),
+                ("height <= ?", max_height),
+                ("uploaded = ?", None if uploaded is None else int(uploaded)),
+                ("ingested = ?", None if ingested is None else int(ingested)),
+                ("instr(path, ?) = 1", path_prefix)]:
+            if arg is not None:
+                conditions.append(condition)
+                args.append(arg)
+
+        sql = "SELECT * FROM files"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY start_ts"
+
+        with self._lock:
+            self._flush()
+            return [dict(row) for row in self._db.execute(sql, args)]
+
+    def storage(self):
+        """Accumulated file sizes, by class and upload state.
+
+        Returns:
+            {str: {str: int}}: e.g. {"PiCamera": {"files": 3, "size": 42, "pending": 21}}
+        """
+
+        with self._lock:
+            self._flush()
+            rows = self._db.execute("""
+                SELECT class, COUNT(*) AS files, SUM(size) AS size,
+                    SUM(CASE WHEN uploaded THEN 0 ELSE size END) AS pending
+                FROM files GROUP BY class""")
+            return {row["class"]: {"files": row["files"], "size": row["size"], "pending": row["pending"]}
+                    for row in rows}
+
+    def scan(self, directory: str, hostname: str):
+        """Index existing files of a host directory, e.g. recorded before the catalog existed.
+
+        Returns:
+            int: number of indexed files
+        """
+
+        from sensorproxy.sensors.base import Sensor
+
+        count = 0
+        for dirpath, _, file_names in os.walk(directory):
+            for file_name in file_names:
+                path = os.path.join(dirpath, file_name)
+                metadata = Sensor._parse_file_path(path)
+                if metadata is None:
+                    continue
+
+                self.add(path, hostname, metadata["_id"], metadata["_class"], metadata["_sensor"],
+                         ts=metadata["ts"], size=os.path.getsize(path))
+                count += 1
+
+        logger.info("indexed {} files in '{}'".format(count, directory))
+        return count
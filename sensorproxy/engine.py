@@ -0,0 +1,77 @@
+import asyncio
+import logging
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+from sensorproxy.sensors.base import SensorNotAvailableException
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncEngine:
+    """Runs the sensor reads of all meterings on a single event loop.
+
+    Sensors implementing `async def _read` are awaited on the loop, blocking
+    reads are run in a bounded executor. Meterings themselves (including lift
+    movements) run in a separate small pool and hand their sensors over to
+    the loop.
+    """
+
+    def __init__(self, proxy, max_workers: int = 4, metering_workers: int = 2):
+        """
+        Args:
+            proxy (SensorProxy): the proxy owning the sensors
+            max_workers (int): threads for blocking sensor reads
+            metering_workers (int): meterings running at the same time
+        """
+
+        self.proxy = proxy
+        self.executor = ThreadPoolExecutor(
+            max_workers, thread_name_prefix="sensor")
+        self.metering_executor = ThreadPoolExecutor(
+            metering_workers, thread_name_prefix="metering")
+
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_loop, daemon=True)
+        self._thread.start()
+
+        logger.info("async engine started ({} read workers, {} metering workers)".format(
+            max_workers, metering_workers))
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, func, *args):
+        """Run a metering job in the metering pool.
+
+        Returns:
+            concurrent.futures.Future: finished with the job
+        """
+
+        return self.metering_executor.submit(func, *args)
+
+    def record_sensors(self, sensors: {str: dict}, height_m: float):
+        """Record sensors on the loop, blocking until all are finished."""
+
+        future = asyncio.run_coroutine_threadsafe(
+            self._record_sensors(sensors, height_m), self.loop)
+        return future.result()
+
+    async def _record_sensors(self, sensors: {str: dict}, height_m: float):
+        await asyncio.gather(*[
+            self._record_sensor(self.proxy.sensors[name], params, height_m)
+            for name, params in sensors.items()])
+
+    async def _record_sensor(self, sensor, params: dict, height_m: float):
+        try:
+            await sensor.arecord(self.executor, height_m=height_m, **params)
+        except KeyError:
+            logger.error("Sensor '{}' is not defined in config: {}".format(
+                sensor.name, self.proxy.config_path))
+        except SensorNotAvailableException as e:
+            logger.error(
+                "Sensor '{}' is not available: {}".format(sensor.name, e))
+        except Exception as e:
+            logger.error("Sensor '{}' failed: {}".format(sensor.name, e))
@@ -0,0 +1,157 @@
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class I2CBus:
+    """Shared access to an I2C bus, optionally caching the last written register values.
+
+    Access is serialized across all sensors using the bus and the issued
+    transactions are counted. For devices with caching enabled, writes of
+    values already present in a register are skipped; the cache is only
+    valid as long as the device keeps its registers, e.g. is not reset or
+    powered off, so caching is opt-in.
+    """
+
+    def __init__(self, bus_id: int, smbus_factory=None):
+        """
+        Args:
+            bus_id (int): number of the I2C bus, e.g. 1 for /dev/i2c-1
+            smbus_factory (callable): creates the SMBus, defaults to smbus.SMBus
+        """
+
+        if smbus_factory is None:
+            import smbus
+            smbus_factory = smbus.SMBus
+
+        self.bus_id = bus_id
+        self.lock = threading.RLock()
+
+        self._smbus = smbus_factory(bus_id)
+        self._registers = {}
+        self._cached = set()
+
+        self.transactions = 0
+        self.skipped = 0
+
+    def __repr__(self):
+        return "I2CBus {}".format(self.bus_id)
+
+    def enable_cache(self, address: int):
+        """Skip writes of values already written to the registers of a device."""
+
+        with self.lock:
+            self._cached.add(address)
+
+    def _known(self, address: int, register: int, value: int) -> bool:
+        return address in self._cached and self._registers.get((address, register)) == value
+
+    def invalidate(self, address: int = None):
+        """Forget cached register values, e.g. after a device failed.
+
+        Args:
+            address (int): device address, all devices if None
+        """
+
+        with self.lock:
+            if address is None:
+                self._registers.clear()
+            else:
+                self._registers = {k: v for k, v in self._registers.items()
+                                   if k[0] != address}
+
+    def write_byte_data(self, address: int, register: int, value: int, force: bool = False):
+        """Write a register, unless it already contains the value.
+
+        Args:
+            address (int): device address
+            register (int): register to be written
+            value (int): value to be written
+            force (bool): write even if the value is cached
+        """
+
+        with self.lock:
+            if not force and self._known(address, register, value):
+                self.skipped += 1
+                return
+
+            try:
+                self._smbus.write_byte_data(address, register, value)
+            except OSError:
+                self.invalidate(address)
+                raise
+            finally:
+                self.transactions += 1
+
+            self._registers[(address, register)] = value
+
+    def write_registers(self, address: int, values: {int: int}, block: bool = False):
+        """Write multiple registers, skipping those already containing the value.
+
+        Args:
+            address (int): device address
+            values (dict): register to value mapping
+            block (bool): write consecutive registers in one block transaction,
+                requires the device to auto-increment its register pointer
+        """
+
+        with self.lock:
+            changed = sorted((register, value) for register, value in values.items()
+                             if not self._known(address, register, value))
+            self.skipped += len(values) - len(changed)
+
+            if not block:
+                for register, value in changed:
+                    self.write_byte_data(address, register, value, force=True)
+                return
+
+            # group changed registers into runs of consecutive addresses
+            runs = []
+            for register, value in changed:
+                if runs and runs[-1][0] + len(runs[-1][1]) == register:
+                    runs[-1][1].append(value)
+                else:
+                    runs.append((register, [value]))
+
+            for start, run in runs:
+                if len(run) == 1:
+                    self.write_byte_data(address, start, run[0], force=True)
+                    continue
+
+                try:
+                    self._smbus.write_i2c_block_data(address, start, run)
+                except OSError:
+                    self.invalidate(address)
+                    raise
+                finally:
+                    self.transactions += 1
+
+                for offset, value in enumerate(run):
+                    self._registers[(address, start + offset)] = value
+
+    @property
+    def stats(self):
+        """Counters of issued and skipped transactions."""
+
+        return {"transactions": self.transactions, "skipped": self.skipped}
+
+
+_buses = {}
+_buses_lock = threading.Lock()
+
+
+def get_bus(bus_id: int, smbus_factory=None) -> I2CBus:
+    """Get the shared I2CBus instance for a bus id, creating it on first use.
+
+    Args:
+        bus_id (int): number of the I2C bus
+        smbus_factory (callable): creates the SMBus, e.g. a fake for testing
+    """
+
+    with _buses_lock:
+        if bus_id not in _buses:
+            logger.debug("opening i2c bus {}".format(bus_id))
+            _buses[bus_id] = I2CBus(bus_id, smbus_factory)
+
+        return _buses[bus_id]
@@ -1,8 +1,14 @@
+import calendar
 import csv
 import logging
-
+import threading
+import time
 
 from influxdb import InfluxDBClient
+from influxdb.exceptions import InfluxDBClientError, InfluxDBServerError
+from pytimeparse import parse as parse_time
+
+from sensorproxy.spool import InfluxSpool, SpoolReplayer
 
 logger = logging.getLogger(__name__)
 
@@ -11,24 +17,153 @@ class CSVFormatException(Exception):
     pass
 
 
-def __bool(string):
-    if string.lower() in ["true", "yes"]:
-        return True
-    if string.lower() in ["false", "no"]:
-        return False
-    raise ValueError("'{}' cannot be casted to boolean.")
+_BOOLS = {"true": True, "yes": True, "false": False, "no": False}
+
+# column types, ordered from narrow to wide
+_TYPES = [bool, int, float, str]
+
+# widest type seen per measurement and column, to avoid field type conflicts
+_schemas = {}
+_schemas_lock = threading.Lock()
+
+
+def _cast_values(values: [], _type: type):
+    """Cast all values of a column, raises ValueError if a value does not fit."""
+
+    if _type is bool:
+        return [v if isinstance(v, bool) else _BOOLS[v.lower()] for v in values]
+    if _type is str:
+        return list(map(str, values))
+    return list(map(_type, values))
+
+
+def _infer_column(values: [], minimum: type = bool):
+    """Infer the narrowest type of a column and cast it in bulk.
+
+    Whole columns are casted at once, so a failing cast costs one exception
+    per column instead of one per cell. Empty values become None.
+
+    Args:
+        values ([]): values of the column, strings or typed values
+        minimum (type): narrowest type to be used, e.g. from a known schema
+
+    Returns:
+        (type, []): the type and the casted values
+    """
+
+    present = [v for v in values if v is not None and v != ""]
+
+    # typed values are only widened, e.g. int to float, so int() never truncates a float
+    widest = max((_TYPES.index(type(v)) if type(v) in _TYPES else 3
+                  for v in present if not isinstance(v, str)), default=0)
+
+    if any(isinstance(v, str) for v in present):
+        # strings of numbers are parsed as numbers, not as booleans
+        candidates = [int, float, bool, str]
+    else:
+        candidates = _TYPES
+
+    candidates = [t for t in candidates
+                  if _TYPES.index(t) >= max(widest, _TYPES.index(minimum))]
+
+    for _type in candidates:
+        try:
+            casted = iter(_cast_values(present, _type))
+        except (ValueError, KeyError, AttributeError, TypeError):
+            continue
+
+        return _type, [None if v is None or v == "" else next(casted)
+                       for v in values]
+
+    return str, [None if v is None or v == "" else str(v) for v in values]
+
+
+def _register_schema(measurement: str, name: str, _type: type) -> bool:
+    """Merge an inferred column type into the registered schema of the measurement.
+
+    Returns:
+        bool: whether the column was added or widened
+    """
+
+    with _schemas_lock:
+        registered = _schemas.setdefault(measurement, {})
+        known = registered.get(name)
+        if known is not None and _TYPES.index(_type) <= _TYPES.index(known):
+            return False
+
+        registered[name] = _type
+
+    if known is None:
+        logger.info("Field '{}' of {} is {}".format(
+            name, measurement, _type.__name__))
+    else:
+        logger.warn("Field '{}' of {} widened from {} to {}".format(
+            name, measurement, known.__name__, _type.__name__))
+    return True
+
+
+def get_schema(measurement: str):
+    """Column types used for a measurement so far."""
+
+    with _schemas_lock:
+        return {name: _type.__name__ for name, _type in _schemas.get(measurement, {}).items()}
+
+
+def merge_schema(measurement: str, schema: {str: type} = {}) -> {str: type}:
+    """Merge column types, e.g. inferred in another process, into the schema of a measurement.
+
+    Returns:
+        {str: type}: the merged schema
+    """
+
+    for name, _type in schema.items():
+        _register_schema(measurement, name, _type)
+
+    with _schemas_lock:
+        return dict(_schemas.get(measurement, {}))
+
+
+def widen(value, _type: type):
+    """Cast a value to a wider column type, e.g. int to float; other values are kept."""
+
+    if _type is not None and _TYPES.index(_type) > _TYPES.index(type(value)):
+        return _type(value)
+    return value
+
+
+# factors of the precisions to seconds and their names in the influx api
+_TIME_FACTORS = {"s": 1, "ms": 10**3, "us": 10**6, "ns": 10**9}
+INFLUX_PRECISIONS = {"s": "s", "ms": "ms", "us": "u", "ns": "n"}
 
 
-def __autocast(string):
-    if not isinstance(string, str):
-        return string
+def _parse_times(values: [str], precision: str):
+    """Convert formatted timestamps to integers in the given precision.
 
-    for cast in (__bool, int, float):
+    The seconds are parsed once per distinct second, the fraction is scaled
+    by integer arithmetic. Values in other formats are kept for the client
+    to parse.
+    """
+
+    factor = _TIME_FACTORS[precision]
+    seconds_cache = {}
+
+    times = []
+    for value in values:
+        seconds, _, fraction = str(value).partition(".")
         try:
-            return cast(string)
+            epoch = seconds_cache.get(seconds)
+            if epoch is None:
+                epoch = calendar.timegm(
+                    time.strptime(seconds, "%Y-%m-%dT%H%M%S"))
+                seconds_cache[seconds] = epoch
+            fraction_ns = int(fraction.ljust(9, "0")[:9]) if fraction else 0
         except ValueError:
-            pass
-    return string
+            times.append(value)
+            continue
+
+        times.append(epoch * factor + fraction_ns * factor // 10**9)
+
+    return times
 
 
 def _influx_seperate_header(header: [], tag_prefix: str):
@@ -49,35 +184,54 @@ def _influx_seperate_header(header: [], tag_prefix: str):
     return val_cols, tag_cols
 
 
-def _influx_construct_dict(measurement: str, row: [], val_cols: [(int, str)], tag_cols: [(int, str)]):
-    body = {}
-    body["measurement"] = measurement
-    body["time"] = row[0]
+def _influx_construct_dicts(measurement: str, rows: [[]], val_cols: [(int, str)], tag_cols: [(int, str)],
+                            time_precision: str = "s"):
+    """Construct influx points of rows, converting whole columns according to the inferred schema."""
+
+    if not rows:
+        return []
 
-    body["fields"] = {}
+    columns = list(zip(*rows))
+    times = _parse_times(columns[0], time_precision)
+
+    fields = []
     for num, name in val_cols:
-        body["fields"][name] = __autocast(row[num])
+        with _schemas_lock:
+            known = _schemas.get(measurement, {}).get(name, bool)
+
+        # columns are casted to at least the known type, avoiding type conflicts
+        _type, values = _infer_column(columns[num], known)
+        _register_schema(measurement, name, _type)
+        fields.append((name, values))
+    tags = [(name, columns[num]) for num, name in tag_cols]
 
-    body["tags"] = {}
-    for num, name in tag_cols:
-        body["tags"][name] = __autocast(row[num])
+    points = []
+    for i, ts in enumerate(times):
+        point_fields = {name: values[i] for name, values in fields
+                        if values[i] is not None}
 
-    return body
+        # influx rejects points without fields
+        if not point_fields:
+            continue
 
+        points.append({
+            "measurement": measurement,
+            "time": ts,
+            "fields": point_fields,
+            "tags": {name: values[i] for name, values in tags},
+        })
 
-def _influx_process(measurement: str, header: [], row: [], tag_prefix: str):
-    val_cols, tag_cols = _influx_seperate_header(header, tag_prefix=tag_prefix)
-    body = _influx_construct_dict(measurement, row, val_cols, tag_cols)
-    return body
+    return points
 
 
-def _influx_process_csv(csv_path: str, measurement: str, tag_prefix: str):
+def _influx_process_csv(csv_path: str, measurement: str, tag_prefix: str, time_precision: str = "s"):
     """
 
     :param csv_path: <str> full qualified path to the csv file
     :param measurement: <str> name of the measurement, e.g. class of sensor
     :param csv_delimiter: <str> the delimiter of the submitted file
     :param csv_tag_prefix: <str> prefix in csv header to identify tags
+    :param time_precision: <str> precision of the point times (s, ms, us, ns)
     :return:
     """
 
@@ -85,46 +239,130 @@ def _influx_process_csv(csv_path: str, measurement: str, tag_prefix: str):
         csv_reader = csv.reader(csv_file)
 
         # read and parse header: extract time, values and tags
+        header = next(csv_reader)
         val_cols, tag_cols = _influx_seperate_header(
-            next(csv_reader), tag_prefix=tag_prefix)
+            header, tag_prefix=tag_prefix)
 
-        # read and parse content based on the header definition
-        data = []
+        # rows not matching the header, e.g. from interrupted writes, are skipped
+        rows = [row for row in csv_reader if len(row) == len(header)]
 
-        for row in csv_reader:
-            body = _influx_construct_dict(measurement, row, val_cols, tag_cols)
-            data.append(body)
+        # read and parse content based on the header definition
+        data = _influx_construct_dicts(
+            measurement, rows, val_cols, tag_cols, time_precision)
 
         logger.debug("Read {} rows from '{}'".format(len(data), csv_path))
+        logger.debug("Schema of {}: {}".format(
+            csv_path, get_schema(measurement)))
 
     return data
 
 
+def csv_points(csv_path: str, measurement: str, tag_prefix: str = "#", time_precision: str = "s") -> [dict]:
+    """Influx points of a CSV file, casted according to the schema of the measurement."""
+
+    return _influx_process_csv(csv_path, measurement, tag_prefix, time_precision)
+
+
+def is_connection_error(e: Exception) -> bool:
+    """Whether a write failed temporarily and may be retried.
+
+    Connection errors, timeouts and server errors (5xx) are temporary, while
+    retrying a write rejected by the server (4xx, e.g. a field type conflict)
+    or malformed data fails again.
+    """
+
+    if isinstance(e, InfluxDBClientError):
+        return e.code is not None and (e.code >= 500 or e.code in [408, 429])
+    return isinstance(e, (InfluxDBServerError, OSError))
+
+
 class InfluxDBSensorClient(InfluxDBClient):
-    def __init__(self, tag_prefix="#", **kwargs):
+    def __init__(self, tag_prefix="#", spool: dict = None, time_precision: str = "s", **kwargs):
+        """
+        Args:
+            tag_prefix (str): prefix in csv header to identify tags
+            spool (dict): spool failed writes to disk, e.g. {"path": "/data/spool"}
+            time_precision (str): precision of the written times (s, ms, us, ns)
+            kwargs: arguments of the InfluxDBClient
+        """
+
+        if time_precision not in _TIME_FACTORS:
+            raise ValueError("time precision '{}' is not in {}".format(
+                time_precision, list(_TIME_FACTORS)))
+
         InfluxDBClient.__init__(self, **kwargs)
         self.tag_prefix = tag_prefix
+        self.time_precision = time_precision
+
+        self.spool = None
+        self.replayer = None
+        if spool:
+            self._init_spool(kwargs, **spool)
+
+    def _init_spool(self, client_kwargs: dict, path: str, max_size_mib: float = 64, segment_size_mib: float = 1,
+                    interval: str = "1m", max_backoff: str = "1h", gzip: bool = True):
+        self.spool = InfluxSpool(path, max_size_mib, segment_size_mib)
+
+        # spooled points are replayed by a separate, compressing client
+        replay_kwargs = dict(client_kwargs)
+        if gzip:
+            replay_kwargs["gzip"] = True
+        replay_client = InfluxDBClient(**replay_kwargs)
+
+        self.replayer = SpoolReplayer(self.spool,
+                                      replay_client.write_points,
+                                      parse_time(interval),
+                                      parse_time(max_backoff),
+                                      rejected=lambda e: not is_connection_error(e))
+        logger.info("spooling failed influx writes at '{}'".format(path))
+
+    def _write(self, points: [dict], tags: dict, time_precision: str):
+        try:
+            self.write_points(points=points, tags=tags,
+                              time_precision=time_precision)
+        except Exception as e:
+            if not self.spool or not is_connection_error(e):
+                raise
+
+            logger.warn("Writing to influx failed, spooling {} points: {}".format(
+                len(points), e))
+            self.spool.append(points, tags, time_precision)
+            return
+
+        # connectivity is back, drain the spool
+        if self.spool and self.spool.points:
+            self.replayer.wakeup()
 
     def publish(self, header: [str], row: [], _class: str, _hostname: str, _id: str, _sensor: str):
-        logger.info("Publishing {} metering to Influx".format(_sensor))
+        self.publish_rows(header, [row], _class, _hostname, _id, _sensor)
 
-        body = _influx_process(_class, header, row, self.tag_prefix)
+    def publish_rows(self, header: [str], rows: [[]], _class: str, _hostname: str, _id: str, _sensor: str):
+        logger.info("Publishing {} {} metering(s) to Influx".format(
+            len(rows), _sensor))
+
+        val_cols, tag_cols = _influx_seperate_header(
+            header, tag_prefix=self.tag_prefix)
+        points = _influx_construct_dicts(
+            _class, rows, val_cols, tag_cols, self.time_precision)
         tags = {
             "hostname": _hostname,
             "id": _id,
             "sensor": _sensor,
         }
 
-        self.write_points(points=[body], tags=tags, time_precision="s")
+        self._write(points=points, tags=tags,
+                    time_precision=INFLUX_PRECISIONS[self.time_precision])
 
     def publish_csv(self, csv_path: str, _class: str, _hostname: str, _id: str, _sensor: str):
         logger.info("Sending {} to InfluxDB".format(csv_path))
 
-        points = _influx_process_csv(csv_path, _class, self.tag_prefix)
+        points = _influx_process_csv(
+            csv_path, _class, self.tag_prefix, self.time_precision)
         tags = {
             "hostname": _hostname,
             "id": _id,
             "sensor": _sensor,
         }
 
-        self.write_points(points=points, tags=tags, time_precision="s")
+        self._write(points=points, tags=tags,
+                    time_precision=INFLUX_PRECISIONS[self.time_precision])
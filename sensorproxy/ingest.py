@@ -0,0 +1,444 @@
+"""Streaming of readings from nodes to an aggregating sensorproxy via HTTP.
+
+Nodes configured with `ingest` batch their readings in an `IngestSender`
+and post them to the `IngestServer` of the aggregating instance, which
+stores them and forwards them to InfluxDB within seconds. The server
+answers 503 if its queue is full; senders keep the batches and retry with
+exponential backoff.
+"""
+
+import csv
+import hmac
+import http.server
+import itertools
+import json
+import logging
+import os
+import queue
+import socketserver
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from pytimeparse import parse as parse_time
+
+from sensorproxy.sensors.base import Sensor
+
+logger = logging.getLogger(__name__)
+
+INGEST_PATH = "/ingest"
+STATS_PATH = "/stats"
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+class _IngestHandler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        logger.debug("{} - {}".format(self.address_string(), format % args))
+
+    def _respond(self, code: int, body: dict, headers: dict = {}):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path != STATS_PATH:
+            return self._respond(404, {"error": "not found"})
+        self._respond(200, self.server.ingest.stats())
+
+    def do_POST(self):
+        ingest = self.server.ingest
+
+        if self.path != INGEST_PATH:
+            return self._respond(404, {"error": "not found"})
+        if ingest.token and not hmac.compare_digest(
+                self.headers.get("Authorization", "").encode(), "Bearer {}".format(ingest.token).encode()):
+            return self._respond(401, {"error": "unauthorized"})
+
+        length = int(self.headers.get("Content-Length", 0))
+        if length > ingest.max_body_bytes:
+            return self._respond(413, {"error": "body exceeds {} bytes".format(ingest.max_body_bytes)})
+
+        try:
+            batches = json.loads(self.rfile.read(length).decode())["batches"]
+            for batch in batches:
+                IngestServer.validate(batch)
+        except (ValueError, KeyError, TypeError) as e:
+            return self._respond(400, {"error": "malformed batch: {}".format(e)})
+
+        if not ingest.submit(batches):
+            return self._respond(503, {"error": "ingest queue is full"},
+                                 {"Retry-After": str(ingest.retry_after_s)})
+
+        self._respond(202, {"accepted": sum(len(b["rows"]) for b in batches)})
+
+
+class IngestServer:
+    """HTTP server receiving batches of readings from other nodes.
+
+    Accepted batches are queued and processed by writer threads: rows are
+    appended to CSV files in the storage of the sending host and published
+    on influx, if configured. A full queue is answered with 503.
+    """
+
+    BATCH_KEYS = ["hostname", "id", "class", "sensor", "header", "rows"]
+
+    # fields used in file paths, in addition to the blacklist of ids
+    PATH_KEYS = ["hostname", "id", "class", "sensor"]
+    PATH_BLACKLIST = "/\\"
+
+    @staticmethod
+    def validate(batch: dict):
+        """Check a received batch, its path fields must not leave the storage path.
+
+        Raises:
+            KeyError: If a key is missing.
+            ValueError: If a value is not valid.
+        """
+
+        for key in IngestServer.BATCH_KEYS:
+            if key not in batch:
+                raise KeyError(key)
+
+        for key in IngestServer.PATH_KEYS:
+            value = batch[key]
+            if not isinstance(value, str) or not value or value.startswith(".") \
+                    or ".." in value or os.path.isabs(value) \
+                    or any(c in IngestServer.PATH_BLACKLIST for c in value):
+                raise ValueError("invalid {} '{}'".format(key, value))
+
+        # the id separates the fields of file names
+        if any(c in "-." for c in batch["id"]):
+            raise ValueError("invalid id '{}'".format(batch["id"]))
+
+        if not isinstance(batch["header"], list) or not isinstance(batch["rows"], list):
+            raise ValueError("header and rows must be lists")
+
+    def __init__(self, proxy, host: str = "127.0.0.1", port: int = 8040, token: str = None,
+                 max_requests: int = 100, writers: int = 2, max_body_mib: float = 16,
+                 retry_after: str = "5s"):
+        """
+        Args:
+            proxy (SensorProxy): proxy providing storage, catalog and influx
+            host (str): address to listen on, a token is required for other than localhost
+            port (int): port to listen on, 0 picks a free port
+            token (str): bearer token required from senders
+            max_requests (int): queued requests until further ones are rejected
+            writers (int): threads storing and publishing batches
+            max_body_mib (float): maximum size of a request
+            retry_after (str): retry delay suggested to rejected senders
+        """
+
+        if not token and host not in ["127.0.0.1", "localhost", "::1"]:
+            raise ValueError(
+                "the ingest server requires a token to listen on '{}'".format(host))
+
+        self.proxy = proxy
+        self.token = token
+        self.max_body_bytes = int(max_body_mib * 1024**2)
+        self.retry_after_s = parse_time(retry_after)
+
+        self.received_rows = 0
+        self.rejected_requests = 0
+        self.written_rows = 0
+        self.failed_batches = 0
+        self.latency_s = None
+
+        self._queue = queue.Queue(maxsize=max_requests)
+        self._files = {}
+        self._lock = threading.Lock()
+        # counters are updated by the handler and writer threads
+        self._stats_lock = threading.Lock()
+
+        self.httpd = _ThreadingHTTPServer((host, port), _IngestHandler)
+        self.httpd.ingest = self
+        self.address = self.httpd.server_address
+
+        self._threads = [threading.Thread(target=self._write_batches, daemon=True)
+                         for _ in range(writers)]
+        self._threads.append(threading.Thread(
+            target=self.httpd.serve_forever, daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+        logger.info("ingest server listening on {}:{}".format(*self.address))
+
+    def submit(self, batches: [dict]) -> bool:
+        """Queue the batches of a request, False if the queue is full."""
+
+        try:
+            self._queue.put_nowait((time.time(), batches))
+        except queue.Full:
+            with self._stats_lock:
+                self.rejected_requests += 1
+            logger.warn("ingest queue is full, rejecting {} batches".format(
+                len(batches)))
+            return False
+
+        with self._stats_lock:
+            self.received_rows += sum(len(b["rows"]) for b in batches)
+        return True
+
+    def _file_path(self, batch: dict):
+        """CSV file of a remote sensor, a new one is started if its header changes."""
+
+        key = (batch["hostname"], batch["id"], batch["sensor"])
+        path, header = self._files.get(key, (None, None))
+        if path is not None and header == batch["header"] and os.path.exists(path):
+            return path, False
+
+        # headers may change within a second, files are not appended to twice
+        ts = Sensor.time_repr("s")
+        for n in itertools.count(1):
+            custom = "ingest" if n == 1 else "ingest{}".format(n)
+            file_name = "{}/{}-{}-{}-{}.csv".format(
+                batch["class"], ts, batch["id"], batch["sensor"], custom)
+            path = os.path.join(self.proxy.storage_path,
+                                batch["hostname"], file_name)
+            if not os.path.exists(path):
+                break
+
+        storage_path = os.path.realpath(self.proxy.storage_path)
+        if os.path.commonpath([storage_path, os.path.realpath(path)]) != storage_path:
+            raise ValueError(
+                "'{}' is outside of the storage path".format(path))
+
+        self._files[key] = (path, batch["header"])
+        return path, True
+
+    def _store(self, batch: dict) -> str:
+        # writers append to the same files, rows of a batch are kept together
+        with self._lock:
+            path, new = self._file_path(batch)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+            with open(path, "a") as csv_file:
+                writer = csv.writer(csv_file)
+                if new:
+                    writer.writerow(batch["header"])
+                writer.writerows(batch["rows"])
+
+        return path
+
+    def _catalog_add(self, path: str, batch: dict, ingested: bool):
+        if not self.proxy.catalog:
+            return
+
+        self.proxy.catalog.add(path, batch["hostname"], batch["id"], batch["class"],
+                               batch["sensor"], ingested=ingested)
+        # a file is only ingested if all of its batches were published
+        if not ingested:
+            self.proxy.catalog.mark([path], ingested=False)
+
+    def _process(self, batch: dict):
+        path = self._store(batch)
+
+        try:
+            if self.proxy.influx:
+                self.proxy.influx.publish_rows(batch["header"], batch["rows"], batch["class"],
+                                               batch["hostname"], batch["id"], batch["sensor"])
+        except Exception:
+            self._catalog_add(path, batch, ingested=False)
+            raise
+
+        self._catalog_add(path, batch, ingested=bool(self.proxy.influx))
+
+    def _write_batches(self):
+        while True:
+            received_ts, batches = self._queue.get()
+            for batch in batches:
+                try:
+                    self._process(batch)
+                except Exception as e:
+                    with self._stats_lock:
+                        self.failed_batches += 1
+                    logger.error("Processing ingested batch of {} ({}) failed: {}".format(
+                        batch["sensor"], batch["hostname"], e))
+                    continue
+
+                with self._stats_lock:
+                    self.written_rows += len(batch["rows"])
+            self.latency_s = time.time() - received_ts
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "received_rows": self.received_rows,
+                "written_rows": self.written_rows,
+                "rejected_requests": self.rejected_requests,
+                "failed_batches": self.failed_batches,
+                "queued_requests": self._queue.qsize(),
+                "latency_s": self.latency_s,
+            }
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class IngestSender:
+    """Batches readings of the local sensors and posts them to an IngestServer.
+
+    Rows are buffered per sensor and sent after `flush_interval`, or as soon
+    as `batch_size` rows of a sensor are buffered. If sending fails, rows are
+    kept and sending is retried with exponential backoff; beyond `max_rows`
+    buffered rows, the oldest are dropped.
+    """
+
+    def __init__(self, url: str, token: str = None, batch_size: int = 500, flush_interval: str = "1s",
+                 max_rows: int = 100000, timeout: str = "10s", max_backoff: str = "5m"):
+        """
+        Args:
+            url (str): address of the ingest server, e.g. http://sink.local:8040
+            token (str): bearer token of the ingest server
+            batch_size (int): buffered rows of a sensor triggering a send
+            flush_interval (str): maximum delay of buffered rows
+            max_rows (int): maximum number of buffered rows
+            timeout (str): timeout of a request
+            max_backoff (str): maximum delay after failed sends
+        """
+
+        self.url = url.rstrip("/") + INGEST_PATH
+        self.token = token
+        self.batch_size = batch_size
+        self.flush_interval_s = parse_time(flush_interval)
+        self.max_rows = max_rows
+        self.timeout_s = parse_time(timeout)
+        self.max_backoff_s = parse_time(max_backoff)
+
+        self.sent_rows = 0
+        self.dropped_rows = 0
+        self.failures = 0
+
+        # buffered rows and metadata per sensor
+        self._buffers = {}
+        self._buffered = 0
+        self._condition = threading.Condition()
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+        logger.info("streaming readings to '{}'".format(self.url))
+
+    def send(self, header: [str], rows: [[]], _class: str, _hostname: str, _id: str, _sensor: str):
+        """Buffer rows to be sent, arguments as in InfluxDBSensorClient.publish_rows."""
+
+        key = (_hostname, _id, _sensor)
+        with self._condition:
+            buffer = self._buffers.get(key)
+            if buffer is None or buffer["header"] != header:
+                if buffer is not None:
+                    # rows of the former header are sent as a batch of their own
+                    self._buffers[key + (id(buffer),)] = buffer
+                buffer = {"hostname": _hostname, "id": _id, "class": _class,
+                          "sensor": _sensor, "header": list(header), "rows": []}
+                self._buffers[key] = buffer
+
+            buffer["rows"].extend(rows)
+            self._buffered += len(rows)
+            self._drop_oldest()
+
+            if len(buffer["rows"]) >= self.batch_size:
+                self._condition.notify()
+
+    def _drop_oldest(self):
+        while self._buffered > self.max_rows:
+            buffer = max(self._buffers.values(), key=lambda b: len(b["rows"]))
+            excess = min(len(buffer["rows"]), self._buffered - self.max_rows)
+            del buffer["rows"][:excess]
+            self._buffered -= excess
+            self.dropped_rows += excess
+            logger.warn("ingest buffer is full, dropped {} rows of {}".format(
+                excess, buffer["sensor"]))
+
+    def _post(self, batches: [dict]):
+        body = json.dumps({"batches": batches}, default=str).encode()
+        request = urllib.request.Request(self.url, data=body, method="POST")
+        request.add_header("Content-Type", "application/json")
+        if self.token:
+            request.add_header("Authorization", "Bearer {}".format(self.token))
+
+        with urllib.request.urlopen(request, timeout=self.timeout_s) as response:
+            response.read()
+
+    def _take(self):
+        with self._condition:
+            batches = [b for b in self._buffers.values() if b["rows"]]
+            self._buffers = {}
+            self._buffered = 0
+        return batches
+
+    def _restore(self, batches: [dict]):
+        """Put unsent batches back in front of rows buffered meanwhile."""
+
+        with self._condition:
+            buffers = self._buffers
+            self._buffers = {}
+            for batch in batches:
+                self._buffers[(batch["hostname"], batch["id"], batch["sensor"], id(batch))] = batch
+            self._buffers.update(buffers)
+            self._buffered += sum(len(b["rows"]) for b in batches)
+            self._drop_oldest()
+
+    def flush(self):
+        """Send all buffered rows.
+
+        Raises:
+            urllib.error.URLError: If sending failed, the rows are kept.
+        """
+
+        batches = self._take()
+        if not batches:
+            return
+
+        try:
+            self._post(batches)
+        except urllib.error.HTTPError as e:
+            if 400 <= e.code < 500 and e.code not in [408, 429]:
+                # the server will not accept these rows on retries either
+                self.dropped_rows += sum(len(b["rows"]) for b in batches)
+                logger.error("ingest server rejected {} batches: {}".format(
+                    len(batches), e))
+                return
+            self._restore(batches)
+            raise
+        except (urllib.error.URLError, OSError):
+            self._restore(batches)
+            raise
+
+        self.sent_rows += sum(len(b["rows"]) for b in batches)
+
+    def _run(self):
+        backoff_s = 0
+
+        while True:
+            with self._condition:
+                self._condition.wait(max(self.flush_interval_s, backoff_s))
+
+            try:
+                self.flush()
+                backoff_s = 0
+            except (urllib.error.URLError, OSError) as e:
+                self.failures += 1
+                backoff_s = min(max(backoff_s * 2, self.flush_interval_s, 1),
+                                self.max_backoff_s)
+                logger.warn("sending to ingest server failed, retrying in {}s: {}".format(
+                    backoff_s, e))
+
+    def stats(self):
+        with self._condition:
+            buffered = self._buffered
+        return {
+            "sent_rows": self.sent_rows,
+            "buffered_rows": buffered,
+            "dropped_rows": self.dropped_rows,
+            "failures": self.failures,
+        }
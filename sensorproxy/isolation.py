@@ -0,0 +1,295 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+
+from multiprocessing import shared_memory, resource_tracker
+
+from sensorproxy.locks import LockManager
+from sensorproxy.sensors.base import SensorNotAvailableException
+
+logger = logging.getLogger(__name__)
+
+# buffers larger than this are returned through shared memory
+SHARED_MEMORY_THRESHOLD = 64 * 1024
+
+
+class _SharedBuffer:
+    """Reference to a buffer in shared memory, replacing it in a reading."""
+
+    def __init__(self, name: str, size: int, _type: type):
+        self.name = name
+        self.size = size
+        self.type = _type
+
+
+def _to_shared(reading: []):
+    result = []
+    for value in reading:
+        if isinstance(value, (bytes, bytearray, memoryview)) and len(value) > SHARED_MEMORY_THRESHOLD:
+            shm = shared_memory.SharedMemory(create=True, size=len(value))
+            shm.buf[:len(value)] = value
+            # the receiving process takes over the buffer and unlinks it
+            resource_tracker.unregister(shm._name, "shared_memory")
+            shm.close()
+            value = _SharedBuffer(shm.name, len(value), type(value))
+        result.append(value)
+
+    return result
+
+
+def _from_shared(reading: []):
+    result = []
+    for value in reading:
+        if isinstance(value, _SharedBuffer):
+            shm = shared_memory.SharedMemory(name=value.name)
+            try:
+                data = bytes(shm.buf[:value.size])
+            finally:
+                shm.close()
+                shm.unlink()
+            value = bytearray(data) if value.type is bytearray else data
+        result.append(value)
+
+    return result
+
+
+class _WorkerProxy:
+    """Stand-in for the proxy of a sensor built in a worker process.
+
+    Only reads run in workers, so outputs, the lift and shared managers
+    of the proxy are not available.
+    """
+
+    def __init__(self, id: str, hostname: str, storage_path: str):
+        self.id = id
+        self.hostname = hostname
+        self.storage_path = storage_path
+
+        self.locks = LockManager()
+        self.lift = None
+        self.catalog = None
+        self.storage = None
+        self.influx = None
+        self.bus = None
+
+
+def _build_sensor(sensor_cls, proxy, name: str, params: dict):
+    # the proxy records the readings, so the worker creates no CSV file
+    worker_cls = type(sensor_cls.__name__, (sensor_cls,),
+                      {"refresh": lambda self: None})
+    return worker_cls(proxy, name, **dict(params, isolate=0))
+
+
+def _worker_main(sensor_cls, proxy_args, name, params, log_level, conn):
+    """Main loop of a worker process, reading the sensor on request."""
+
+    logging.basicConfig(level=log_level)
+    try:
+        sensor = _build_sensor(sensor_cls, _WorkerProxy(*proxy_args), name, params)
+    except Exception as e:
+        conn.send(("error", repr(e)))
+        return
+    conn.send(("ok", None))
+
+    while True:
+        try:
+            kwargs = conn.recv()
+        except EOFError:
+            return
+        if kwargs is None:
+            return
+
+        try:
+            reading = sensor._read(**kwargs)
+            if asyncio.iscoroutine(reading):
+                reading = asyncio.run(reading)
+            conn.send(("ok", _to_shared(reading)))
+        except SensorNotAvailableException as e:
+            conn.send(("unavailable", str(e)))
+        except Exception as e:
+            conn.send(("error", repr(e)))
+
+
+def _proc_stats(pid: int):
+    """CPU time and resident memory of a process, read from /proc."""
+
+    try:
+        with open("/proc/{}/stat".format(pid)) as stat_file:
+            # fields after the command name, which may contain spaces
+            fields = stat_file.read().rsplit(")", 1)[1].split()
+        with open("/proc/{}/status".format(pid)) as status_file:
+            rss_kib = next(int(line.split()[1]) for line in status_file
+                           if line.startswith("VmRSS:"))
+    except (OSError, StopIteration):
+        return None, None
+
+    ticks = os.sysconf("SC_CLK_TCK")
+    cpu_s = (int(fields[11]) + int(fields[12])) / ticks
+
+    return cpu_s, rss_kib / 1024
+
+
+class _Worker:
+    def __init__(self, reader, ctx):
+        sensor = reader.sensor
+        proxy_args = (sensor.proxy.id, sensor.proxy.hostname,
+                      sensor.proxy.storage_path)
+
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main,
+                                   args=(type(sensor), proxy_args, sensor.name, reader.params,
+                                         logging.getLogger().level, child_conn),
+                                   name="{}-worker".format(sensor.name), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+        # the sensor is built in the worker, failures are reported once
+        if not self.conn.poll(reader.timeout_s):
+            self.stop()
+            raise TimeoutError("worker did not start within {}s".format(reader.timeout_s))
+        status, result = self.conn.recv()
+        if status != "ok":
+            self.stop()
+            raise SensorNotAvailableException(
+                "building the sensor in a worker failed: {}".format(result))
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.kill()
+        self.conn.close()
+
+
+class IsolatedReader:
+    """Runs `_read` of a sensor in a pool of long-lived worker processes.
+
+    Workers are started from a fork server, which is itself started as a
+    fresh process, so they inherit no threads or locks of the proxy. Each
+    worker builds its own instance of the sensor from its configuration.
+
+    State changed by `_read` stays in the worker and does not reach the
+    sensor of the proxy, so sensors keeping state between reads (see
+    `Sensor._isolatable`) cannot be isolated. Large buffers in readings are returned through shared
+    memory instead of being pickled. Crashed or hung workers are replaced.
+    """
+
+    def __init__(self, sensor, workers: int = 1, timeout_s: float = 300):
+        """
+        Args:
+            sensor (Sensor): sensor to be read
+            workers (int): number of worker processes
+            timeout_s (float): kill a worker if a read takes longer
+        """
+
+        self.sensor = sensor
+        self.workers = workers
+        self.timeout_s = timeout_s
+        self.params = None
+
+        self.restarts = 0
+
+        self._ctx = multiprocessing.get_context("forkserver")
+        self._idle = None
+        self._all = []
+        self._lock = threading.Lock()
+
+    def start(self, params: dict):
+        """Start the worker processes, if not yet started.
+
+        Args:
+            params (dict): configuration the sensor was created with
+        """
+
+        with self._lock:
+            if self._idle is not None:
+                return
+
+            logger.info("starting {} worker(s) for sensor '{}'".format(
+                self.workers, self.sensor.name))
+            self.params = params
+            try:
+                for _ in range(self.workers):
+                    self._all.append(_Worker(self, self._ctx))
+            except Exception:
+                for worker in self._all:
+                    worker.stop()
+                self._all = []
+                raise
+
+            self._idle = queue.Queue()
+            for worker in self._all:
+                self._idle.put(worker)
+
+    def _replace(self, worker):
+        worker.stop()
+        self.restarts += 1
+
+        with self._lock:
+            if worker in self._all:
+                self._all.remove(worker)
+            replacement = _Worker(self, self._ctx)
+            self._all.append(replacement)
+
+        return replacement
+
+    def __call__(self, **kwargs):
+        if self._idle is None:
+            raise SensorNotAvailableException("worker processes are not started")
+        worker = self._idle.get()
+
+        try:
+            worker.conn.send(kwargs)
+            if not worker.conn.poll(self.timeout_s):
+                raise TimeoutError(
+                    "no result after {}s".format(self.timeout_s))
+            status, result = worker.conn.recv()
+
+        except (EOFError, OSError, TimeoutError) as e:
+            reason = str(e) or "crashed"
+            logger.error("worker of sensor '{}' failed ({}), restarting it".format(
+                self.sensor.name, reason))
+            worker = self._replace(worker)
+            raise SensorNotAvailableException(
+                "worker process failed: {}".format(reason))
+
+        finally:
+            self._idle.put(worker)
+
+        if status == "ok":
+            return _from_shared(result)
+        if status == "unavailable":
+            raise SensorNotAvailableException(result)
+        raise SensorNotAvailableException(
+            "reading in worker failed: {}".format(result))
+
+    def stats(self):
+        """CPU time and resident memory per worker process."""
+
+        with self._lock:
+            workers = list(self._all)
+
+        stats = []
+        for worker in workers:
+            cpu_s, rss_mib = _proc_stats(worker.process.pid)
+            stats.append({
+                "pid": worker.process.pid,
+                "alive": worker.process.is_alive(),
+                "cpu_s": cpu_s,
+                "rss_mib": rss_mib,
+            })
+
+        return {"restarts": self.restarts, "workers": stats}
+
+    def close(self):
+        with self._lock:
+            for worker in self._all:
+                worker.stop()
+            self._all = []
+            self._idle = None
@@ -6,6 +6,7 @@ import threading
 import RPi.GPIO as gpio
 
 from sensorproxy.wifi import WiFi, WiFiManager, WiFiConnectionError
+from sensorproxy.sensors.base import SensorNotAvailableException
 
 logger = logging.getLogger(__name__)
 
@@ -39,6 +40,7 @@ class Lift:
         charging_indicator=None,
         charging_docking_retries: int = 3,
         charging_docking_delay_s: float = 3.0,
+        lock=None,
     ):
         """
         Args:
@@ -52,6 +54,7 @@ class Lift:
             port (int): server port of the LiftSystem
             update_interval_s (float): interval between lift speed updates
             timeout_s (float): speed commands timeout configured on the LiftSystem
+            lock (ResourceLock): lock of the lift, defaults to a private lock
 
         Examples:
             The lift can be instanciated without a WiFi configured, leaving the 
@@ -89,7 +92,7 @@ class Lift:
         self._current_height_m = None
 
         # runtime variables
-        self._lock = threading.Lock()
+        self._lock = lock or threading.Lock()
         self._sock = None
         self._current_speed = None
         self._last_response_ts = None
@@ -397,7 +400,13 @@ class Lift:
         for retry in range(self.charging_docking_retries):
             time.sleep(self.charging_docking_delay_s)
 
-            is_charging = self.charging_indicator.record()[0][0]
+            try:
+                readings = self.charging_indicator.record()
+            except SensorNotAvailableException as e:
+                logger.warn("Charging indicator is not available: {}".format(e))
+                return
+
+            is_charging = readings and readings[0][0]
             if is_charging:
                 logger.info("Charging started.")
                 return
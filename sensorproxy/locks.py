@@ -0,0 +1,271 @@
+import asyncio
+import itertools
+import logging
+import threading
+import time
+
+from pytimeparse import parse as parse_time
+
+logger = logging.getLogger(__name__)
+
+
+class Resource:
+    """A shared resource, e.g. a sensor, the camera or an I2C bus.
+
+    Up to `capacity` holders may use the resource at the same time.
+    """
+
+    def __init__(self, name: str, capacity: int = 1):
+        self.name = name
+        self.capacity = capacity
+        self.holders = 0
+
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_total_s = 0.0
+        self.wait_max_s = 0.0
+        self.hold_total_s = 0.0
+
+    def stats(self, waiting: int = 0):
+        return {
+            "capacity": self.capacity,
+            "holders": self.holders,
+            "waiting": waiting,
+            "acquisitions": self.acquisitions,
+            "contended": self.contended,
+            "wait_mean_s": self.wait_total_s / self.contended if self.contended else 0.0,
+            "wait_max_s": self.wait_max_s,
+            "hold_total_s": self.hold_total_s,
+        }
+
+
+class ResourceLock:
+    """Access to a set of resources, used like a `threading.Lock`.
+
+    All resources are acquired at once or not at all, so holders never wait
+    for further resources and cannot deadlock each other.
+    """
+
+    def __init__(self, manager, resources: [str], priority: int = 0, name: str = None):
+        """
+        Args:
+            manager (LockManager): manager of the resources
+            resources ([str]): names of the resources
+            priority (int): requests of higher priority are granted first
+            name (str): name used in logs
+        """
+
+        self.manager = manager
+        self.resources = sorted(set(resources))
+        self.priority = priority
+        self.name = name or ",".join(self.resources)
+
+        self._granted_ts = None
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        return self.manager._acquire(self, blocking, None if timeout < 0 else timeout)
+
+    async def acquire_async(self):
+        """Acquire on an event loop, waiting in line like `acquire`."""
+
+        await self.manager._acquire_async(self)
+
+    def release(self):
+        self.manager._release(self)
+
+    def locked(self) -> bool:
+        return self._granted_ts is not None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+
+class _Request:
+    def __init__(self, lock: ResourceLock, seq: int):
+        self.lock = lock
+        self.seq = seq
+        self.ts = time.monotonic()
+
+        # requests awaited on an event loop are granted by the releasing thread
+        self.future = None
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(True)
+
+
+class LockManager:
+    """Grants access to shared resources.
+
+    Waiting requests are served by priority, which increases by one every
+    `aging` they wait, and in order of arrival within a priority. A request
+    is only granted if no waiting request for any of its resources is served
+    first, while requests for disjoint resources are granted in parallel.
+    Waiting requests whose resources are partly held do not take precedence,
+    so a holder can still acquire what it needs to finish.
+    """
+
+    def __init__(self, resources: {str: int} = {}, aging: str = "30s"):
+        """
+        Args:
+            resources ({str: int}): capacity of resources, others have a capacity of 1
+            aging (str): wait time raising the priority of a request by one
+        """
+
+        self.aging_s = parse_time(aging)
+
+        self._resources = {name: Resource(name, capacity)
+                           for name, capacity in resources.items()}
+        self._waiting = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def _resource(self, name: str) -> Resource:
+        if name not in self._resources:
+            self._resources[name] = Resource(name)
+        return self._resources[name]
+
+    def lock(self, resources: [str], priority: int = 0, name: str = None) -> ResourceLock:
+        """Create a lock for a set of resources, see ResourceLock."""
+
+        return ResourceLock(self, resources, priority, name)
+
+    def _rank(self, request: _Request, now: float):
+        waited_s = now - request.ts
+        return (request.lock.priority + waited_s / self.aging_s, -request.seq)
+
+    def _held(self, request: _Request) -> bool:
+        """The request waits for a holder, not only for other waiters."""
+
+        # like a threading.Lock, a lock has a single holder
+        if request.lock.locked():
+            return True
+
+        resources = [self._resource(name) for name in request.lock.resources]
+        return any(r.holders >= r.capacity for r in resources)
+
+    def _grantable(self, request: _Request) -> bool:
+        if self._held(request):
+            return False
+
+        now = time.monotonic()
+        rank = self._rank(request, now)
+        names = set(request.lock.resources)
+        for other in self._waiting:
+            if other is request or names.isdisjoint(other.lock.resources):
+                continue
+            # a waiter blocked by a holder is not served first anyway, and
+            # the holder may need the requested resources to release its own
+            if self._held(other):
+                continue
+            if self._rank(other, now) > rank:
+                return False
+
+        return True
+
+    def _grant(self, request: _Request, waited_s: float):
+        for name in request.lock.resources:
+            resource = self._resource(name)
+            resource.holders += 1
+            resource.acquisitions += 1
+            if waited_s > 0:
+                resource.contended += 1
+                resource.wait_total_s += waited_s
+                resource.wait_max_s = max(resource.wait_max_s, waited_s)
+
+        request.lock._granted_ts = time.monotonic()
+
+    def _acquire(self, lock: ResourceLock, blocking: bool, timeout: float) -> bool:
+        with self._cond:
+            request = _Request(lock, next(self._seq))
+            if self._grantable(request):
+                self._grant(request, 0.0)
+                return True
+            if not blocking:
+                return False
+
+            logger.debug("'{}' waits for {}".format(lock.name, lock.resources))
+            self._waiting.append(request)
+            granted = False
+            try:
+                # waiters are re-evaluated with their aged priority on every release
+                granted = self._cond.wait_for(lambda: self._grantable(request), timeout)
+                if granted:
+                    self._grant(request, time.monotonic() - request.ts)
+            finally:
+                # others are only notified once the resources are held
+                self._waiting.remove(request)
+                self._notify()
+
+            return granted
+
+    async def _acquire_async(self, lock: ResourceLock):
+        loop = asyncio.get_running_loop()
+
+        with self._cond:
+            request = _Request(lock, next(self._seq))
+            if self._grantable(request):
+                self._grant(request, 0.0)
+                return
+
+            logger.debug("'{}' waits for {}".format(lock.name, lock.resources))
+            request.future = loop.create_future()
+            self._waiting.append(request)
+
+        try:
+            await request.future
+        except asyncio.CancelledError:
+            with self._cond:
+                if request in self._waiting:
+                    self._waiting.remove(request)
+                    self._notify()
+                elif lock.locked():
+                    # granted, but the waiter is gone
+                    self._release(lock)
+            raise
+
+    def _notify(self):
+        """Grant awaited requests in order of their rank and wake waiting threads."""
+
+        now = time.monotonic()
+        awaited = sorted((r for r in self._waiting if r.future),
+                         key=lambda r: self._rank(r, now), reverse=True)
+        for request in awaited:
+            if self._grantable(request):
+                self._waiting.remove(request)
+                self._grant(request, now - request.ts)
+                request.future.get_loop().call_soon_threadsafe(_resolve, request.future)
+
+        self._cond.notify_all()
+
+    def _release(self, lock: ResourceLock):
+        with self._cond:
+            if lock._granted_ts is None:
+                raise RuntimeError(
+                    "release of unlocked resources {}".format(lock.resources))
+
+            held_s = time.monotonic() - lock._granted_ts
+            lock._granted_ts = None
+            for name in lock.resources:
+                resource = self._resources[name]
+                resource.holders -= 1
+                resource.hold_total_s += held_s
+
+            self._notify()
+
+    def stats(self):
+        """Contention and wait times by resource."""
+
+        with self._cond:
+            waiting = {}
+            for request in self._waiting:
+                for name in request.lock.resources:
+                    waiting[name] = waiting.get(name, 0) + 1
+
+            return {name: resource.stats(waiting.get(name, 0))
+                    for name, resource in self._resources.items()}
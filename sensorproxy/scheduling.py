@@ -0,0 +1,184 @@
+import collections
+import datetime
+import logging
+import threading
+import time
+
+from pytimeparse import parse as parse_time
+
+logger = logging.getLogger(__name__)
+
+
+def planned_ts(at_time: datetime.time, now: datetime.datetime = None) -> float:
+    """Timestamp of the latest occurrence of a daily time, i.e. when a job firing now was planned.
+
+    Args:
+        at_time (datetime.time): time of day the job is scheduled at
+        now (datetime.datetime): current time, defaults to now
+    """
+
+    if now is None:
+        now = datetime.datetime.now()
+
+    planned = datetime.datetime.combine(now.date(), at_time)
+    # jobs fired shortly after midnight were planned for the previous day
+    if planned > now:
+        planned -= datetime.timedelta(days=1)
+
+    return planned.timestamp()
+
+
+class MeteringRunner:
+    """Runs the firings of a metering, bounding concurrent runs.
+
+    If a firing occurs while `max_concurrent` runs are active, the overrun
+    policy decides what happens to it:
+
+    - skip: the firing is dropped
+    - coalesce: the firing replaces an already pending firing and runs once
+      the active run is finished
+    - queue: firings are queued (at most `queue_size`) and run one after the other
+
+    Firings not started within `deadline` after their planned start are
+    abandoned, runs exceeding the deadline are asked to stop early. If an
+    energy budget is given, firings it does not allow are deferred.
+    """
+
+    POLICIES = ["skip", "coalesce", "queue"]
+
+    def __init__(self, name: str, run, start, overrun: str = "skip", max_concurrent: int = 1,
+                 deadline: str = None, queue_size: int = 10, history: int = 100, budget=None):
+        """
+        Args:
+            name (str): name of the metering
+            run (callable): runs the metering, called with the deadline timestamp,
+                returns False if the run was stopped early
+            start (callable): starts a function in the background
+            overrun (str): overrun policy, one of skip, coalesce, queue
+            max_concurrent (int): runs of the metering active at the same time
+            deadline (str): duration after the planned start a run is abandoned
+            queue_size (int): maximum pending firings of the queue policy
+            history (int): number of firings kept for statistics
+            budget (EnergyBudget): energy budget the runs are accounted to
+        """
+
+        if overrun not in MeteringRunner.POLICIES:
+            raise ValueError("overrun policy '{}' is not in {}".format(
+                overrun, MeteringRunner.POLICIES))
+
+        self.name = name
+        self.run = run
+        self.start = start
+        self.overrun = overrun
+        self.max_concurrent = max_concurrent
+        self.deadline_s = parse_time(deadline) if deadline else None
+        self.queue_size = queue_size
+        self.budget = budget
+
+        self.history = collections.deque(maxlen=history)
+        self.counts = collections.Counter()
+
+        self._running = 0
+        self._pending = collections.deque()
+        self._lock = threading.Lock()
+
+    def fire(self, planned: float = None):
+        """Handle a firing of the schedule.
+
+        Args:
+            planned (float): planned start of the firing, defaults to now
+        """
+
+        firing = {
+            "planned": planned if planned is not None else time.time(),
+            "fired": time.time(),
+            "start": None,
+            "end": None,
+            "outcome": None,
+        }
+
+        if self.budget and not self.budget.allow(self.name):
+            with self._lock:
+                self._finish(firing, "deferred")
+            return
+
+        with self._lock:
+            if self._running < self.max_concurrent:
+                self._running += 1
+                self.start(self._execute, firing)
+                return
+
+            if self.overrun == "skip":
+                self._finish(firing, "skipped")
+            elif self.overrun == "coalesce":
+                while self._pending:
+                    self._finish(self._pending.popleft(), "coalesced")
+                self._pending.append(firing)
+            elif self.overrun == "queue":
+                if len(self._pending) >= self.queue_size:
+                    self._finish(self._pending.popleft(), "skipped")
+                self._pending.append(firing)
+
+        logger.warn("metering '{}' is still running ({} active), firing is {}".format(
+            self.name, self.max_concurrent, firing["outcome"] or "pending"))
+
+    def _finish(self, firing: dict, outcome: str):
+        firing["outcome"] = outcome
+        self.counts[outcome] += 1
+        self.history.append(firing)
+
+    def _execute(self, firing: dict):
+        while firing:
+            deadline_ts = None
+            if self.deadline_s is not None:
+                deadline_ts = firing["planned"] + self.deadline_s
+
+            if deadline_ts is not None and time.time() > deadline_ts:
+                logger.warn("metering '{}' missed its deadline ({}s late), abandoned".format(
+                    self.name, round(time.time() - firing["planned"], 1)))
+                outcome = "abandoned"
+            else:
+                firing["start"] = time.time()
+                logger.info("metering '{}' started {:.1f}s late".format(
+                    self.name, firing["start"] - firing["planned"]))
+
+                try:
+                    completed = self.run(deadline_ts)
+                    outcome = "done" if completed is not False else "abandoned"
+                except Exception as e:
+                    logger.error(
+                        "metering '{}' failed: {}".format(self.name, e))
+                    outcome = "failed"
+
+                firing["end"] = time.time()
+                if self.budget:
+                    self.budget.consume(
+                        self.name, firing["end"] - firing["start"])
+
+            with self._lock:
+                self._finish(firing, outcome)
+                firing = self._pending.popleft() if self._pending else None
+                if firing is None:
+                    self._running -= 1
+
+    def stats(self):
+        """Firing counts by outcome, lateness and duration of recent runs."""
+
+        with self._lock:
+            started = [f for f in self.history if f["start"] is not None]
+            pending = len(self._pending)
+            running = self._running
+            counts = dict(self.counts)
+
+        lateness = [f["start"] - f["planned"] for f in started]
+        durations = [f["end"] - f["start"] for f in started]
+
+        return {
+            "running": running,
+            "pending": pending,
+            "outcomes": counts,
+            "lateness_mean_s": sum(lateness) / len(lateness) if lateness else None,
+            "lateness_max_s": max(lateness) if lateness else None,
+            "duration_max_s": max(durations) if durations else None,
+            "firings": list(self.history),
+        }
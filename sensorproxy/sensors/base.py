@@ -1,5 +1,11 @@
+import asyncio
+import functools
 import os
+import re
 import time
+import calendar
+import importlib
+import math
 import uuid
 import csv
 import logging
@@ -9,18 +15,203 @@ from abc import ABC, abstractmethod
 from typing import Type
 from pytimeparse import parse as parse_time
 
+from sensorproxy.aggregate import WindowAggregator
+from sensorproxy.bus import Reading
+
 
 logger = logging.getLogger(__name__)
 
+_duration_regex = re.compile(r"\s*(?P<value>\d+(\.\d*)?|\.\d+)\s*(?P<unit>ms|us|µs|s)?\s*")
+_duration_units = {None: 1, "s": 1, "ms": 1e-3, "us": 1e-6, "µs": 1e-6}
+
+
+def parse_duration(duration) -> float:
+    """Parse a duration to fractional seconds.
+
+    Numbers are taken as seconds, strings may be given in s, ms or us
+    (e.g. "0.25s", "250ms"); other strings are parsed by pytimeparse.
+    """
+
+    if isinstance(duration, (int, float)):
+        return float(duration)
+
+    match = _duration_regex.fullmatch(duration)
+    if match:
+        return float(match.group("value")) * _duration_units[match.group("unit")]
+
+    seconds = parse_time(duration)
+    if seconds is None:
+        raise SensorConfigurationException(
+            "'{}' is not a valid duration".format(duration))
+    return float(seconds)
+
+
+class SensorHealth:
+    """Health of a sensor, acting as circuit breaker for broken sensors.
+
+    After `failure_threshold` consecutive records without any successful
+    reading the circuit opens and the sensor is skipped for `cooldown_s`.
+    Afterwards a single probing try is allowed (half-open); its success closes
+    the circuit, its failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, name: str, failure_threshold: int = 3, cooldown_s: float = 600):
+        """
+        Args:
+            name (str): name of the tracked sensor
+            failure_threshold (int): failed records until the circuit opens
+            cooldown_s (float): seconds to skip the sensor when open
+        """
+
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown_s = cooldown_s
+
+        self.state = SensorHealth.CLOSED
+        self.consecutive_failures = 0
+        self.total_successes = 0
+        self.total_failures = 0
+        self.last_success_ts = None
+        self.last_failure_ts = None
+        self.last_error = None
+        self.opened_ts = None
+
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Check if the sensor may be recorded, half-opening the circuit after the cooldown."""
+
+        with self._lock:
+            if self.state != SensorHealth.OPEN:
+                return True
+
+            if self.opened_ts + self.cooldown_s > time.time():
+                return False
+
+            logger.info("Sensor '{}' cooled down, probing.".format(self.name))
+            self.state = SensorHealth.HALF_OPEN
+            return True
+
+    @property
+    def probing(self):
+        return self.state == SensorHealth.HALF_OPEN
+
+    def success(self):
+        with self._lock:
+            if self.state != SensorHealth.CLOSED:
+                logger.info(
+                    "Sensor '{}' recovered, closing circuit.".format(self.name))
+
+            self.state = SensorHealth.CLOSED
+            self.consecutive_failures = 0
+            self.total_successes += 1
+            self.last_success_ts = time.time()
+
+    def failure(self, error=None):
+        with self._lock:
+            self.consecutive_failures += 1
+            self.total_failures += 1
+            self.last_failure_ts = time.time()
+            if error is not None:
+                self.last_error = str(error)
+
+            if self.state == SensorHealth.HALF_OPEN or \
+                    self.consecutive_failures >= self.failure_threshold:
+                if self.state != SensorHealth.OPEN:
+                    logger.error("Sensor '{}' failed {} times, skipping it for {}s.".format(
+                        self.name, self.consecutive_failures, self.cooldown_s))
+                self.state = SensorHealth.OPEN
+                self.opened_ts = time.time()
+
+    def as_dict(self):
+        """Health state of the sensor, e.g. for status reports."""
+
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "total_successes": self.total_successes,
+                "total_failures": self.total_failures,
+                "last_success_ts": self.last_success_ts,
+                "last_failure_ts": self.last_failure_ts,
+                "last_error": self.last_error,
+            }
+
+
+class _FixedRate:
+    """Schedule of fixed-rate reads against absolute monotonic deadlines.
+
+    Deadlines are multiples of the period after the first read, so read
+    durations do not accumulate as drift. Deadlines already passed are
+    skipped and counted as missed.
+    """
+
+    def __init__(self, period_s: float):
+        self.period_s = period_s
+        self.missed = 0
+        self.jitters = []
+
+        self._start = None
+        self._slot = 0
+
+    def started(self):
+        """Note the start of a read, recording its lateness to the deadline."""
+
+        now = time.monotonic()
+        if self._start is None:
+            self._start = now
+        self.jitters.append(now - (self._start + self._slot * self.period_s))
+
+    def next_slot(self) -> float:
+        """Advance to the next deadline not yet passed.
+
+        Returns:
+            float: seconds until the deadline
+        """
+
+        self._slot += 1
+        now = time.monotonic()
+        deadline = self._start + self._slot * self.period_s
+
+        if now > deadline:
+            missed = math.ceil((now - deadline) / self.period_s)
+            self.missed += missed
+            self._slot += missed
+            deadline = self._start + self._slot * self.period_s
+
+        return deadline - now
+
+    def stats(self):
+        return {
+            "period_s": self.period_s,
+            "samples": len(self.jitters),
+            "missed": self.missed,
+            "jitter_mean_s": sum(self.jitters) / len(self.jitters) if self.jitters else 0.0,
+            "jitter_max_s": max(self.jitters, default=0.0),
+            "jitters_s": self.jitters,
+        }
+
 
 class Sensor:
     """Abstract sensor class"""
 
-    def __init__(self, proxy, name: str, uses_height: bool, ** kwargs):
+    def __init__(self, proxy, name: str, uses_height: bool, failure_threshold: int = 3, cooldown: str = "10m", aggregate: str = None,
+                 isolate: int = 0, isolate_timeout: str = "5m", resources: [str] = [], priority: int = 0, ** kwargs):
         """
         Args:
             name (str): given name of the sensor
             storage_path (str): path to store files in
+            failure_threshold (int): failed records until the sensor is skipped
+            cooldown (str): duration a failing sensor is skipped
+            aggregate (str): publish aggregates of this window to influx instead of raw readings
+            isolate (int): number of worker processes to read the sensor in, 0 reads in-process
+            isolate_timeout (str): restart a worker if a read takes longer
+            resources ([str]): shared resources used by the sensor, besides the ones of its class
+            priority (int): records of higher priority are granted access first
         """
 
         self.proxy = proxy
@@ -30,7 +221,27 @@ class Sensor:
         self._filename_format = "{_class}/{_ts}-{_id}-{_sensor}-{_custom}"
         self.refresh()
 
-        self._lock = threading.Lock()
+        # access to the sensor itself and the resources it shares with others
+        self._lock = proxy.locks.lock(
+            ["sensor:" + name] + self._resources + resources, priority, name)
+        self.health = SensorHealth(
+            name, failure_threshold, parse_time(cooldown))
+
+        self.aggregate = aggregate
+        self._aggregators = {}
+
+        # statistics of the last fixed-rate record
+        self.sampling = None
+
+        self._isolated = None
+        if isolate:
+            if not self._isolatable:
+                raise SensorConfigurationException(
+                    "{} cannot be read in worker processes".format(self.__class__.__name__))
+
+            from sensorproxy.isolation import IsolatedReader
+            self._isolated = IsolatedReader(
+                self, isolate, parse_time(isolate_timeout))
         super().__init__()
 
     def _generate_filename(self, _ts: str, custom: [str] = []):
@@ -42,21 +253,46 @@ class Sensor:
             _custom="-".join(custom),
         )
 
+    _filename_regex = re.compile(
+        r"(?P<_ts>\d{4}-\d{2}-\d{2}T\d{6})-(?P<_id>[^-]+)-(?P<_sensor>.+)-(?P<_custom>[^-.]*)\.(?P<_ext>[^.]+)")
+
     @staticmethod
-    def _parse_filename(filename):
-        basename, _file_ext = filename.split(".")
-        metadata = basename.split("-")
+    def _parse_file_path(file_path):
+        """Parse metadata of a file generated by _generate_filename.
+
+        The class is taken from the parent directory, if the path contains one.
+        Sensor names may contain dashes, the custom part of the name may not.
+
+        Returns:
+            dict: _ts, ts (epoch), _id, _class, _sensor, _custom and _ext,
+                None if the name does not follow the convention
+        """
+
+        match = Sensor._filename_regex.fullmatch(os.path.basename(file_path))
+        if not match:
+            return None
 
-        tags = dict(zip(["_id", "_class", "_sensor"], metadata[:3]))
-        # TODO: Parse tags in custom headers, e.g. height for images
+        metadata = match.groupdict()
+        metadata["_class"] = os.path.basename(os.path.dirname(file_path)) or None
+        metadata["ts"] = calendar.timegm(
+            time.strptime(metadata["_ts"], "%Y-%m-%dT%H%M%S"))
 
-        return tags
+        return metadata
+
+    @staticmethod
+    def _parse_filename(filename):
+        metadata = Sensor._parse_file_path(filename)
+        if metadata is None:
+            raise ValueError(
+                "'{}' does not match the file name convention".format(filename))
+
+        return {key: metadata[key] for key in ["_id", "_class", "_sensor"]}
 
     def refresh(self):
         """Refresh the sensor, e.g. creating a new file."""
 
         # set a valid file path
-        file_name = self._generate_filename(Sensor.time_repr()) + ".csv"
+        file_name = self._generate_filename(Sensor.time_repr("s")) + ".csv"
         self.__file_path = os.path.join(
             self.proxy.storage_path, self.proxy.hostname, file_name)
 
@@ -72,6 +308,35 @@ class Sensor:
             writer.writerow(self.header)
             csv_file.flush()
 
+        self._catalog_add(self.__file_path)
+
+    def _catalog_add(self, file_path: str, height_m: float = None):
+        """Index a written file in the catalog, if configured."""
+
+        if not self.proxy.catalog:
+            return
+
+        try:
+            self.proxy.catalog.add(file_path,
+                                   hostname=self.proxy.hostname,
+                                   _id=self.proxy.id,
+                                   _class=self.__class__.__name__,
+                                   _sensor=self.name,
+                                   height=height_m)
+        except Exception as e:
+            logger.warn("Indexing {} failed: {}".format(file_path, e))
+
+    def _catalog_touch(self, file_path: str):
+        """Extend the time range and size of an indexed file in the catalog, if configured."""
+
+        if not self.proxy.catalog:
+            return
+
+        try:
+            self.proxy.catalog.touch(file_path)
+        except Exception as e:
+            logger.warn("Indexing {} failed: {}".format(file_path, e))
+
     def get_file_path(self):
         if not os.path.exists(self.__file_path):
             self.refresh()
@@ -86,15 +351,53 @@ class Sensor:
 
     _header_sensor = []
 
+    # shared resources used by all sensors of a class, e.g. the camera
+    _resources = []
+
+    # whether reads may run in worker processes, which do not share state
+    # changed by `_read` (e.g. discovered devices or caches) with the proxy
+    _isolatable = True
+
     @property
     def header(self):
         return self._header_start + self._header_sensor
 
+    # sub-second digits of timestamps, set by the static configuration
+    time_precision = "s"
+    TIME_PRECISIONS = {"s": 0, "ms": 3, "us": 6, "ns": 9}
+
+    # formatted second of the last timestamp, as (epoch second, string)
+    _time_cache = (None, None)
+
+    @staticmethod
+    def set_time_precision(precision: str):
+        if precision not in Sensor.TIME_PRECISIONS:
+            raise SensorConfigurationException("time precision '{}' is not in {}".format(
+                precision, list(Sensor.TIME_PRECISIONS)))
+        Sensor.time_precision = precision
+
     @staticmethod
-    def time_repr():
-        """Current time, formatted."""
+    def time_repr(precision: str = None):
+        """Current time, formatted.
+
+        Args:
+            precision (str): s, ms, us or ns, defaults to the configured precision
+        """
+
+        seconds, fraction_ns = divmod(time.time_ns(), 10**9)
+
+        # formatting is only done once per second
+        cached_s, formatted = Sensor._time_cache
+        if cached_s != seconds:
+            formatted = time.strftime("%Y-%m-%dT%H%M%S", time.gmtime(seconds))
+            Sensor._time_cache = (seconds, formatted)
+
+        digits = Sensor.TIME_PRECISIONS[precision or Sensor.time_precision]
+        if digits:
+            formatted += ".{:0{}d}".format(fraction_ns //
+                                           10**(9 - digits), digits)
 
-        return time.strftime("%Y-%m-%dT%H%M%S", time.gmtime())
+        return formatted
 
     @abstractmethod
     def _read(self, **kwargs):
@@ -106,17 +409,56 @@ class Sensor:
 
         pass
 
-    def record(self, count: int = 1, delay: str = "0s", tries=2, **kwargs):
-        logger.debug("acquire access to {}".format(self.name))
-        self._lock.acquire()
+    # steps of the record procedure, performed by record and arecord
+    _STEP_READ = "read"
+    _STEP_DELAY = "delay"
+    _STEP_BACKOFF = "backoff"
+
+    def _check_health(self):
+        if not self.health.allow():
+            raise SensorNotAvailableException(
+                "skipped after {} consecutive failures, last error: {}".format(
+                    self.health.consecutive_failures, self.health.last_error))
+
+    def _record_steps(self, count: int = 1, delay: str = "0s", tries=2, backoff: str = "1s", max_backoff: str = "30s", timeout: str = None, period: str = None, **kwargs):
+        """Generator of the record procedure, independent of how reads and sleeps are performed.
+
+        Yields (step, seconds) tuples; a read step is answered by sending the
+        reading or throwing the SensorNotAvailableException of the read.
+
+        Returns:
+            [[object]]: The readings of the sensor.
+        """
+
+        # a cooled down sensor is probed with a single try
+        total_tries = 1 if self.health.probing else count * tries
+        deadline_ts = time.time() + parse_time(timeout) if timeout else None
+        backoff_s = parse_time(backoff)
+        max_backoff_s = parse_time(max_backoff)
+        delay_s = parse_duration(delay)
+
+        # in fixed-rate mode, reads start at multiples of the period after the first read
+        sampling = None
+        if period is not None:
+            sampling = _FixedRate(parse_duration(period))
+
         records = []
         successful = 0
+        failed = 0
+        error = None
 
         try:
-            for num in range(count * tries):
+            for num in range(total_tries):
+                if deadline_ts and time.time() > deadline_ts:
+                    logger.warn("Sensor '{}' timed out after {} tries.".format(
+                        self.name, num))
+                    break
+
                 try:
+                    if sampling:
+                        sampling.started()
                     ts = Sensor.time_repr()
-                    reading = self._read(**kwargs)
+                    reading = yield Sensor._STEP_READ, None
                     if len(reading) != len(self._header_sensor):
                         raise SensorNotAvailableException("Reading length ({}) does not match header length ({}).".format(
                             len(reading), len(self._header_sensor)))
@@ -124,64 +466,234 @@ class Sensor:
 
                     records.append(reading)
                     successful += 1
+                    failed = 0
                     logger.debug(
                         "Sensor '{}' measured correctly (try {}/{}, {} successful).".format(
-                            self.name, num+1, count*tries, successful))
+                            self.name, num+1, total_tries, successful))
 
-                    if successful < count:
-                        time.sleep(parse_time(delay))
-                    else:
+                    if successful >= count:
                         break
+                    if sampling:
+                        yield Sensor._STEP_DELAY, sampling.next_slot()
+                    else:
+                        yield Sensor._STEP_DELAY, delay_s
 
                 except SensorNotAvailableException as e:
+                    error = e
+                    failed += 1
                     logger.warn(
-                        "Sensor '{}' measurement failed (try {}/{}, {} successful): {}".format(self.name, num+1, count*tries, successful, e))
+                        "Sensor '{}' measurement failed (try {}/{}, {} successful): {}".format(self.name, num+1, total_tries, successful, e))
+
+                    if num + 1 < total_tries and sampling:
+                        # failed reads are retried in the next slot
+                        yield Sensor._STEP_DELAY, sampling.next_slot()
+                    elif num + 1 < total_tries:
+                        wait_s = min(backoff_s * 2 ** (failed - 1),
+                                     max_backoff_s)
+                        if deadline_ts:
+                            wait_s = max(0, min(wait_s, deadline_ts - time.time()))
+                        yield Sensor._STEP_BACKOFF, wait_s
 
         finally:
+            if successful > 0:
+                self.health.success()
+            else:
+                self.health.failure(error)
+
+            if sampling:
+                self.sampling = sampling.stats()
+                logger.info("Sensor '{}' sampled every {}s: {} missed deadlines, jitter mean {:.6f}s, max {:.6f}s".format(
+                    self.name, sampling.period_s, sampling.missed,
+                    self.sampling["jitter_mean_s"], self.sampling["jitter_max_s"]))
+
             if successful < count:
                 logger.error(
                     "Sensor '{}': {} successful of {} requested measurements.".format(self.name, successful, count))
 
+        return records
+
+    def record(self, count: int = 1, delay: str = "0s", tries=2, backoff: str = "1s", max_backoff: str = "30s", timeout: str = None, period: str = None, **kwargs):
+        """Record the sensor, retrying failed readings with exponential backoff.
+
+        Args:
+            count (int): number of readings to be recorded
+            delay (str): delay between successful readings
+            period (str): read at a fixed rate instead, e.g. "250ms"; failed
+                reads are retried in the next period
+            tries (int): tries per requested reading
+            backoff (str): delay after the first failed try, doubled per failure
+            max_backoff (str): upper limit of the delay after failed tries
+            timeout (str): stop trying after this duration
+
+        Raises:
+            SensorNotAvailableException: If the sensor is skipped after failing repeatedly.
+
+        Returns:
+            [[object]]: The readings of the sensor.
+        """
+
+        self._check_health()
+        steps = self._record_steps(count=count, delay=delay, tries=tries, backoff=backoff,
+                                   max_backoff=max_backoff, timeout=timeout, period=period, **kwargs)
+
+        logger.debug("acquire access to {}".format(self.name))
+        self._lock.acquire()
+
+        try:
+            step, seconds = next(steps)
+            while True:
+                if step == Sensor._STEP_READ:
+                    try:
+                        reading = self._read_blocking(**kwargs)
+                    except SensorNotAvailableException as e:
+                        step, seconds = steps.throw(e)
+                        continue
+                    step, seconds = steps.send(reading)
+
+                elif step == Sensor._STEP_DELAY:
+                    time.sleep(seconds)
+                    step, seconds = next(steps)
+
+                elif step == Sensor._STEP_BACKOFF:
+                    # others may access the sensor while backing off
+                    self._lock.release()
+                    time.sleep(seconds)
+                    self._lock.acquire()
+                    step, seconds = next(steps)
+
+        except StopIteration as stop:
+            return stop.value
+
+        finally:
+            # finishes the procedure, e.g. if the read raised another exception
+            steps.close()
+
             logger.debug("release access to {}".format(self.name))
             self._lock.release()
 
-        return records
+    def _read_blocking(self, **kwargs):
+        """Read the sensor, in a worker process if isolated."""
 
-    def _publish(self, ts, reading, influx_publish: bool = False, height_m: float = None, **kwargs):
-        file_path = self.get_file_path()
+        if self._isolated:
+            return self._isolated(**kwargs)
+
+        reading = self._read(**kwargs)
+        # async sensors can be recorded synchronously as well
+        if asyncio.iscoroutine(reading):
+            reading = asyncio.run(reading)
+
+        return reading
+
+    async def _acquire_async(self):
+        # waits in line with blocking records, without occupying a thread
+        await self._lock.acquire_async()
+
+    async def _run_blocking(self, func, *args):
+        """Run a blocking call of an async `_read` in the engine's executor, if there is one."""
+
+        engine = getattr(self.proxy, "engine", None)
+        executor = engine.executor if engine else None
+        return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+    async def arecord(self, executor=None, count: int = 1, delay: str = "0s", tries=2, backoff: str = "1s", max_backoff: str = "30s", timeout: str = None, period: str = None, **kwargs):
+        """Record the sensor on an event loop, see record.
+
+        Sensors implementing `async def _read` are read on the loop, blocking
+        implementations are run in the executor.
 
+        Args:
+            executor (concurrent.futures.Executor): executor for blocking reads
+        """
+
+        loop = asyncio.get_running_loop()
+        record_kwargs = dict(count=count, delay=delay, tries=tries, backoff=backoff,
+                             max_backoff=max_backoff, timeout=timeout, period=period, **kwargs)
+
+        # sensors with a custom record procedure are recorded as a whole
+        if type(self).record is not Sensor.record:
+            return await loop.run_in_executor(executor, functools.partial(self.record, **record_kwargs))
+
+        self._check_health()
+        steps = self._record_steps(**record_kwargs)
+
+        logger.debug("acquire access to {}".format(self.name))
+        await self._acquire_async()
+
+        try:
+            step, seconds = next(steps)
+            while True:
+                if step == Sensor._STEP_READ:
+                    try:
+                        if asyncio.iscoroutinefunction(self._read) and not self._isolated:
+                            reading = await self._read(**kwargs)
+                        else:
+                            reading = await loop.run_in_executor(
+                                executor, functools.partial(self._read_blocking, **kwargs))
+                    except SensorNotAvailableException as e:
+                        step, seconds = steps.throw(e)
+                        continue
+                    step, seconds = steps.send(reading)
+
+                elif step == Sensor._STEP_DELAY:
+                    await asyncio.sleep(seconds)
+                    step, seconds = next(steps)
+
+                elif step == Sensor._STEP_BACKOFF:
+                    self._lock.release()
+                    await asyncio.sleep(seconds)
+                    await self._acquire_async()
+                    step, seconds = next(steps)
+
+        except StopIteration as stop:
+            return stop.value
+
+        finally:
+            # finishes the procedure, e.g. if the read raised another exception
+            steps.close()
+
+            logger.debug("release access to {}".format(self.name))
+            self._lock.release()
+
+    def _row(self, ts, reading, height_m: float = None):
         if self.uses_height and self.proxy.lift:
-            row = [ts, height_m] + reading
-        else:
-            row = [ts] + reading
+            return [ts, height_m] + reading
+        return [ts] + reading
+
+    def _write_rows(self, rows):
+        file_path = self.get_file_path()
 
         with open(file_path, "a") as csv_file:
             writer = csv.writer(csv_file)
-            writer.writerow(row)
+            writer.writerows(rows)
             csv_file.flush()
 
-        if self.proxy.influx and influx_publish:
-            logger.info("Publishing {} metering to Influx".format(self.name))
+        # the file was indexed when it was created
+        self._catalog_touch(file_path)
+        if self.proxy.storage:
+            self.proxy.storage.update([file_path])
+        return file_path
+
+    def _aggregator(self, window: str):
+        """Get the aggregator of a window duration and the current header, creating it on first use."""
 
-            def _publish_thread(self, row):
-                try:
-                    self.proxy.influx.publish(
-                        header=self.header,
-                        row=row,
-                        _class=self.__class__.__name__,
-                        _hostname=self.proxy.hostname,
-                        _id=self.proxy.id,
-                        _sensor=self.name,
-                    )
-                except Exception as e:
-                    logger.warn("Publishing on infux failed: {}".format(
-                        e), {"influx_publish": False})
-
-            thread = threading.Thread(
-                target=_publish_thread, args=(self, row))
-            thread.start()
+        # a changed header (e.g. of rediscovered probes) needs another aggregator
+        key = (parse_time(window), tuple(self.header))
+        if key not in self._aggregators:
+            self._aggregators[key] = WindowAggregator(
+                self.header, key[0], self.proxy.influx.tag_prefix)
 
-        return file_path
+        return self._aggregators[key]
+
+    def _publish(self, ts, reading, height_m: float = None, **kwargs):
+        """Publish a reading on the bus, options of the metering are passed to the subscribers."""
+
+        row = self._row(ts, reading, height_m)
+        try:
+            self.proxy.bus.publish(
+                Reading(self, ts, reading, row, height_m, kwargs))
+        except Exception as e:
+            raise SensorNotAvailableException(
+                "Storing the reading failed: {}".format(e))
 
 
 class FileSensor(Sensor):
@@ -197,7 +709,7 @@ class FileSensor(Sensor):
 
     def generate_path(self):
         file_name = self._generate_filename(
-            Sensor.time_repr()) + "." + self.file_ext
+            Sensor.time_repr("s")) + "." + self.file_ext
         return os.path.join(self.proxy.storage_path,
                             self.proxy.hostname,
                             file_name)
@@ -205,6 +717,32 @@ class FileSensor(Sensor):
 
 classes = {}
 
+# modules of the built-in sensor types, imported when a type is requested
+builtin_modules = {
+    "Microphone": "audio",
+    "TelekomVolume": "cellular",
+    "ChargingIndicator": "energy",
+    "AM2302": "environment",
+    "DS18B20": "environment",
+    "TSL2561": "environment",
+    "BrightPi": "illumination",
+    "LED": "illumination",
+    "LoggingHandler": "logger",
+    "PiCamera": "optical",
+    "PiNoirCamera": "optical",
+    "BrightPiCamera": "optical",
+    "IRCutCamera": "optical",
+    "Random": "random",
+    "RandomFile": "random",
+    "RsyncSender": "rsync",
+    "Sink": "sink",
+    "CPU": "system",
+    "Memory": "system",
+}
+
+# entry point group of third-party sensor plugins
+ENTRY_POINT_GROUP = "sensorproxy.sensors"
+
 
 def register_sensor(cls: Type[Sensor]):
     """Add the sensor to the classes dict by its name."""
@@ -212,6 +750,52 @@ def register_sensor(cls: Type[Sensor]):
     return cls
 
 
+def _entry_points():
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        import pkg_resources
+        return list(pkg_resources.iter_entry_points(ENTRY_POINT_GROUP))
+
+    eps = entry_points()
+    if hasattr(eps, "select"):
+        return list(eps.select(group=ENTRY_POINT_GROUP))
+    return list(eps.get(ENTRY_POINT_GROUP, []))
+
+
+def get_sensor_class(name: str) -> Type[Sensor]:
+    """Get a sensor class by its type name, importing its module on first use.
+
+    Built-in types are looked up in builtin_modules, other types in the
+    entry points of the group 'sensorproxy.sensors', e.g. in a setup.py:
+    entry_points={"sensorproxy.sensors": ["MySensor = mypackage.sensors:MySensor"]}
+
+    Raises:
+        SensorConfigurationException: If the type is unknown.
+    """
+
+    if name in classes:
+        return classes[name]
+
+    if name in builtin_modules:
+        module = "sensorproxy.sensors." + builtin_modules[name]
+        logger.debug("importing {} for {}".format(module, name))
+        importlib.import_module(module)
+    else:
+        for ep in _entry_points():
+            if ep.name == name:
+                logger.debug("loading plugin {} from {}".format(
+                    name, ep.value if hasattr(ep, "value") else ep.module_name))
+                register_sensor(ep.load())
+                break
+
+    if name not in classes:
+        raise SensorConfigurationException(
+            "Unknown sensor type '{}'".format(name))
+
+    return classes[name]
+
+
 class SensorNotAvailableException(Exception):
     """Exception: cannot read sensor."""
 
@@ -1,8 +1,10 @@
 import time
 import logging
-import urllib
 import json
 
+from pytimeparse import parse as parse_time
+
+from sensorproxy.cache import TTLCache, HTTPJSONResource
 from .base import register_sensor, Sensor, SensorNotAvailableException
 
 logger = logging.getLogger(__name__)
@@ -10,27 +12,38 @@ logger = logging.getLogger(__name__)
 
 @register_sensor
 class TelekomVolume(Sensor):
-    def __init__(self, *args, endpoint_uri: str = "http://pass.telekom.de/api/service/generic/v1/status", **kwargs):
+    def __init__(self,
+                 *args,
+                 endpoint_uri: str = "http://pass.telekom.de/api/service/generic/v1/status",
+                 ttl: str = "1h",
+                 timeout: str = "10s",
+                 max_stale: str = None,
+                 **kwargs):
         Sensor.__init__(self, *args, uses_height=False, ** kwargs)
 
         self.endpoint_uri = endpoint_uri
 
+        # the data plan status changes rarely, so responses are cached
+        self._status = HTTPJSONResource(endpoint_uri,
+                                        timeout_s=parse_time(timeout),
+                                        headers={"User-Agent": "Mozilla/5.0"})
+        self._cache = TTLCache(parse_time(ttl),
+                               parse_time(max_stale) if max_stale else None)
+
     _header_sensor = [
         "Used Volume (MiB)",
         "Remaining Volume (MiB)",
         "Remaining Time (Days)",
+        "Stale",
     ]
 
     def _read(self, **kwargs):
         logger.debug("Reading Telekom data plan information.")
 
         try:
-            status_request = urllib.request.Request(self.endpoint_uri)
-            status_request.add_header('User-Agent', 'Mozilla/5.0')
-            status_json = urllib.request.urlopen(status_request)
-            status = json.loads(status_json.read().decode())
+            status, stale = self._cache.get(self._status)
 
-        except urllib.request.URLError as e:
+        except OSError as e:
             raise SensorNotAvailableException(
                 "status json could not be loaded: {}".format(e))
 
@@ -46,4 +59,4 @@ class TelekomVolume(Sensor):
         logger.info("{} / {} MiB remaining for {} days.".format(usedVolume,
                                                                 initialVolume, remainingTime))
 
-        return [usedVolume, remainingVolume, remainingTime]
+        return [usedVolume, remainingVolume, remainingTime, stale]
@@ -19,6 +19,11 @@ class ChargingIndicator(Sensor):
         "Is Charging"
     ]
 
+    def is_charging(self) -> bool:
+        """Read the pin without recording, e.g. for the energy budget."""
+
+        return bool(gpio.input(self.charging_incicator_pin))
+
     def _read(self, **kwargs):
         charging = gpio.input(self.charging_incicator_pin)
         logger.info("Read Charging Indicator pin {}: {}".format(
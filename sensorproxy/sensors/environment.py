@@ -1,10 +1,14 @@
 import time
 import logging
 
+from concurrent.futures import ThreadPoolExecutor
+
 import Adafruit_DHT
 import tsl2561
 import w1thermsensor
+from pytimeparse import parse as parse_time
 
+from sensorproxy.i2c import get_bus
 from .base import register_sensor, Sensor, SensorNotAvailableException
 
 logger = logging.getLogger(__name__)
@@ -43,33 +47,99 @@ class AM2302(Sensor):
 
 @register_sensor
 class DS18B20(Sensor):
-    def __init__(self, *args, **kwargs):
+    """Reads all DS18B20 probes on the 1-Wire bus in one cycle.
+
+    The probes are discovered once and rediscovered after `rediscover`, their
+    handles are kept. Conversions take about 750 ms each, so all probes are
+    read in parallel and the read duration stays close to a single conversion.
+    Every probe is written to a column of its own, named by its ID.
+    """
+
+    def __init__(self, *args, rediscover: str = "1h", **kwargs):
+        self.rediscover_s = parse_time(rediscover)
+        self._probes = []
+        self._discovery_ts = None
+        self._discover()
+
         Sensor.__init__(self, *args, uses_height=True, **kwargs)
 
-    _header_sensor = [
-        "Temperature (°C)",
-    ]
+    # rediscovered probes change the header of the proxy
+    _isolatable = False
 
-    def _read(self, **kwargs):
-        logger.debug("Reading DS18B20 sensor")
+    @property
+    def _header_sensor(self):
+        return ["Temperature {} (°C)".format(probe.id) for probe in self._probes]
+
+    def _discover(self):
+        """Scan the 1-Wire bus and keep handles of all available probes.
+
+        Returns:
+            bool: True if the set of probes has changed.
+        """
+
+        logger.debug("Discovering DS18B20 probes")
+        self._discovery_ts = time.time()
 
         try:
-            sensor = w1thermsensor.W1ThermSensor()
-            temp = sensor.get_temperature()
-        except RuntimeError as e:
-            raise SensorNotAvailableException(e)
+            probes = w1thermsensor.W1ThermSensor.get_available_sensors()
+        except (RuntimeError, OSError) as e:
+            logger.warn("DS18B20 discovery failed: {}".format(e))
+            return False
+
+        probes = sorted(probes, key=lambda probe: probe.id)
+        changed = [p.id for p in probes] != [p.id for p in self._probes]
+        if changed:
+            logger.info("Discovered {} DS18B20 probes: {}".format(
+                len(probes), ", ".join(p.id for p in probes)))
+            self._probes = probes
+
+        return changed
+
+    @staticmethod
+    def _read_probe(probe):
+        try:
+            return round(probe.get_temperature(), 3)
+        except (RuntimeError,
+                OSError,
+                w1thermsensor.NoSensorFoundError,
+                w1thermsensor.SensorNotReadyError) as e:
+            logger.warn("DS18B20 probe {} failed: {}".format(probe.id, e))
+            return None
 
-        temp = round(temp, 3)
-        logger.info("Read {}°C".format(temp))
+    def _read(self, **kwargs):
+        if self._discovery_ts + self.rediscover_s < time.time():
+            # a changed set of probes changes the header, so start a new file
+            if self._discover():
+                self.refresh()
+
+        if not self._probes:
+            raise SensorNotAvailableException("No DS18B20 probes available")
+
+        logger.debug("Reading {} DS18B20 probes".format(len(self._probes)))
 
-        return [temp]
+        with ThreadPoolExecutor(max_workers=len(self._probes)) as executor:
+            temps = list(executor.map(DS18B20._read_probe, self._probes))
+
+        if all(temp is None for temp in temps):
+            raise SensorNotAvailableException("No DS18B20 probe responded")
+
+        logger.info("Read {}°C".format(temps))
+
+        return temps
 
 
 @register_sensor
 class TSL2561(Sensor):
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, bus_id: int = 1, **kwargs):
         Sensor.__init__(self, *args, uses_height=True, **kwargs)
 
+        self.bus_id = bus_id
+        self.bus = get_bus(bus_id)
+        self._lux_sensor = None
+
+    # the bus lock is not shared with worker processes
+    _isolatable = False
+
     _header_sensor = [
         "Illuminance (lux)",
         "broadband",
@@ -80,10 +150,15 @@ class TSL2561(Sensor):
         logger.debug("Reading TSL2561 sensor via i2c")
 
         try:
-            lux_sensor = tsl2561.TSL2561()
-            broadband, ir = lux_sensor._get_luminosity()
-            lux = lux_sensor._calculate_lux(broadband, ir)
+            with self.bus.lock:
+                # the driver is kept, unless it failed
+                if self._lux_sensor is None:
+                    self._lux_sensor = tsl2561.TSL2561(busnum=self.bus_id)
+
+                broadband, ir = self._lux_sensor._get_luminosity()
+                lux = self._lux_sensor._calculate_lux(broadband, ir)
         except OSError as e:
+            self._lux_sensor = None
             raise SensorNotAvailableException(e)
 
         logger.info("Read {} lux (br: {}, ir: {})".format(lux, broadband, ir))
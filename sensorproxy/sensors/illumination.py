@@ -1,11 +1,12 @@
 import time
+import asyncio
 import logging
 import threading
 import RPi.GPIO as GPIO
-import smbus
 
 from pytimeparse import parse as parse_time
 
+from sensorproxy.i2c import get_bus
 from .base import register_sensor, Sensor, SensorNotAvailableException
 
 logger = logging.getLogger(__name__)
@@ -18,13 +19,22 @@ class BrightPi(Sensor):
     def __init__(self,
                  *args,
                  bus_id: int = 1,
+                 i2c_block_write: bool = False,
+                 i2c_cache: bool = False,
                  **kwargs):
         Sensor.__init__(self,
                         *args,
                         uses_height=False,
                         **kwargs)
 
-        self.bus = smbus.SMBus(bus_id)
+        # shared bus, optionally skipping writes of unchanged registers
+        self.bus = get_bus(bus_id)
+        self.i2c_block_write = i2c_block_write
+        if i2c_cache:
+            self.bus.enable_cache(BrightPi.I2C_ADDRESS)
+
+    # the bus lock and register cache are not shared with worker processes
+    _isolatable = False
 
     @staticmethod
     def _bitmask(leds):
@@ -57,10 +67,9 @@ class BrightPi(Sensor):
 
         # compute brightness
         _brightness = int(BrightPi.BRIGHTNESS_MAX * brightness)
-        for led in leds:
-            self.bus.write_byte_data(BrightPi.I2C_ADDRESS,
-                                     led,
-                                     _brightness)
+        self.bus.write_registers(BrightPi.I2C_ADDRESS,
+                                 {led: _brightness for led in leds},
+                                 block=self.i2c_block_write)
 
         return _brightness
 
@@ -89,29 +98,44 @@ class BrightPi(Sensor):
     LEDS_IR = (1, 3, 6, 8)
     LEDS_ALL = (1, 2, 3, 4, 5, 6, 7, 8)
 
-    def _read(self,
-              duration: str,
-              white: float = 1.0,
-              ir: float = 1.0,
-              gain: float = 1.0,
-              **kwargs):
+    def _switch_on(self,
+                   white: float,
+                   ir: float,
+                   gain: float):
+        with self.bus.lock:
+            self._disable_all()
+
+            # set brightness and gain
+            _white = self._set_leds(BrightPi.LEDS_WHITE, white)
+            _ir = self._set_leds(BrightPi.LEDS_IR, ir)
+            _gain = self._set_gain(gain)
+
+            # enable all leds
+            self._enable(BrightPi.LEDS_ALL)
+
+        return _white, _ir, _gain
 
-        self._disable_all()
+    def _switch_off(self):
+        with self.bus.lock:
+            self._disable_all()
+
+    async def _read(self,
+                    duration: str,
+                    white: float = 1.0,
+                    ir: float = 1.0,
+                    gain: float = 1.0,
+                    **kwargs):
 
         # parse duration (in case of an error, leds won't stay on)
         duration_s = parse_time(duration)
 
-        # set brightness and gain
-        _white = self._set_leds(BrightPi.LEDS_WHITE, white)
-        _ir = self._set_leds(BrightPi.LEDS_IR, ir)
-        _gain = self._set_gain(gain)
-
-        # enable all leds
-        self._enable(BrightPi.LEDS_ALL)
+        # the bus lock and the blocking writes are kept off the event loop
+        _white, _ir, _gain = await self._run_blocking(
+            self._switch_on, white, ir, gain)
 
-        time.sleep(duration_s)
+        await asyncio.sleep(duration_s)
 
-        self._disable_all()
+        await self._run_blocking(self._switch_off)
 
         return [duration_s, _white, _ir, _gain]
 
@@ -135,9 +159,9 @@ class LED(Sensor):
         "Duration (s)",
     ]
 
-    def _read(self,
-              duration: str,
-              **kwargs):
+    async def _read(self,
+                    duration: str,
+                    **kwargs):
         duration_s = parse_time(duration)
 
         # enable
@@ -145,7 +169,7 @@ class LED(Sensor):
         GPIO.output(self.led_pin, GPIO.HIGH)
 
         # sleep
-        time.sleep(duration_s)
+        await asyncio.sleep(duration_s)
 
         # disable
         logger.debug(f"LED {self.led_pin} off")
@@ -1,6 +1,12 @@
 import time
 import logging
+import threading
 
+from collections import deque
+
+from pytimeparse import parse as parse_time
+
+from sensorproxy.bus import Reading
 from .base import register_sensor, Sensor, SensorNotAvailableException
 
 logger = logging.getLogger(__name__)
@@ -8,20 +14,63 @@ logger = logging.getLogger(__name__)
 
 @register_sensor
 class LoggingHandler(logging.Handler, Sensor):
-    def __init__(self, *args, level: str = "WARNING", logger_name: str = "sensorproxy", influx_publish=False, **kwargs):
-        if level.upper() not in logging._nameToLevel:
-            raise SensorNotAvailableException(
-                "Level must be in {}.".format(logging._nameToLevel.keys()))
+    """Records log messages, like a QueueHandler.
+
+    Records are only enqueued when logging, a background consumer publishes
+    them in batches on the reading bus. Repeated messages are collapsed,
+    the rate is limited and records below `overload_level` are dropped when
+    the queue is full, so logging never blocks the caller.
+    """
+
+    def __init__(self,
+                 *args,
+                 level: str = "WARNING",
+                 logger_name: str = "sensorproxy",
+                 influx_publish=False,
+                 queue_size: int = 1000,
+                 batch_size: int = 100,
+                 flush_interval: str = "5s",
+                 dedup_interval: str = "1m",
+                 max_rate: float = 10.0,
+                 overload_level: str = "ERROR",
+                 **kwargs):
+        for _level in [level, overload_level]:
+            if _level.upper() not in logging._nameToLevel:
+                raise SensorNotAvailableException(
+                    "Level must be in {}.".format(logging._nameToLevel.keys()))
 
         level_num = logging._nameToLevel[level.upper()]
         logging.Handler.__init__(self, level_num)
         Sensor.__init__(self, *args, uses_height=False, **kwargs)
 
+        self.influx_publish = influx_publish
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval_s = parse_time(flush_interval)
+        self.dedup_interval_s = parse_time(dedup_interval)
+        self.max_rate = max_rate
+        self.overload_level = logging._nameToLevel[overload_level.upper()]
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+
+        # token bucket, allowing bursts of one second
+        self._tokens = max_rate
+        self._tokens_ts = time.time()
+
+        # last message and number of its suppressed repetitions
+        self._last_key = None
+        self._last_ts = None
+        self._repeated = 0
+
+        self.dropped = 0
+
+        self._consumer = threading.Thread(target=self._consume, daemon=True)
+        self._consumer.start()
+
         root = logging.getLogger(logger_name)
         root.addHandler(self)
 
-        self.influx_publish = influx_publish
-
     _header_sensor = [
         "#Name",
         "#Level",
@@ -32,14 +81,106 @@ class LoggingHandler(logging.Handler, Sensor):
         raise SensorNotAvailableException(
             "The Logger sensor can't be called explicitly, but is called when writing to the log.")
 
+    def _take_token(self, now):
+        self._tokens = min(self.max_rate,
+                           self._tokens + (now - self._tokens_ts) * self.max_rate)
+        self._tokens_ts = now
+
+        if self._tokens < 1:
+            return False
+
+        self._tokens -= 1
+        return True
+
+    def _enqueue(self, levelno, row, influx_publish):
+        if len(self._queue) >= self.queue_size and levelno < self.overload_level:
+            self.dropped += 1
+            return
+
+        self._queue.append((row, influx_publish))
+        if len(self._queue) >= self.batch_size:
+            self._cond.notify()
+
     def emit(self, record):
         # influx publishing can be overwritten by supplying the extra argument in a dict
         # logger.warning("test", {"influx_publish": False})
 
-        ts = self.time_repr()
-        reading = [record.name, record.levelname, record.msg]
+        # ignore messages logged while publishing, they would feed back
+        if threading.current_thread() is self._consumer:
+            return
 
+        influx_publish = self.influx_publish
         if (record.args != None) and isinstance(record.args, dict) and "influx_publish" in record.args:
-            self._publish(ts, reading, **record.args)
-        else:
-            self._publish(ts, reading, influx_publish=self.influx_publish)
+            influx_publish = record.args["influx_publish"]
+
+        now = time.time()
+        key = (record.name, record.levelno, str(record.msg))
+
+        with self._cond:
+            if key == self._last_key and self._last_ts + self.dedup_interval_s > now:
+                self._repeated += 1
+                return
+
+            self._flush_repeated()
+            self._last_key = key
+            self._last_ts = now
+
+            if not self._take_token(now) and record.levelno < self.overload_level:
+                self.dropped += 1
+                return
+
+            ts = self.time_repr()
+            reading = [record.name, record.levelname, record.msg]
+            self._enqueue(record.levelno, [ts] + reading, influx_publish)
+
+    def _flush_repeated(self):
+        if not self._repeated:
+            return
+
+        name, levelno, msg = self._last_key
+        row = [self.time_repr(), name, logging.getLevelName(levelno),
+               "last message repeated {} times: {}".format(self._repeated, msg)]
+        self._enqueue(levelno, row, self.influx_publish)
+        self._repeated = 0
+
+    def _flush_dropped(self):
+        # the summary counts against the bound, it is postponed while the queue is full
+        if not self.dropped or len(self._queue) >= self.queue_size:
+            return
+
+        row = [self.time_repr(), __name__, "WARNING",
+               "dropped {} log records (overload)".format(self.dropped)]
+        self._queue.append((row, self.influx_publish))
+        self.dropped = 0
+
+    def flush(self):
+        with self._cond:
+            self._cond.notify()
+
+    def _consume(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: len(self._queue) >= self.batch_size,
+                                    timeout=self.flush_interval_s)
+
+                # repetitions are reported once the dedup interval is over
+                if self._repeated and self._last_ts + self.dedup_interval_s < time.time():
+                    self._flush_repeated()
+                    self._last_key = None
+
+                batch = [self._queue.popleft() for _ in
+                         range(min(self.batch_size, len(self._queue)))]
+
+                # reported in the next batch, once the taken records made room
+                self._flush_dropped()
+
+            if not batch:
+                continue
+
+            try:
+                self.proxy.bus.publish_batch([
+                    Reading(self, row[0], row[1:], row, None,
+                            {"influx_publish": influx_publish})
+                    for row, influx_publish in batch])
+            except Exception as e:
+                logger.warn("Publishing log records failed: {}".format(e))
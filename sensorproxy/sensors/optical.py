@@ -1,3 +1,4 @@
+import io
 import time
 import logging
 import os
@@ -12,12 +13,89 @@ from .illumination import BrightPi
 logger = logging.getLogger(__name__)
 
 
+class ChangeDetector:
+    """Compares downscaled grayscale frames with the last stored frame.
+
+    The score of a frame is the fraction of pixels differing by more than
+    `pixel_threshold` from the reference; frames scoring below `threshold`
+    are unchanged. The reference is replaced by every stored frame, and a
+    frame is stored at least every `max_interval`.
+    """
+
+    def __init__(self, threshold: float = 0.01, pixel_threshold: int = 16, size: [int] = [64, 48],
+                 max_interval: str = "1h"):
+        """
+        Args:
+            threshold (float): fraction of changed pixels of a changed frame
+            pixel_threshold (int): gray level difference of a changed pixel
+            size ([int]): width and height of the compared frames
+            max_interval (str): maximum time between stored frames
+        """
+
+        self.threshold = threshold
+        self.pixel_threshold = pixel_threshold
+        self.size = tuple(size)
+        self.max_interval_s = parse_time(max_interval)
+
+        self.stored = 0
+        self.unchanged = 0
+
+        self._reference = None
+        self._reference_ts = None
+
+    def gray(self, yuv: bytes):
+        """Luminance plane of a yuv capture of `size`, padded to 32x16 by the camera."""
+
+        import numpy
+
+        width, height = self.size
+        padded_width = (width + 31) // 32 * 32
+        padded_height = (height + 15) // 16 * 16
+
+        plane = numpy.frombuffer(yuv, dtype=numpy.uint8,
+                                 count=padded_width * padded_height)
+        return plane.reshape(padded_height, padded_width)[:height, :width].astype(numpy.int16)
+
+    def check(self, gray) -> (bool, float):
+        """Score a frame against the reference.
+
+        Returns:
+            (bool, float): whether the frame has changed and its score
+        """
+
+        if self._reference is None:
+            return True, None
+
+        diff = abs(gray - self._reference) > self.pixel_threshold
+        score = float(diff.mean())
+
+        if time.time() - self._reference_ts > self.max_interval_s:
+            return True, score
+
+        return score >= self.threshold, score
+
+    def keep(self, gray):
+        """Use a stored frame as reference."""
+
+        self._reference = gray
+        self._reference_ts = time.time()
+        self.stored += 1
+
+
 @register_sensor
 class PiCamera(FileSensor):
     def __init__(self,
                  *args,
                  img_format: str = "jpeg",
+                 change_detection: dict = None,
                  **kwargs):
+        # unchanged frames are not stored, but recorded with their score
+        self.change_detector = None
+        if change_detection is not None:
+            self.change_detector = ChangeDetector(**(change_detection or {}))
+            self._header_sensor = self._header_sensor + \
+                ["#Change", "Change score"]
+
         FileSensor.__init__(self,
                             *args,
                             uses_height=True,
@@ -29,6 +107,31 @@ class PiCamera(FileSensor):
     _header_sensor = FileSensor._header_sensor + \
         ["Width (px)", "Height (px)", "Adjust Time (s)"]
 
+    _resources = ["camera"]
+
+    def _capture_changed(self, camera, file_path: str):
+        """Capture a frame if it differs from the last stored one.
+
+        Returns:
+            [object]: the file path, empty if unchanged, change and score
+        """
+
+        detector = self.change_detector
+        preview = io.BytesIO()
+        camera.capture(preview, format="yuv", resize=detector.size)
+        gray = detector.gray(preview.getvalue())
+
+        changed, score = detector.check(gray)
+        if not changed:
+            detector.unchanged += 1
+            logger.info("{} frame unchanged (score {:.4f}), {} of {} frames not stored".format(
+                self.name, score, detector.unchanged, detector.unchanged + detector.stored))
+            return ["", "unchanged", score]
+
+        camera.capture(file_path, format=self.format)
+        detector.keep(gray)
+        return [file_path, "changed", score]
+
     def _read(self,
               res_X: int = 2592,
               res_Y: int = 1944,
@@ -47,16 +150,22 @@ class PiCamera(FileSensor):
                 camera.start_preview()
                 time.sleep(adjust_time_s)
 
-                camera.capture(file_path, format=self.format)
+                change = []
+                if self.change_detector:
+                    file_path, *change = self._capture_changed(
+                        camera, file_path)
+                else:
+                    camera.capture(file_path, format=self.format)
                 camera.stop_preview()
         except picamera.exc.PiCameraMMALError as e:
             raise SensorNotAvailableException(e)
         except picamera.exc.PiCameraError as se:
             raise SensorNotAvailableException(e)
 
-        logger.info(f"image file written to '{file_path}'")
+        if file_path:
+            logger.info(f"image file written to '{file_path}'")
 
-        return [file_path, res_X, res_Y, adjust_time_s]
+        return [file_path, res_X, res_Y, adjust_time_s] + change
 
 
 @register_sensor
@@ -79,18 +188,19 @@ class BrightPiCamera(PiCamera, BrightPi):
               gain: float = 1.0,
               **kwargs):
 
-        self._disable_all()
+        with self.bus.lock:
+            self._disable_all()
 
-        # parse duration (in case of an error, leds won't stay on)
-        duration_s = parse_time(duration)
+            # parse duration (in case of an error, leds won't stay on)
+            duration_s = parse_time(duration)
 
-        # set brightness and gain
-        _white = self._set_leds(BrightPi.LEDS_WHITE, white)
-        _ir = self._set_leds(BrightPi.LEDS_IR, ir)
-        _gain = self._set_gain(gain)
+            # set brightness and gain
+            _white = self._set_leds(BrightPi.LEDS_WHITE, white)
+            _ir = self._set_leds(BrightPi.LEDS_IR, ir)
+            _gain = self._set_gain(gain)
 
-        # enable all leds
-        self._enable(BrightPi.LEDS_ALL)
+            # enable all leds
+            self._enable(BrightPi.LEDS_ALL)
 
         # sleep for the configured duration and take a photo
         time.sleep(duration_s)
@@ -2,70 +2,173 @@ import logging
 import subprocess
 import os
 
+from pytimeparse import parse as parse_time
+
 from .base import register_sensor, Sensor, Sensor, SensorNotAvailableException
 from sensorproxy.wifi import WiFi, WiFiManager
+from sensorproxy.upload import UploadQueue, UploadWindow
 
 logger = logging.getLogger(__name__)
 
 
 @register_sensor
 class RsyncSender(Sensor):
-    def __init__(self, *args, ssid: str, psk: str, destination: str, **kwargs):
+    """Uploads the recorded files with rsync, most important and oldest files first.
+
+    Files are sent in batches of at most `batch_mib`, ordered by their class
+    (see UploadQueue) and age. A window ends after `window_duration` or
+    `window_mib`, files left are sent in the next window; partially
+    transferred files are kept on the destination and resumed.
+    """
+
+    def __init__(self, *args, ssid: str, psk: str, destination: str, classes: {str: [str]} = None,
+                 batch_mib: float = 16, window_duration: str = None, window_mib: float = None,
+                 bwlimit_kib: int = None, **kwargs):
+        """
+        Args:
+            classes ({str: [str]}): file extensions by class, most important first
+            batch_mib (float): maximum size of the files sent by one rsync run
+            window_duration (str): maximum duration of an upload window
+            window_mib (float): size after which no further files are sent in a window
+            bwlimit_kib (int): bandwidth limit of rsync in KiB/s
+        """
+
         Sensor.__init__(self, *args, uses_height=False, **kwargs)
 
         self.destination = destination
         self.wifi = WiFi(ssid, psk)
 
+        self.window_duration_s = parse_time(
+            window_duration) if window_duration else None
+        self.window_bytes = int(window_mib * 1024**2) if window_mib else None
+        self.bwlimit_kib = bwlimit_kib
+
+        self.queue = UploadQueue(os.path.join(self.proxy.storage_path, self.proxy.hostname),
+                                 classes=classes, batch_mib=batch_mib)
+        self.backlog = {}
+
+    # the upload uses the locks, WiFi and storage index of the proxy
+    _isolatable = False
+
     _header_sensor = [
         "Status",
+        "Completion",
+        "Uploaded files",
+        "Uploaded (MiB)",
+        "Rate (KiB/s)",
+        "Backlog files",
+        "Backlog (MiB)",
     ]
 
     def _rsync_cmd(self):
-        cmd = ["rsync", "-avz", "--remove-source-files", "--no-relative",
+        cmd = ["rsync", "-avz", "--remove-source-files", "--files-from=-",
+               "--partial", "--partial-dir=.rsync-partial",
                "-e", "ssh -o StrictHostKeyChecking=no"]
+        if self.bwlimit_kib:
+            cmd.append("--bwlimit={}".format(self.bwlimit_kib))
 
-        local_storage_path = os.path.join(
-            self.proxy.storage_path, self.proxy.hostname)
-        cmd.append(os.path.join(local_storage_path, "."))
+        # paths of the file list are relative to the local storage path
+        cmd.append(os.path.join(self.queue.root, ""))
         cmd.append(os.path.join(self.destination, self.proxy.hostname))
 
         return cmd
 
-    def _read(self, **kwargs):
-        if self.proxy.wifi_mgr:
-            logger.info("connecting to WiFi '{}'".format(self.wifi.ssid))
-            self.proxy.wifi_mgr.connect(self.wifi)
-        else:
-            logger.info("WiFi is handled externally.")
-
-        logger.info("acquiring access to all sensors")
-        for sensor in self.proxy.sensors.values():
-            if sensor == self:
-                continue
+    def _send_batch(self, batch: [dict], timeout_s: float = None) -> int:
+        """Send a batch of files, stopping rsync after `timeout_s`.
 
-            sensor._lock.acquire()
+        Returns:
+            int: return code of rsync, negative if it was stopped
+        """
 
         cmd = self._rsync_cmd()
-        logger.info("Launching rsync: {}".format(" ".join(cmd)))
+        logger.info("Launching rsync for {} files ({:.1f} MiB): {}".format(
+            len(batch), sum(f["size"] for f in batch) / 1024**2, " ".join(cmd)))
 
-        p = subprocess.Popen(cmd)
-        p.wait()
+        p = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+        try:
+            p.communicate("\n".join(f["path"] for f in batch).encode(), timeout=timeout_s)
+        except subprocess.TimeoutExpired:
+            logger.warn("upload window is over, stopping rsync")
+            p.terminate()
+            p.wait()
 
-        if self.proxy.wifi_mgr:
-            logger.info("disconnecting from WiFi")
-            self.proxy.wifi_mgr.disconnect()
+        return p.returncode
 
-        # Call refresh on each Sensor.
-        # This will create new filenames for each FileSensor atm.
-        logger.debug("release locks to all sensors")
-        for sensor in self.proxy.sensors.values():
-            if sensor == self:
-                continue
+    def _upload(self, window: UploadWindow):
+        returncode = 0
+
+        for batch in self.queue.batches(window.remaining_bytes()):
+            if window.exhausted():
+                break
+
+            returncode = self._send_batch(batch, window.remaining_s())
+
+            # rsync removes the files it transferred completely
+            paths = [os.path.join(self.queue.root, f["path"]) for f in batch]
+            window.add([f for f, path in zip(batch, paths)
+                        if not os.path.exists(path)])
+            if self.proxy.storage:
+                self.proxy.storage.update(paths)
 
-            sensor._lock.release()
+            # 24: files vanished during the transfer, e.g. a rotated file
+            if returncode not in [0, 24]:
+                break
 
-        if p.returncode != 0:
+        return returncode
+
+    def _read(self, **kwargs):
+        # all sensors and the WiFi are acquired at once, so nothing is held
+        # while waiting and others keep recording until then
+        logger.info("acquiring access to all sensors")
+        resources = set()
+        for sensor in self.proxy.sensors.values():
+            if sensor != self:
+                resources.update(sensor._lock.resources)
+        if self.proxy.wifi_mgr:
+            resources.add("wifi")
+        resources.difference_update(self._lock.resources)
+
+        sensors_lock = self.proxy.locks.lock(
+            resources, self._lock.priority, "{} (all sensors)".format(self.name))
+        sensors_lock.acquire()
+
+        window = UploadWindow(self.window_duration_s, self.window_bytes)
+        try:
+            if self.proxy.wifi_mgr:
+                logger.info("connecting to WiFi '{}'".format(self.wifi.ssid))
+                self.proxy.wifi_mgr.connect(self.wifi, locked=True)
+            else:
+                logger.info("WiFi is handled externally.")
+
+            try:
+                returncode = self._upload(window)
+            finally:
+                if self.proxy.wifi_mgr:
+                    logger.info("disconnecting from WiFi")
+                    self.proxy.wifi_mgr.disconnect()
+        finally:
+            # Call refresh on each Sensor.
+            # This will create new filenames for each FileSensor atm.
+            logger.debug("release locks to all sensors")
+            sensors_lock.release()
+
+        self.backlog = self.queue.backlog()
+        backlog_files = sum(c["files"] for c in self.backlog.values())
+        backlog_bytes = sum(c["bytes"] for c in self.backlog.values())
+
+        logger.info("{} files ({:.1f} MiB) uploaded at {:.1f} KiB/s, backlog: {}".format(
+            window.files, window.bytes / 1024**2, window.rate() / 1024,
+            ", ".join("{} {} files ({:.1f} MiB)".format(c["files"], name, c["bytes"] / 1024**2)
+                      for name, c in self.backlog.items()) or "none"))
+
+        # rsync removed the transferred files
+        if self.proxy.catalog:
+            self.proxy.catalog.mark_uploaded_missing(self.queue.root)
+
+        if returncode > 0 and returncode != 24:
             raise SensorNotAvailableException(
-                "rsync returned {}".format(p.returncode))
+                "rsync returned {}".format(returncode))
 
-        return [p.returncode]
+        completion = "incomplete" if returncode < 0 or backlog_files else "complete"
+        return [returncode, completion, window.files, window.bytes / 1024**2, window.rate() / 1024,
+                backlog_files, backlog_bytes / 1024**2]
@@ -30,23 +30,38 @@ class Sink(Sensor):
         self.input_directory = input_directory
 
     def _consume_influx(self, file_path: str, _hostname: str, _id: str, _class: str, _sensor: str):
+        """Publish a csv file on influx.
+
+        Returns:
+            bool: False if influx is not reachable and the file should be kept.
+        """
+
+        from sensorproxy.influx import is_connection_error
+
         if not file_path.endswith(".csv"):
             logger.debug("ignoring non-csv file")
-            return
+            return True
 
         logger.info("Sending {} to InfluxDB".format(file_path))
 
         try:
-            file_name = os.path.basename(file_path)
-            tags = self._parse_filename(file_name)
-
             self.proxy.influx.publish_csv(
                 csv_path=file_path,
+                _class=_class,
                 _hostname=_hostname,
-                **tags,
+                _id=_id,
+                _sensor=_sensor,
             )
         except Exception as e:
-            logger.warn("Publishing on infux failed: {}".format(e))
+            if is_connection_error(e):
+                logger.warn("Publishing on infux failed: {}".format(e))
+                return False
+
+            # retrying a malformed file fails again, so it is moved away
+            logger.error("Publishing {} on influx failed: {}".format(
+                file_path, e))
+
+        return True
 
     def record(self, influx_publish: bool = True, ** kwargs):
         if not os.path.isdir(self.input_directory):
@@ -69,31 +84,48 @@ class Sink(Sensor):
             except FileExistsError:
                 pass
 
-            for file_name in os.listdir(host_dir_input):
-                # skip files with leading . (probably currently rsynced)
-                if file_name.startswith("."):
-                    continue
-
-                file_path_incoming = os.path.join(host_dir_input, file_name)
-
-                # parse filename according to convention
-                _id, _class, _sensor = file_name.split("-")[:3]
-
-                # call the different consumers
-                if influx_publish:
-                    self._consume_influx(
-                        file_path_incoming, _hostname, _id, _class, _sensor)
-
-                # move the file away to avoid double-consumption
-                file_path = os.path.join(host_dir, file_name)
-                os.rename(file_path_incoming, file_path)
-
-            # remove empty folder
-            try:
-                os.rmdir(host_dir_input)
-            except OSError as e:
-                logger.info(
-                    "couldn't remove folder of {}: {}".format(_hostname, e))
+            # files are stored in subdirectories per class
+            for dir_path, dir_names, file_names in os.walk(host_dir_input, topdown=False):
+                for file_name in file_names:
+                    # skip files with leading . (probably currently rsynced)
+                    if file_name.startswith("."):
+                        continue
+
+                    file_path_incoming = os.path.join(dir_path, file_name)
+
+                    # parse filename according to convention
+                    metadata = self._parse_file_path(file_path_incoming)
+                    if metadata is None:
+                        logger.warn("ignoring unknown file '{}'".format(
+                            file_path_incoming))
+                        continue
+
+                    # call the different consumers
+                    if influx_publish:
+                        if not self._consume_influx(file_path_incoming, _hostname, metadata["_id"],
+                                                    metadata["_class"], metadata["_sensor"]):
+                            # keep the file to retry with the next metering
+                            continue
+
+                    # move the file away to avoid double-consumption
+                    file_path = os.path.join(
+                        host_dir, os.path.relpath(file_path_incoming, host_dir_input))
+                    try:
+                        os.makedirs(os.path.dirname(file_path))
+                    except FileExistsError:
+                        pass
+                    os.rename(file_path_incoming, file_path)
+
+                    if self.proxy.catalog:
+                        self.proxy.catalog.add(file_path, _hostname, metadata["_id"], metadata["_class"],
+                                               metadata["_sensor"], ts=metadata["ts"], ingested=influx_publish)
+
+                # remove empty folders
+                try:
+                    os.rmdir(dir_path)
+                except OSError as e:
+                    logger.info(
+                        "couldn't remove folder {} of {}: {}".format(dir_path, _hostname, e))
 
     def refresh(self):
         pass
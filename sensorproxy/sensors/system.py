@@ -1,19 +1,193 @@
 import time
 import logging
+import threading
 
-import psutil
-import gpiozero
+from collections import deque, namedtuple
+
+from pytimeparse import parse as parse_time
 
 from .base import register_sensor, Sensor, SensorNotAvailableException
 
 logger = logging.getLogger(__name__)
 
 
-@register_sensor
-class CPU(Sensor):
-    def __init__(self, *args, **kwargs):
+SystemSample = namedtuple("SystemSample", [
+    "ts",
+    "cpu_usage",
+    "cpu_temp",
+    "load_1",
+    "load_5",
+    "load_15",
+    "uptime",
+    "mem_available",
+    "mem_used",
+    "mem_free",
+])
+
+
+class SystemSampler:
+    """Background sampler of CPU, temperature, memory and load.
+
+    The /proc and sysfs files are kept open and sampled every `interval_s`
+    into a ring buffer, so readers only aggregate the buffered samples.
+    """
+
+    THERMAL_PATH = "/sys/class/thermal/thermal_zone0/temp"
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, interval_s: float = 1.0, size: int = 3600):
+        """
+        Args:
+            interval_s (float): seconds between two samples
+            size (int): number of samples kept in the ring buffer
+        """
+
+        self.interval_s = interval_s
+        self.samples = deque(maxlen=size)
+
+        self._stat = open("/proc/stat", "r")
+        self._meminfo = open("/proc/meminfo", "r")
+        self._loadavg = open("/proc/loadavg", "r")
+        self._uptime = open("/proc/uptime", "r")
+        try:
+            self._thermal = open(SystemSampler.THERMAL_PATH, "r")
+        except OSError as e:
+            logger.warn("CPU temperature is not available: {}".format(e))
+            self._thermal = None
+
+        self._cpu_last = self._read_cpu_times()
+        self._lock = threading.Lock()
+        # the open files and last CPU times are shared by the thread and readers
+        self._sample_lock = threading.Lock()
+        self._stop = threading.Event()
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def shared(cls, interval_s: float = 1.0, size: int = 3600):
+        """Get the sampler shared by all system sensors, starting it on first use."""
+
+        with cls._shared_lock:
+            if cls._shared is None:
+                logger.info(
+                    "starting system sampler every {}s".format(interval_s))
+                cls._shared = cls(interval_s, size)
+            elif cls._shared.interval_s != interval_s:
+                logger.warn("system sampler is already running every {}s, ignoring {}s".format(
+                    cls._shared.interval_s, interval_s))
+
+            return cls._shared
+
+    @staticmethod
+    def _reread(f):
+        f.seek(0)
+        return f.read()
+
+    def _read_cpu_times(self):
+        # first line: cpu user nice system idle iowait irq softirq steal ...
+        times = [int(t) for t in self._reread(self._stat).split("\n", 1)[0].split()[1:]]
+        idle = times[3] + times[4]
+        return sum(times), idle
+
+    def _read_meminfo(self):
+        meminfo = {}
+        for line in self._reread(self._meminfo).splitlines():
+            key, value = line.split(":", 1)
+            meminfo[key] = int(value.split()[0]) / 1024
+
+        free = meminfo["MemFree"]
+        cached = meminfo.get("Cached", 0) + meminfo.get("SReclaimable", 0)
+        used = meminfo["MemTotal"] - free - meminfo.get("Buffers", 0) - cached
+        available = meminfo.get("MemAvailable", free + cached)
+
+        return available, used, free
+
+    def sample(self):
+        """Take a single sample and append it to the buffer."""
+
+        with self._sample_lock:
+            return self._sample()
+
+    def _sample(self):
+        total, idle = self._read_cpu_times()
+        total_last, idle_last = self._cpu_last
+        self._cpu_last = (total, idle)
+        if total > total_last:
+            cpu_usage = 100.0 * (1.0 - (idle - idle_last) / (total - total_last))
+        else:
+            cpu_usage = 0.0
+
+        cpu_temp = None
+        if self._thermal:
+            cpu_temp = int(self._reread(self._thermal)) / 1000
+
+        load = [float(l) for l in self._reread(self._loadavg).split()[:3]]
+        uptime = float(self._reread(self._uptime).split()[0])
+
+        s = SystemSample(time.time(), round(cpu_usage, 3), cpu_temp,
+                         *load, uptime, *self._read_meminfo())
+        with self._lock:
+            self.samples.append(s)
+
+        return s
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            try:
+                self.sample()
+            except (OSError, ValueError) as e:
+                logger.warn("system sampling failed: {}".format(e))
+
+    def stop(self):
+        self._stop.set()
+
+    def window(self, since_ts: float = None):
+        """Buffered samples taken after `since_ts`, at least the latest sample."""
+
+        with self._lock:
+            samples = [s for s in self.samples
+                       if since_ts is None or s.ts > since_ts]
+
+        if not samples:
+            samples = [self.sample()]
+
+        return samples
+
+
+def _aggregate(values):
+    """Minimum, mean and maximum of the values, ignoring None."""
+
+    values = [v for v in values if v is not None]
+    if not values:
+        return None, None, None
+
+    return min(values), round(sum(values) / len(values), 3), max(values)
+
+
+class _SampledSensor(Sensor):
+    """Sensor aggregating the samples of the shared SystemSampler since its last read."""
+
+    def __init__(self, *args, sample_interval: str = "1s", sample_buffer: int = 3600, **kwargs):
         Sensor.__init__(self, *args, uses_height=False, **kwargs)
 
+        self.sampler = SystemSampler.shared(
+            parse_time(sample_interval), sample_buffer)
+        self._last_read_ts = None
+
+    # the sampler thread is not running in worker processes
+    _isolatable = False
+
+    def _window(self):
+        samples = self.sampler.window(self._last_read_ts)
+        self._last_read_ts = samples[-1].ts
+        return samples
+
+
+@register_sensor
+class CPU(_SampledSensor):
     _header_sensor = [
         "CPU Usage (%)",
         "CPU Temperature (°C)",
@@ -21,43 +195,52 @@ class CPU(Sensor):
         "Load Average (5)",
         "Load Average (15)",
         "Uptime (s)",
+        "CPU Usage Min (%)",
+        "CPU Usage Max (%)",
+        "CPU Temperature Min (°C)",
+        "CPU Temperature Max (°C)",
+        "Samples",
     ]
 
     def _read(self, **kwargs):
-        logger.debug("Reading CPU usage using psutil")
-        cpu_usage = psutil.cpu_percent()
-
-        logger.debug("Reading Load Average using psutil")
-        load_avg = psutil.getloadavg()
+        logger.debug("Aggregating CPU samples")
+        samples = self._window()
+        latest = samples[-1]
 
-        logger.debug("Reading CPU temperature using gpiozero")
-        cpu_temp = gpiozero.CPUTemperature().temperature
-
-        logger.debug("Reading uptime from /proc/uptime")
-        with open('/proc/uptime', 'r') as uptime_file:
-            uptime = float(uptime_file.readline().split()[0])
+        usage_min, usage_mean, usage_max = _aggregate(
+            s.cpu_usage for s in samples)
+        temp_min, temp_mean, temp_max = _aggregate(
+            s.cpu_temp for s in samples)
+        load_avg = [latest.load_1, latest.load_5, latest.load_15]
 
         logger.info("Read {}% CPU usage at {}°C, load: {}".format(
-            cpu_usage, cpu_temp, load_avg))
+            usage_mean, temp_mean, load_avg))
 
-        return [cpu_usage, cpu_temp, *load_avg, uptime]
+        return [usage_mean, temp_mean, *load_avg, latest.uptime,
+                usage_min, usage_max, temp_min, temp_max, len(samples)]
 
 
 @register_sensor
-class Memory(Sensor):
-    def __init__(self, *args, **kwargs):
-        Sensor.__init__(self, *args, uses_height=False, **kwargs)
-
+class Memory(_SampledSensor):
     _header_sensor = [
         "Memory Available (MiB)",
         "Memory Used (MiB)",
         "Memory Free (MiB)",
+        "Memory Available Min (MiB)",
+        "Memory Used Max (MiB)",
+        "Samples",
     ]
 
     def _read(self, **kwargs):
-        logger.debug("Reading Memory usage using psutil")
+        logger.debug("Aggregating memory samples")
+        samples = self._window()
+
+        available_min, available_mean, _ = _aggregate(
+            s.mem_available for s in samples)
+        _, used_mean, used_max = _aggregate(s.mem_used for s in samples)
+        _, free_mean, _ = _aggregate(s.mem_free for s in samples)
 
-        m = psutil.virtual_memory()
-        logger.info("Read {}% memory in usage".format(m.percent))
+        logger.info("Read {} MiB memory in use".format(used_mean))
 
-        return [m.available / 1024**2, m.used / 1024**2, m.free / 1024**2]
+        return [available_mean, used_mean, free_mean,
+                available_min, used_max, len(samples)]
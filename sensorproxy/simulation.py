@@ -0,0 +1,518 @@
+"""Simulated hardware, to run the sensorproxy off-device.
+
+`install` registers fake versions of the hardware libraries (`RPi.GPIO`,
+`smbus`, `picamera`, `Adafruit_DHT`, `tsl2561`, `w1thermsensor`) in
+`sys.modules`. As sensor modules are imported only once a sensor of their
+type is configured, installing the simulation before the sensors are
+initialized is sufficient. The `LiftSimulator` answers the UDP protocol of
+the LiftSystem and drives the simulated hall sensor pins.
+"""
+
+import logging
+import os
+import random
+import socket
+import struct
+import sys
+import threading
+import time
+import types
+
+from pytimeparse import parse as parse_time
+
+logger = logging.getLogger(__name__)
+
+# environment variable enabling the simulation with default settings
+ENVIRONMENT_VARIABLE = "SENSORPROXY_SIMULATION"
+
+
+def _noisy(value: float, noise: float):
+    return value + random.uniform(-noise, noise)
+
+
+class _Failing:
+    """Raises the given exception with the configured probability."""
+
+    def __init__(self, failure_rate: float):
+        self.failure_rate = failure_rate
+
+    def maybe_fail(self, exception: Exception):
+        if random.random() < self.failure_rate:
+            raise exception
+
+
+class SimulatedGPIO:
+    """RPi.GPIO replacement with scripted input levels.
+
+    Input levels are either constant, scripted as edges `[[seconds, level], ...]`
+    relative to the start of the simulation, optionally repeating every
+    `period`, or provided by a callable (e.g. the lift simulator).
+    """
+
+    BCM = 11
+    BOARD = 10
+    IN = 1
+    OUT = 0
+    HIGH = 1
+    LOW = 0
+    PUD_UP = 22
+    PUD_DOWN = 21
+
+    def __init__(self, pins: dict = {}):
+        """
+        Args:
+            pins (dict): pin number to level, edge list or {edges, period}
+        """
+
+        self.start_ts = time.time()
+        self.mode = None
+        self.directions = {}
+        self.outputs = {}
+        self._inputs = {}
+
+        for pin, script in pins.items():
+            self.script(int(pin), script)
+
+    def script(self, pin: int, script):
+        """Set the input level of a pin, see class documentation."""
+
+        if callable(script):
+            self._inputs[pin] = script
+            return
+
+        if isinstance(script, int):
+            script = [[0, script]]
+        period_s = None
+        if isinstance(script, dict):
+            period_s = parse_time(str(script["period"])) \
+                if "period" in script else None
+            script = script["edges"]
+
+        edges = sorted((parse_time(str(ts)) if isinstance(ts, str) else ts, level)
+                       for ts, level in script)
+
+        def level():
+            elapsed_s = time.time() - self.start_ts
+            if period_s:
+                elapsed_s %= period_s
+
+            current = 0
+            for ts, edge_level in edges:
+                if ts > elapsed_s:
+                    break
+                current = edge_level
+            return current
+
+        self._inputs[pin] = level
+
+    # RPi.GPIO interface
+
+    def setmode(self, mode):
+        self.mode = mode
+
+    def setwarnings(self, flag):
+        pass
+
+    def setup(self, pin, direction, **kwargs):
+        self.directions[pin] = direction
+
+    def input(self, pin):
+        if pin in self.outputs:
+            return self.outputs[pin]
+        if pin in self._inputs:
+            return int(self._inputs[pin]())
+        return SimulatedGPIO.LOW
+
+    def output(self, pin, value):
+        self.outputs[pin] = int(value)
+
+    def cleanup(self, *args):
+        self.directions.clear()
+        self.outputs.clear()
+
+
+class SimulatedSMBus:
+    """smbus.SMBus replacement backed by per-device register maps."""
+
+    registers = {}
+
+    def __init__(self, bus_id: int):
+        self.bus_id = bus_id
+        self.writes = 0
+
+    def _device(self, address: int):
+        devices = SimulatedSMBus.registers.setdefault(self.bus_id, {})
+        if address not in devices:
+            raise OSError(121, "Remote I/O error (no device at {:#x})".format(address))
+        return devices[address]
+
+    def write_byte_data(self, address, register, value):
+        self._device(address)[register] = value
+        self.writes += 1
+
+    def write_i2c_block_data(self, address, register, values):
+        device = self._device(address)
+        for offset, value in enumerate(values):
+            device[register + offset] = value
+        self.writes += 1
+
+    def read_byte_data(self, address, register):
+        return self._device(address).get(register, 0)
+
+    def read_word_data(self, address, register):
+        device = self._device(address)
+        return device.get(register, 0) | (device.get(register + 1, 0) << 8)
+
+    def read_i2c_block_data(self, address, register, length):
+        device = self._device(address)
+        return [device.get(register + offset, 0) for offset in range(length)]
+
+    def close(self):
+        pass
+
+
+def _jpeg(width: int, height: int) -> bytes:
+    """Encode a uniformly gray baseline JPEG of the given size.
+
+    Every 8x8 block consists of a zero DC difference and an end-of-block
+    code, each encoded with a single one-bit Huffman code.
+    """
+
+    def segment(marker, payload):
+        return struct.pack(">BBH", 0xFF, marker, len(payload) + 2) + payload
+
+    blocks = ((width + 7) // 8) * ((height + 7) // 8)
+    bits = "0" * (2 * blocks)
+    scan = int(bits + "1" * (-len(bits) % 8), 2).to_bytes(
+        (len(bits) + 7) // 8, "big")
+
+    return b"".join([
+        b"\xff\xd8",
+        segment(0xDB, b"\x00" + b"\x01" * 64),
+        segment(0xC0, struct.pack(">BHHBBBB", 8, height, width, 1, 1, 0x11, 0)),
+        segment(0xC4, b"\x00" + b"\x01" + b"\x00" * 15 + b"\x00"),
+        segment(0xC4, b"\x10" + b"\x01" + b"\x00" * 15 + b"\x00"),
+        segment(0xDA, b"\x01\x01\x00\x00\x3f\x00"),
+        scan,
+        b"\xff\xd9",
+    ])
+
+
+class SimulatedCamera:
+    """picamera.PiCamera replacement, capturing synthetic images after a latency."""
+
+    latency_s = 0.5
+    brightness = 128
+    noise = 8
+    failing = _Failing(0.0)
+
+    def __init__(self, *args, **kwargs):
+        self.resolution = (1024, 768)
+        self.framerate = 30
+        self.iso = 0
+        self.shutter_speed = 0
+        self.exposure_mode = "auto"
+        self.awb_mode = "auto"
+        self.led = False
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.closed = True
+
+    def start_preview(self, *args, **kwargs):
+        pass
+
+    def stop_preview(self):
+        pass
+
+    def _raw(self, width: int, height: int, channels: float):
+        level = int(_noisy(SimulatedCamera.brightness, SimulatedCamera.noise))
+        level = max(0, min(255, level))
+        return bytes([level]) * int(width * height * channels)
+
+    def capture(self, output, format: str = "jpeg", resize=None, **kwargs):
+        import picamera
+
+        SimulatedCamera.failing.maybe_fail(
+            picamera.exc.PiCameraMMALError("simulated camera failure"))
+        time.sleep(SimulatedCamera.latency_s)
+
+        width, height = resize or self.resolution
+        if format == "yuv":
+            # planes are padded to multiples of 32 x 16 pixels
+            width, height = (width + 31) // 32 * 32, (height + 15) // 16 * 16
+            data = self._raw(width, height, 1.5)
+        elif format in ["rgb", "bgr"]:
+            data = self._raw(width, height, 3)
+        else:
+            data = _jpeg(width, height)
+
+        if isinstance(output, str):
+            with open(output, "wb") as output_file:
+                output_file.write(data)
+        else:
+            output.write(data)
+
+
+class SimulatedW1Probe:
+    """w1thermsensor.W1ThermSensor replacement."""
+
+    probes = []
+    temperature = 20.0
+    noise = 0.5
+    conversion_s = 0.75
+    failing = _Failing(0.0)
+
+    def __init__(self, sensor_type=None, sensor_id: str = None):
+        self.id = sensor_id
+
+    @classmethod
+    def get_available_sensors(cls, types=None):
+        return [cls(sensor_id=probe_id) for probe_id in cls.probes]
+
+    def get_temperature(self, unit=None):
+        import w1thermsensor
+
+        SimulatedW1Probe.failing.maybe_fail(
+            w1thermsensor.SensorNotReadyError(self.id))
+        time.sleep(SimulatedW1Probe.conversion_s)
+        return _noisy(SimulatedW1Probe.temperature, SimulatedW1Probe.noise)
+
+
+class SimulatedTSL2561:
+    """tsl2561.TSL2561 replacement."""
+
+    broadband = 1200
+    ir = 300
+    noise = 20
+    failing = _Failing(0.0)
+
+    def __init__(self, address=None, busnum=None, **kwargs):
+        self.busnum = busnum
+
+    def _get_luminosity(self):
+        SimulatedTSL2561.failing.maybe_fail(OSError(121, "Remote I/O error"))
+        broadband = max(0, int(_noisy(
+            SimulatedTSL2561.broadband, SimulatedTSL2561.noise)))
+        ir = max(0, int(_noisy(SimulatedTSL2561.ir, SimulatedTSL2561.noise)))
+        return broadband, ir
+
+    def _calculate_lux(self, broadband, ir):
+        return max(0, int(broadband - 1.5 * ir))
+
+    def lux(self):
+        return self._calculate_lux(*self._get_luminosity())
+
+
+class SimulatedDHT:
+    """Adafruit_DHT replacement."""
+
+    temperature = 20.0
+    humidity = 60.0
+    noise = 0.5
+    failure_rate = 0.0
+
+    DHT11 = 11
+    DHT22 = 22
+    AM2302 = 22
+
+    @classmethod
+    def read(cls, sensor, pin):
+        if random.random() < cls.failure_rate:
+            return None, None
+        return _noisy(cls.humidity, cls.noise), _noisy(cls.temperature, cls.noise)
+
+    @classmethod
+    def read_retry(cls, sensor, pin, retries=15, delay_seconds=2):
+        return cls.read(sensor, pin)
+
+
+class LiftSimulator:
+    """UDP server answering the LiftSystem protocol, moving a simulated lift.
+
+    Speed commands move the lift by `speed / 255` of its full speed, the lift
+    stops if no command is received within the configured timeout. The hall
+    sensor pins of the simulated GPIO report the ends of the rope.
+    """
+
+    def __init__(self, gpio: SimulatedGPIO, height: float, travel_time: str = "20s",
+                 host: str = "127.0.0.1", port: int = 0,
+                 hall_bottom_pin: int = 5, hall_top_pin: int = 6):
+        """
+        Args:
+            gpio (SimulatedGPIO): GPIO to attach the hall sensors to
+            height (float): height of the lift
+            travel_time (str): time to travel the full height
+            host (str): address to listen on
+            port (int): port to listen on, 0 picks a free port
+        """
+
+        self.height = height
+        self.travel_time_s = parse_time(travel_time)
+
+        self.position_m = 0.0
+        self.speed = 0
+        self.timeout_s = 0.5
+
+        self._last_command_ts = time.time()
+        self._updated_ts = time.time()
+        self._lock = threading.Lock()
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        self.address = self.sock.getsockname()
+
+        gpio.script(hall_bottom_pin, lambda: self.position() <= 0.0)
+        gpio.script(hall_top_pin, lambda: self.position() >= self.height)
+
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+        logger.info("simulating lift of {}m at {}:{}".format(
+            height, *self.address))
+
+    def position(self):
+        """Current position of the lift in meters."""
+
+        with self._lock:
+            now = time.time()
+            # the motor controller stops after the timeout
+            moving_until = min(now, self._last_command_ts + self.timeout_s)
+            moving_s = max(0.0, moving_until - self._updated_ts)
+            self._updated_ts = now
+
+            speed_mps = self.speed / 255 * self.height / self.travel_time_s
+            self.position_m = min(self.height, max(
+                0.0, self.position_m + speed_mps * moving_s))
+            if moving_until < now:
+                self.speed = 0
+
+            return self.position_m
+
+    def _serve(self):
+        while True:
+            data, address = self.sock.recvfrom(1024)
+            argv = data.decode().split()
+            if len(argv) != 2:
+                continue
+
+            self.position()
+            with self._lock:
+                if argv[0] == "speed":
+                    self.speed = max(-255, min(255, int(argv[1])))
+                elif argv[0] == "timeout":
+                    self.timeout_s = int(argv[1]) / 1000
+                else:
+                    continue
+                self._last_command_ts = time.time()
+
+            self.sock.sendto("{} {}\n".format(*argv).encode(), address)
+
+
+def _module(name: str, **attributes):
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    module.__simulated__ = True
+    return module
+
+
+def install(gpio: dict = {}, i2c: dict = {}, camera: dict = {}, w1: dict = {},
+            dht: dict = {}, tsl2561: dict = {}, failure_rate: float = 0.0, **kwargs):
+    """Register the simulated hardware libraries in `sys.modules`.
+
+    Args:
+        gpio (dict): scripted input pins, see SimulatedGPIO
+        i2c (dict): register maps by bus and device address, e.g. {1: {0x70: {}}}
+        camera (dict): capture `latency`, image `brightness` and `noise`
+        w1 (dict): 1-Wire `probes` (count or list of IDs), `temperature`, `noise`
+        dht (dict): `temperature`, `humidity` and `noise` of the DHT sensors
+        tsl2561 (dict): `broadband`, `ir` and `noise` of the TSL2561
+        failure_rate (float): probability of a failing read
+
+    Returns:
+        SimulatedGPIO: the simulated GPIO, e.g. to script further pins
+    """
+
+    simulated_gpio = SimulatedGPIO(gpio)
+
+    SimulatedSMBus.registers = {
+        int(bus): {int(address): {int(reg): val for reg, val in (registers or {}).items()}
+                   for address, registers in devices.items()}
+        for bus, devices in i2c.items()}
+
+    SimulatedCamera.latency_s = parse_time(str(camera.get("latency", "0.5s")))
+    SimulatedCamera.brightness = camera.get("brightness", 128)
+    SimulatedCamera.noise = camera.get("noise", 8)
+    SimulatedCamera.failing = _Failing(failure_rate)
+
+    probes = w1.get("probes", 2)
+    if isinstance(probes, int):
+        probes = ["{:012x}".format(0x0417c1a1b2ff + num)
+                  for num in range(probes)]
+    SimulatedW1Probe.probes = probes
+    SimulatedW1Probe.temperature = w1.get("temperature", 20.0)
+    SimulatedW1Probe.noise = w1.get("noise", 0.5)
+    SimulatedW1Probe.failing = _Failing(failure_rate)
+
+    SimulatedDHT.temperature = dht.get("temperature", 20.0)
+    SimulatedDHT.humidity = dht.get("humidity", 60.0)
+    SimulatedDHT.noise = dht.get("noise", 0.5)
+    SimulatedDHT.failure_rate = failure_rate
+
+    SimulatedTSL2561.broadband = tsl2561.get("broadband", 1200)
+    SimulatedTSL2561.ir = tsl2561.get("ir", 300)
+    SimulatedTSL2561.noise = tsl2561.get("noise", 20)
+    SimulatedTSL2561.failing = _Failing(failure_rate)
+
+    gpio_module = _module("RPi.GPIO", **{
+        name: getattr(simulated_gpio, name) for name in dir(simulated_gpio)
+        if not name.startswith("_")})
+
+    class PiCameraError(Exception):
+        pass
+
+    class PiCameraMMALError(PiCameraError):
+        pass
+
+    class NoSensorFoundError(Exception):
+        pass
+
+    class SensorNotReadyError(Exception):
+        pass
+
+    camera_exc = _module("picamera.exc", PiCameraError=PiCameraError,
+                         PiCameraMMALError=PiCameraMMALError)
+
+    sys.modules.update({
+        "RPi": _module("RPi", GPIO=gpio_module),
+        "RPi.GPIO": gpio_module,
+        "smbus": _module("smbus", SMBus=SimulatedSMBus),
+        "picamera": _module("picamera", PiCamera=SimulatedCamera, exc=camera_exc),
+        "picamera.exc": camera_exc,
+        "w1thermsensor": _module("w1thermsensor", W1ThermSensor=SimulatedW1Probe,
+                                 NoSensorFoundError=NoSensorFoundError,
+                                 SensorNotReadyError=SensorNotReadyError),
+        "tsl2561": _module("tsl2561", TSL2561=SimulatedTSL2561),
+        "Adafruit_DHT": _module("Adafruit_DHT", **{
+            name: getattr(SimulatedDHT, name) for name in ["DHT11", "DHT22", "AM2302", "read", "read_retry"]}),
+    })
+
+    logger.warn("hardware is simulated")
+    return simulated_gpio
+
+
+def enabled(simulation=None):
+    """Simulation settings from the configuration or the environment, None if disabled."""
+
+    if simulation is None and os.environ.get(ENVIRONMENT_VARIABLE, "0") not in ["", "0"]:
+        simulation = {}
+    if simulation is True:
+        simulation = {}
+
+    return simulation if simulation is not False else None
@@ -0,0 +1,285 @@
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class InfluxSpool:
+    """Disk-backed store for points that could not be written to InfluxDB.
+
+    Writes are appended as JSON lines to segment files. Full segments are
+    closed and a new one is started; if the spool exceeds its size, the
+    oldest segments are evicted. Points rejected by the server are moved to
+    the `quarantine` directory, to be inspected instead of retried.
+    """
+
+    SEGMENT_EXT = ".jsonl"
+    QUARANTINE_DIR = "quarantine"
+
+    def __init__(self, path: str, max_size_mib: float = 64, segment_size_mib: float = 1):
+        """
+        Args:
+            path (str): directory to store the segments in
+            max_size_mib (float): maximum size of the spool
+            segment_size_mib (float): size after which a segment is closed
+        """
+
+        self.path = path
+        self.max_size = int(max_size_mib * 1024**2)
+        self.segment_size = int(segment_size_mib * 1024**2)
+
+        try:
+            os.makedirs(path)
+        except FileExistsError:
+            pass
+
+        self._lock = threading.Lock()
+
+        self.points = 0
+        self.evicted_points = 0
+        self.quarantined_points = 0
+        for segment in self.segments():
+            self.points += sum(e["count"] for e in self._read_segment(segment))
+
+        segments = self.segments()
+        self._seq = int(os.path.basename(segments[-1]).split(".")[0]) + 1 \
+            if segments else 0
+
+        if self.points:
+            logger.info("Spool at '{}' contains {} points".format(
+                path, self.points))
+
+    def segments(self):
+        """Paths of all segments, oldest first."""
+
+        return sorted(os.path.join(self.path, name) for name in os.listdir(self.path)
+                      if name.endswith(InfluxSpool.SEGMENT_EXT))
+
+    def _segment_path(self, seq):
+        return os.path.join(self.path, "{:012d}{}".format(seq, InfluxSpool.SEGMENT_EXT))
+
+    @staticmethod
+    def _read_segment(segment):
+        entries = []
+        with open(segment, "r") as segment_file:
+            for line in segment_file:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # an interrupted append leaves a partial line
+                    logger.warn("Skipping corrupt line in '{}'".format(segment))
+
+        return entries
+
+    def size(self):
+        return sum(os.path.getsize(s) for s in self.segments())
+
+    def append(self, points: [dict], tags: dict, time_precision: str):
+        """Append points to the current segment."""
+
+        line = json.dumps({
+            "ts": time.time(),
+            "count": len(points),
+            "points": points,
+            "tags": tags,
+            "time_precision": time_precision,
+        }, default=str) + "\n"
+
+        with self._lock:
+            segment = self._segment_path(self._seq)
+            with open(segment, "a") as segment_file:
+                segment_file.write(line)
+                segment_file.flush()
+                os.fsync(segment_file.fileno())
+
+            self.points += len(points)
+            if os.path.getsize(segment) >= self.segment_size:
+                self._seq += 1
+
+            self._evict()
+
+        logger.info("Spooled {} points".format(len(points)))
+
+    def _evict(self):
+        segments = self.segments()
+        size = sum(os.path.getsize(s) for s in segments)
+
+        # the current segment is never evicted
+        for segment in segments[:-1]:
+            if size <= self.max_size:
+                break
+
+            count = sum(e["count"] for e in self._read_segment(segment))
+            size -= os.path.getsize(segment)
+            os.remove(segment)
+
+            self.points -= count
+            self.evicted_points += count
+            logger.warn("Spool is full, evicted {} points of '{}'".format(
+                count, segment))
+
+    def take_oldest(self):
+        """Close and read the oldest segment.
+
+        Returns:
+            (str, [dict]): path and entries of the segment, None if empty
+        """
+
+        with self._lock:
+            segments = self.segments()
+            if not segments:
+                return None
+
+            # start a new segment, so the oldest is not appended anymore
+            if segments[0] == self._segment_path(self._seq):
+                self._seq += 1
+
+            return segments[0], self._read_segment(segments[0])
+
+    def remove(self, segment: str, entries: [dict]):
+        """Remove a replayed segment."""
+
+        with self._lock:
+            os.remove(segment)
+            self.points -= sum(e["count"] for e in entries)
+
+    def quarantine(self, segment: str, entries: [dict]):
+        """Keep entries rejected by the server, named by the segment they were spooled in."""
+
+        quarantine_path = os.path.join(self.path, InfluxSpool.QUARANTINE_DIR)
+        os.makedirs(quarantine_path, exist_ok=True)
+
+        with self._lock:
+            with open(os.path.join(quarantine_path, os.path.basename(segment)), "a") as quarantine_file:
+                for entry in entries:
+                    quarantine_file.write(json.dumps(entry, default=str) + "\n")
+
+            count = sum(e["count"] for e in entries)
+            self.quarantined_points += count
+
+        logger.error("Moved {} points rejected by influx to '{}'".format(
+            count, quarantine_path))
+
+    def oldest_age_s(self):
+        """Age of the oldest spooled point in seconds, None if empty."""
+
+        for segment in self.segments():
+            entries = self._read_segment(segment)
+            if entries:
+                return time.time() - entries[0]["ts"]
+
+        return None
+
+    def stats(self):
+        segments = self.segments()
+        return {
+            "points": self.points,
+            "segments": len(segments),
+            "size_bytes": sum(os.path.getsize(s) for s in segments),
+            "oldest_age_s": self.oldest_age_s(),
+            "evicted_points": self.evicted_points,
+            "quarantined_points": self.quarantined_points,
+        }
+
+
+class SpoolReplayer:
+    """Drains an InfluxSpool in the background, backing off exponentially while writes fail."""
+
+    def __init__(self, spool: InfluxSpool, write, interval_s: float = 10, max_backoff_s: float = 600,
+                 rejected=None):
+        """
+        Args:
+            spool (InfluxSpool): spool to drain
+            write (callable): writes points, called with points, tags and time_precision
+            interval_s (float): delay between checks of an empty spool
+            max_backoff_s (float): maximum delay after failed writes
+            rejected (callable): returns whether an exception of `write` rejects the
+                points for good, so they are quarantined instead of retried
+        """
+
+        self.spool = spool
+        self.write = write
+        self.rejected = rejected or (lambda e: False)
+        self.interval_s = interval_s
+        self.max_backoff_s = max_backoff_s
+
+        self.replayed_points = 0
+        self.replay_rate = None
+        self.failures = 0
+
+        self._wakeup = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def wakeup(self):
+        self._wakeup.set()
+
+    def _replay_segment(self):
+        taken = self.spool.take_oldest()
+        if taken is None:
+            return False
+
+        segment, entries = taken
+        start_ts = time.time()
+
+        # group entries sharing tags and precision into batch writes
+        batches = {}
+        for entry in entries:
+            key = (json.dumps(entry["tags"], sort_keys=True),
+                   entry["time_precision"])
+            batches.setdefault(key, []).append(entry)
+
+        rejected = 0
+        for (tags, time_precision), batch in batches.items():
+            points = [point for entry in batch for point in entry["points"]]
+            try:
+                self.write(points=points, tags=json.loads(tags),
+                           time_precision=time_precision)
+            except Exception as e:
+                if not self.rejected(e):
+                    raise
+                logger.error("Influx rejected {} spooled points: {}".format(
+                    len(points), e))
+                self.spool.quarantine(segment, batch)
+                rejected += len(points)
+
+        self.spool.remove(segment, entries)
+        count = sum(e["count"] for e in entries) - rejected
+
+        duration_s = max(time.time() - start_ts, 1e-6)
+        self.replayed_points += count
+        self.replay_rate = count / duration_s
+        logger.info("Replayed {} spooled points ({} points/s), {} remaining".format(
+            count, round(self.replay_rate), self.spool.points))
+
+        return True
+
+    def _run(self):
+        backoff_s = self.interval_s
+
+        while True:
+            try:
+                while self._replay_segment():
+                    pass
+                backoff_s = self.interval_s
+            except Exception as e:
+                # the segment is kept and replayed again as a whole
+                self.failures += 1
+                backoff_s = min(backoff_s * 2, self.max_backoff_s)
+                logger.warn("Replaying spool failed, retrying in {}s: {}".format(
+                    backoff_s, e))
+
+            self._wakeup.wait(backoff_s)
+            self._wakeup.clear()
+
+    def stats(self):
+        stats = self.spool.stats()
+        stats.update({
+            "replayed_points": self.replayed_points,
+            "replay_rate": self.replay_rate,
+            "replay_failures": self.failures,
+        })
+        return stats
@@ -0,0 +1,241 @@
+import logging
+import os
+import shutil
+import threading
+import time
+
+from pytimeparse import parse as parse_time
+
+from sensorproxy.bus import Subscriber
+from sensorproxy.upload import UploadQueue
+
+logger = logging.getLogger(__name__)
+
+
+class StorageManager:
+    """Bounds the size of the node's data directory.
+
+    File sizes are kept in an index, built by a single directory walk and
+    updated incrementally when CSV rows are written, from the files of
+    readings on the bus and after uploads. If the
+    indexed size exceeds `high_watermark` of the quota or the free disk
+    space drops below `min_free_mib`, files are evicted until the size is
+    below `low_watermark`:
+
+    1. files already uploaded according to the catalog, oldest first
+    2. files of the lowest priority class (see UploadQueue), oldest first
+
+    Files of protected classes (by default unsent CSV data) are never evicted.
+    """
+
+    def __init__(self, root: str, quota_mib: float, catalog=None, high_watermark: float = 0.9,
+                 low_watermark: float = 0.8, min_free_mib: float = 100, check_interval: str = "1m",
+                 rescan_interval: str = "1d", protect: [str] = ["data"], classes: {str: [str]} = None):
+        """
+        Args:
+            root (str): directory to manage
+            quota_mib (float): maximum size of the directory
+            catalog (Catalog): catalog providing the upload state of files
+            high_watermark (float): fraction of the quota starting an eviction
+            low_watermark (float): fraction of the quota an eviction stops at
+            min_free_mib (float): free disk space starting an eviction
+            check_interval (str): interval between checks of the watermarks
+            rescan_interval (str): interval between walks correcting the index
+            protect ([str]): classes of files never evicted unless uploaded
+            classes ({str: [str]}): file extensions by class, most important first
+        """
+
+        if not 0 < low_watermark <= high_watermark <= 1:
+            raise ValueError("watermarks must satisfy 0 < low ({}) <= high ({}) <= 1".format(
+                low_watermark, high_watermark))
+
+        self.root = root
+        self.quota_bytes = int(quota_mib * 1024**2)
+        self.catalog = catalog
+        self.high_bytes = int(high_watermark * self.quota_bytes)
+        self.low_bytes = int(low_watermark * self.quota_bytes)
+        self.min_free_bytes = int(min_free_mib * 1024**2)
+        self.check_interval_s = parse_time(check_interval)
+        self.rescan_interval_s = parse_time(rescan_interval)
+        self.protect = set(protect)
+        self.queue = UploadQueue(root, classes=classes)
+
+        self.used_bytes = 0
+        self.evicted_files = 0
+        self.evicted_bytes = 0
+        self.evicted_by_class = {}
+        self.last_eviction_ts = None
+
+        # size, age and class of each file, by absolute path
+        self._index = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+
+        self.rescan()
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+        logger.info("storage quota of {:.0f} MiB for '{}', {:.0f} MiB used".format(
+            quota_mib, root, self.used_bytes / 1024**2))
+
+    def rescan(self):
+        """Rebuild the index by walking the directory."""
+
+        index = {}
+        for file in self.queue.pending():
+            path = os.path.join(self.root, file["path"])
+            index[path] = file
+
+        with self._lock:
+            self._index = index
+            self.used_bytes = sum(f["size"] for f in index.values())
+
+    def update(self, paths: [str]):
+        """Update the index for written, uploaded or removed files."""
+
+        with self._lock:
+            for path in paths:
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    file = self._index.pop(path, None)
+                    if file:
+                        self.used_bytes -= file["size"]
+                    continue
+
+                file = self._index.get(path)
+                if file is None:
+                    rank, name = self.queue.classify(path)
+                    file = {"path": os.path.relpath(path, self.root), "size": 0,
+                            "rank": rank, "class": name}
+                    self._index[path] = file
+
+                self.used_bytes += stat.st_size - file["size"]
+                file["size"] = stat.st_size
+                file["mtime"] = stat.st_mtime
+
+        if self.used_bytes > self.high_bytes:
+            self._wakeup.set()
+
+    def free_bytes(self) -> int:
+        return shutil.disk_usage(self.root).free
+
+    def _candidates(self):
+        """Evictable files in eviction order."""
+
+        uploaded = set()
+        if self.catalog:
+            uploaded = {row["path"] for row in self.catalog.query(
+                path_prefix=self.root, uploaded=True)}
+
+        with self._lock:
+            files = [(path, file) for path, file in self._index.items()
+                     if path in uploaded or file["class"] not in self.protect]
+
+        return sorted(files, key=lambda f: (f[0] not in uploaded, -f[1]["rank"], f[1]["mtime"]))
+
+    def _evict(self, path: str, file: dict):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error("Evicting '{}' failed: {}".format(path, e))
+            return
+
+        with self._lock:
+            if self._index.pop(path, None) is not None:
+                self.used_bytes -= file["size"]
+
+            self.evicted_files += 1
+            self.evicted_bytes += file["size"]
+            self.evicted_by_class[file["class"]] = self.evicted_by_class.get(
+                file["class"], 0) + 1
+            self.last_eviction_ts = time.time()
+
+        if self.catalog:
+            self.catalog.remove(path)
+
+    def check(self):
+        """Evict files if a watermark is exceeded.
+
+        Returns:
+            int: number of evicted files
+        """
+
+        low_on_disk = self.free_bytes() < self.min_free_bytes
+        if self.used_bytes <= self.high_bytes and not low_on_disk:
+            return 0
+
+        logger.warn("storage {:.0f} of {:.0f} MiB used, {:.0f} MiB free on disk, evicting files".format(
+            self.used_bytes / 1024**2, self.quota_bytes / 1024**2, self.free_bytes() / 1024**2))
+
+        evicted = 0
+        freed_bytes = 0
+        for path, file in self._candidates():
+            if self.used_bytes <= self.low_bytes and self.free_bytes() >= self.min_free_bytes:
+                break
+
+            self._evict(path, file)
+            evicted += 1
+            freed_bytes += file["size"]
+
+        if self.used_bytes > self.low_bytes:
+            logger.error("storage is still above the low watermark, {:.0f} MiB of protected files".format(
+                self.used_bytes / 1024**2))
+
+        logger.info("evicted {} files ({:.1f} MiB)".format(
+            evicted, freed_bytes / 1024**2))
+        return evicted
+
+    def _run(self):
+        rescan_ts = time.time()
+
+        while True:
+            self._wakeup.wait(self.check_interval_s)
+            self._wakeup.clear()
+
+            try:
+                if time.time() - rescan_ts > self.rescan_interval_s:
+                    rescan_ts = time.time()
+                    self.rescan()
+
+                self.check()
+            except Exception as e:
+                logger.error("Storage check failed: {}".format(e))
+
+    def subscriber(self) -> Subscriber:
+        """Subscriber updating the index with the files of FileSensors."""
+
+        return _StorageIndexer(self)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "quota_mib": self.quota_bytes / 1024**2,
+                "used_mib": self.used_bytes / 1024**2,
+                "free_mib": self.free_bytes() / 1024**2,
+                "files": len(self._index),
+                "evicted_files": self.evicted_files,
+                "evicted_mib": self.evicted_bytes / 1024**2,
+                "evicted_by_class": dict(self.evicted_by_class),
+                "last_eviction_ts": self.last_eviction_ts,
+            }
+
+
+class _StorageIndexer(Subscriber):
+    def __init__(self, storage: StorageManager):
+        self.storage = storage
+        Subscriber.__init__(self, "storage")
+
+    def accepts(self, reading) -> bool:
+        # CSV files are updated by the sensors writing them
+        return "File path" in reading.sensor._header_sensor and Subscriber.accepts(self, reading)
+
+    def handle(self, reading):
+        sensor = reading.sensor
+        sensor_file_path = reading.reading[sensor._header_sensor.index(
+            "File path")]
+        if sensor_file_path:
+            self.storage.update([sensor_file_path])
@@ -0,0 +1,151 @@
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# priority classes by file extension, most important first
+DEFAULT_CLASSES = {
+    "data": ["csv", "txt", "json"],
+    "images": ["jpeg", "jpg", "png", "yuv", "rgb", "bgr", "h264"],
+    "audio": ["wav", "flac", "mp3"],
+}
+
+
+class UploadQueue:
+    """Pending files of a storage directory, ordered for upload.
+
+    Files are ordered by the priority of their class, determined by the file
+    extension (files of unknown extensions come last), and by age within a
+    class. The queue is planned from the directory on every call, so files
+    uploaded and removed in a previous window are not considered again.
+    """
+
+    def __init__(self, root: str, classes: {str: [str]} = None, batch_mib: float = 16):
+        """
+        Args:
+            root (str): directory containing the files to upload
+            classes ({str: [str]}): file extensions by class, most important first
+            batch_mib (float): maximum size of a batch, larger files are sent alone
+        """
+
+        self.root = root
+        self.classes = classes or DEFAULT_CLASSES
+        self.batch_bytes = int(batch_mib * 1024**2)
+
+        self._ranks = {}
+        for rank, (name, extensions) in enumerate(self.classes.items()):
+            for extension in extensions:
+                self._ranks[extension.lower()] = (rank, name)
+
+    def classify(self, path: str) -> (int, str):
+        """Priority rank and class name of a file."""
+
+        extension = os.path.splitext(path)[1].lstrip(".").lower()
+        return self._ranks.get(extension, (len(self.classes), "other"))
+
+    def pending(self) -> [dict]:
+        """Files to upload in order, with their path relative to the root, size and class."""
+
+        files = []
+        for dir_path, dir_names, file_names in os.walk(self.root):
+            # hidden directories contain e.g. partially transferred files
+            dir_names[:] = [d for d in dir_names if not d.startswith(".")]
+
+            for file_name in file_names:
+                if file_name.startswith("."):
+                    continue
+
+                path = os.path.join(dir_path, file_name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+
+                rank, name = self.classify(path)
+                files.append({
+                    "path": os.path.relpath(path, self.root),
+                    "size": stat.st_size,
+                    "mtime": stat.st_mtime,
+                    "rank": rank,
+                    "class": name,
+                })
+
+        return sorted(files, key=lambda f: (f["rank"], f["mtime"]))
+
+    def batches(self, max_bytes: int = None):
+        """Split the pending files in batches of at most `batch_mib`.
+
+        Args:
+            max_bytes (int): stop once the batches reach this total size
+
+        Yields:
+            [dict]: files of a batch, in upload order
+        """
+
+        batch = []
+        batch_bytes = 0
+        total_bytes = 0
+
+        for file in self.pending():
+            # the last batch may exceed the limit, so large files are not starved
+            if max_bytes is not None and total_bytes >= max_bytes:
+                break
+
+            if batch and batch_bytes + file["size"] > self.batch_bytes:
+                yield batch
+                batch = []
+                batch_bytes = 0
+
+            batch.append(file)
+            batch_bytes += file["size"]
+            total_bytes += file["size"]
+
+        if batch:
+            yield batch
+
+    def backlog(self) -> {str: dict}:
+        """Number and size of pending files by class."""
+
+        backlog = {}
+        for file in self.pending():
+            entry = backlog.setdefault(file["class"], {"files": 0, "bytes": 0})
+            entry["files"] += 1
+            entry["bytes"] += file["size"]
+
+        return backlog
+
+
+class UploadWindow:
+    """Budget of an upload window, limited in duration and transferred bytes."""
+
+    def __init__(self, max_duration_s: float = None, max_bytes: int = None):
+        self.max_duration_s = max_duration_s
+        self.max_bytes = max_bytes
+
+        self.start_ts = time.monotonic()
+        self.bytes = 0
+        self.files = 0
+
+    def remaining_s(self) -> float:
+        if self.max_duration_s is None:
+            return None
+        return max(0.0, self.max_duration_s - (time.monotonic() - self.start_ts))
+
+    def remaining_bytes(self) -> int:
+        if self.max_bytes is None:
+            return None
+        return max(0, self.max_bytes - self.bytes)
+
+    def exhausted(self) -> bool:
+        return self.remaining_s() == 0 or self.remaining_bytes() == 0
+
+    def add(self, files: [dict]):
+        self.files += len(files)
+        self.bytes += sum(f["size"] for f in files)
+
+    def rate(self) -> float:
+        """Transferred bytes per second."""
+
+        elapsed_s = time.monotonic() - self.start_ts
+        return self.bytes / elapsed_s if elapsed_s else 0.0
@@ -68,15 +68,17 @@ class WiFiConnectionError(Exception):
 class WiFiManager:
     """A Class to manage WiFi connections."""
 
-    def __init__(self, interface="wlan0"):
+    def __init__(self, interface="wlan0", lock=None):
         """
         Args:
             interface (str): WiFi interface to be managed
+            lock (ResourceLock): lock of the WiFi radio, defaults to a private lock
         """
 
         self.interface = interface
 
-        self._lock = threading.Lock()
+        self._lock = lock or threading.Lock()
+        self._locked_by_caller = False
         self.wpa_supplicant = None
         self._start_ap()
 
@@ -95,16 +97,19 @@ class WiFiManager:
         if p.returncode not in [0]:
             logger.warn("WiFi could not be stopped, ignoring")
 
-    def connect(self, wifi, timeout=30):
+    def connect(self, wifi, timeout=30, locked=False):
         """Connect to WiFi.
 
         Args:
             wifi (WiFi): WiFi to connect to
             timeout (int): timeout for dhclient
+            locked (bool): the caller holds the WiFi resource, e.g. together with others
         """
 
-        logger.debug("acquire wifi access")
-        self._lock.acquire()
+        if not locked:
+            logger.debug("acquire wifi access")
+            self._lock.acquire()
+        self._locked_by_caller = locked
 
         logger.info("connecting to wifi '{}'".format(wifi.ssid))
         if self.wpa_supplicant != None:
@@ -127,8 +132,9 @@ class WiFiManager:
 
             self._start_ap()
 
-            logger.debug("release wifi access")
-            self._lock.release()
+            if not self._locked_by_caller:
+                logger.debug("release wifi access")
+                self._lock.release()
 
             logger.error("wifi connection failed.")
             raise WiFiConnectionError("dhclient failed")
@@ -155,8 +161,9 @@ class WiFiManager:
         logger.info("wifi disconnected")
 
         self._start_ap()
-        logger.debug("release wifi access")
-        self._lock.release()
+        if not self._locked_by_caller:
+            logger.debug("release wifi access")
+            self._lock.release()
 
     def _scan_wifi(self, timeout=30):
         p = subprocess.Popen(["iwlist", self.interface, "scan"])
@@ -27,8 +27,6 @@ dependencies = [
     "RPi.GPIO",
     "pyyaml",
     "schedule",
-    "psutil",
-    "gpiozero",
     "w1thermsensor",
     "smbus",
 ]
@@ -52,11 +50,13 @@ setup(
     license="MIT",
     packages=find_packages(exclude=["docs", "tests", "examples"]),
     install_requires=dependencies,
+    extras_require={"change-detection": ["numpy"]},
     zip_safe=True,
     project_urls={
         "Bug Reports": "https://github.com/nature40/pysensorproxy/issues",
         "Source": "https://github.com/nature40/pysensorproxy",
     },
     entry_points={'console_scripts': [
-        'sensorproxy=sensorproxy.app:main']},
+        'sensorproxy=sensorproxy.app:main',
+        'sensorproxy-backfill=sensorproxy.backfill:main']},
 )
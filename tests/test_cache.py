@@ -0,0 +1,126 @@
+import http.server
+import json
+import threading
+import time
+import urllib.error
+
+import pytest
+
+from sensorproxy.cache import TTLCache, HTTPJSONResource
+
+
+class _JSONHandler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers))
+
+        if server.status != 200:
+            self.send_response(server.status)
+            self.end_headers()
+            return
+
+        etag = '"{}"'.format(server.version)
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        body = json.dumps({"version": server.version}).encode()
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    httpd = http.server.HTTPServer(("127.0.0.1", 0), _JSONHandler)
+    httpd.requests = []
+    httpd.status = 200
+    httpd.version = 1
+
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _resource(server):
+    return HTTPJSONResource("http://127.0.0.1:{}/".format(server.server_address[1]), timeout_s=5)
+
+
+def test_values_are_served_within_the_ttl(server):
+    cache = TTLCache(ttl_s=60)
+    resource = _resource(server)
+
+    assert cache.get(resource) == ({"version": 1}, False)
+    assert cache.get(resource) == ({"version": 1}, False)
+
+    assert len(server.requests) == 1
+    assert (cache.fetches, cache.hits) == (1, 1)
+
+
+def test_expired_values_are_fetched_conditionally(server):
+    cache = TTLCache(ttl_s=0)
+    resource = _resource(server)
+
+    cache.get(resource)
+    assert cache.get(resource) == ({"version": 1}, False)
+    assert server.requests[1]["If-None-Match"] == '"1"'
+
+    server.version = 2
+    assert cache.get(resource) == ({"version": 2}, False)
+    assert len(server.requests) == 3
+
+
+def test_stale_values_are_served_if_fetching_fails(server):
+    cache = TTLCache(ttl_s=0, max_stale_s=60)
+    resource = _resource(server)
+    cache.get(resource)
+
+    server.status = 503
+    assert cache.get(resource) == ({"version": 1}, True)
+    assert cache.failures == 1
+
+    cache.max_stale_s = 0
+    time.sleep(0.01)
+    with pytest.raises(urllib.error.HTTPError):
+        cache.get(resource)
+
+
+def test_failure_without_value_raises(server):
+    server.status = 503
+
+    with pytest.raises(urllib.error.HTTPError):
+        TTLCache(ttl_s=60).get(_resource(server))
+
+
+def test_concurrent_callers_share_a_fetch():
+    cache = TTLCache(ttl_s=60)
+    started = threading.Event()
+    release = threading.Event()
+
+    def fetch(previous):
+        started.set()
+        release.wait(5)
+        return "value"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get(fetch)))
+               for _ in range(4)]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert results == [("value", False)] * 4
+    assert cache.fetches == 1
@@ -0,0 +1,98 @@
+import pytest
+
+from sensorproxy.i2c import I2CBus
+
+ADDRESS = 0x70
+
+
+class FakeSMBus:
+    """Records the issued transactions instead of accessing a bus."""
+
+    def __init__(self, bus_id):
+        self.bus_id = bus_id
+        self.writes = []
+        self.fail = False
+
+    def write_byte_data(self, address, register, value):
+        if self.fail:
+            raise OSError("remote I/O error")
+        self.writes.append(("byte", address, register, value))
+
+    def write_i2c_block_data(self, address, register, values):
+        if self.fail:
+            raise OSError("remote I/O error")
+        self.writes.append(("block", address, register, list(values)))
+
+
+@pytest.fixture
+def bus():
+    return I2CBus(1, FakeSMBus)
+
+
+def test_writes_are_not_cached_by_default(bus):
+    for _ in range(3):
+        bus.write_byte_data(ADDRESS, 0x00, 0xff)
+
+    assert len(bus._smbus.writes) == 3
+    assert bus.stats == {"transactions": 3, "skipped": 0}
+
+
+def test_cache_skips_unchanged_registers(bus):
+    bus.enable_cache(ADDRESS)
+
+    bus.write_byte_data(ADDRESS, 0x00, 0xff)
+    bus.write_byte_data(ADDRESS, 0x00, 0xff)
+    bus.write_byte_data(ADDRESS, 0x00, 0x00)
+    bus.write_byte_data(ADDRESS, 0x00, 0x00, force=True)
+
+    assert bus._smbus.writes == [
+        ("byte", ADDRESS, 0x00, 0xff),
+        ("byte", ADDRESS, 0x00, 0x00),
+        ("byte", ADDRESS, 0x00, 0x00),
+    ]
+    assert bus.stats == {"transactions": 3, "skipped": 1}
+
+
+def test_cache_is_per_device(bus):
+    bus.enable_cache(ADDRESS)
+
+    for _ in range(2):
+        bus.write_byte_data(ADDRESS, 0x00, 0x01)
+        bus.write_byte_data(ADDRESS + 1, 0x00, 0x01)
+
+    assert bus._smbus.writes.count(("byte", ADDRESS, 0x00, 0x01)) == 1
+    assert bus._smbus.writes.count(("byte", ADDRESS + 1, 0x00, 0x01)) == 2
+
+
+def test_block_writes_group_consecutive_registers(bus):
+    bus.enable_cache(ADDRESS)
+    bus.write_byte_data(ADDRESS, 0x02, 0x20)
+
+    bus.write_registers(ADDRESS, {0x01: 0x10, 0x02: 0x20, 0x03: 0x30, 0x04: 0x40, 0x09: 0x90},
+                        block=True)
+
+    # 0x02 is cached, so 0x01 and 0x03-0x04 are written separately
+    assert bus._smbus.writes[1:] == [
+        ("byte", ADDRESS, 0x01, 0x10),
+        ("block", ADDRESS, 0x03, [0x30, 0x40]),
+        ("byte", ADDRESS, 0x09, 0x90),
+    ]
+    assert bus.stats == {"transactions": 4, "skipped": 1}
+
+    bus.write_registers(ADDRESS, {0x01: 0x10, 0x03: 0x30}, block=True)
+    assert bus.stats == {"transactions": 4, "skipped": 3}
+
+
+def test_failed_write_invalidates_the_device(bus):
+    bus.enable_cache(ADDRESS)
+    bus.write_byte_data(ADDRESS, 0x00, 0x01)
+
+    bus._smbus.fail = True
+    with pytest.raises(OSError):
+        bus.write_byte_data(ADDRESS, 0x01, 0x01)
+
+    # the device may have been reset, so known registers are written again
+    bus._smbus.fail = False
+    bus.write_byte_data(ADDRESS, 0x00, 0x01)
+
+    assert bus._smbus.writes.count(("byte", ADDRESS, 0x00, 0x01)) == 2
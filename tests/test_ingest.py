@@ -0,0 +1,131 @@
+import csv
+import json
+import time
+import types
+import urllib.error
+import urllib.request
+
+import pytest
+
+from sensorproxy.ingest import IngestServer, IngestSender, INGEST_PATH
+
+HEADER = ["Time (date)", "Temperature (C)"]
+TOKEN = "secret"
+
+
+class FakeInflux:
+    def __init__(self):
+        self.rows = []
+
+    def publish_rows(self, header, rows, _class, _hostname, _id, _sensor):
+        self.rows.extend(rows)
+
+
+@pytest.fixture
+def proxy(tmp_path):
+    return types.SimpleNamespace(storage_path=str(tmp_path), catalog=None, influx=FakeInflux())
+
+
+@pytest.fixture
+def server(proxy):
+    server = IngestServer(proxy, port=0, token=TOKEN)
+    yield server
+    server.close()
+
+
+def _url(server):
+    return "http://127.0.0.1:{}".format(server.address[1])
+
+
+def _sender(server, **kwargs):
+    # sent explicitly by the tests, not by the background thread
+    return IngestSender(_url(server), flush_interval="1h", timeout="5s", **kwargs)
+
+
+def _wait(condition, timeout_s=10):
+    deadline = time.time() + timeout_s
+    while not condition():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+def _send(sender, rows, sensor="temp"):
+    sender.send(HEADER, rows, "DS18B20", "node", "n1", sensor)
+
+
+def test_round_trip(server, proxy, tmp_path):
+    sender = _sender(server, token=TOKEN)
+    rows = [["2020-01-01T000000", 21.5], ["2020-01-01T000001", 22.0]]
+    _send(sender, rows)
+    sender.flush()
+
+    assert _wait(lambda: server.stats()["written_rows"] == 2)
+    assert sender.stats()["sent_rows"] == 2
+    assert proxy.influx.rows == rows
+
+    files = list((tmp_path / "node" / "DS18B20").iterdir())
+    assert len(files) == 1
+    with open(files[0]) as csv_file:
+        assert list(csv.reader(csv_file)) == [HEADER] + [[ts, str(v)] for ts, v in rows]
+
+
+def test_header_change_starts_a_new_file(server, tmp_path):
+    sender = _sender(server, token=TOKEN)
+    _send(sender, [["2020-01-01T000000", 21.5]])
+    sender.send(HEADER + ["#Probe"], [["2020-01-01T000001", 22.0, "a"]],
+                "DS18B20", "node", "n1", "temp")
+    sender.flush()
+
+    assert _wait(lambda: server.stats()["written_rows"] == 2)
+    files = sorted((tmp_path / "node" / "DS18B20").iterdir())
+    assert len(files) == 2
+    for path in files:
+        with open(path) as csv_file:
+            assert len(list(csv.reader(csv_file))) == 2
+
+
+def test_unauthorized_rows_are_dropped(server):
+    sender = _sender(server, token="wrong")
+    _send(sender, [["2020-01-01T000000", 21.5]])
+    sender.flush()
+
+    assert sender.stats()["dropped_rows"] == 1
+    assert server.stats()["received_rows"] == 0
+
+
+def test_paths_outside_the_storage_are_rejected(server):
+    batch = {"hostname": "..", "id": "n1", "class": "DS18B20", "sensor": "temp",
+             "header": HEADER, "rows": [["2020-01-01T000000", 21.5]]}
+    request = urllib.request.Request(_url(server) + INGEST_PATH, method="POST",
+                                     data=json.dumps({"batches": [batch]}).encode())
+    request.add_header("Authorization", "Bearer {}".format(TOKEN))
+
+    with pytest.raises(urllib.error.HTTPError) as e:
+        urllib.request.urlopen(request, timeout=5)
+    assert e.value.code == 400
+
+
+def test_full_queue_keeps_rows_at_the_sender(proxy):
+    # without writers, the queue is never drained
+    server = IngestServer(proxy, port=0, token=TOKEN, max_requests=1, writers=0)
+    try:
+        sender = _sender(server, token=TOKEN)
+        _send(sender, [["2020-01-01T000000", 21.5]])
+        sender.flush()
+
+        _send(sender, [["2020-01-01T000001", 22.0]])
+        with pytest.raises(urllib.error.HTTPError) as e:
+            sender.flush()
+
+        assert e.value.code == 503
+        assert sender.stats()["buffered_rows"] == 1
+        assert server.stats()["rejected_requests"] == 1
+    finally:
+        server.close()
+
+
+def test_token_is_required_beyond_localhost(proxy):
+    with pytest.raises(ValueError):
+        IngestServer(proxy, host="0.0.0.0", port=0)
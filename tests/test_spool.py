@@ -0,0 +1,129 @@
+import gzip
+import http.server
+import threading
+import time
+
+import pytest
+from influxdb.exceptions import InfluxDBClientError
+
+from sensorproxy.influx import InfluxDBSensorClient
+from sensorproxy.spool import InfluxSpool
+
+HEADER = ["Time (date)", "Temperature (C)"]
+
+
+class _InfluxHandler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+
+        status = server.status
+        if status == 204:
+            server.lines.extend(body.decode().splitlines())
+
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+@pytest.fixture
+def influx():
+    """Stand-in for an InfluxDB server, answering writes with `status`."""
+
+    httpd = http.server.HTTPServer(("127.0.0.1", 0), _InfluxHandler)
+    httpd.status = 204
+    httpd.lines = []
+
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _client(influx, spool_path):
+    return InfluxDBSensorClient(host="127.0.0.1", port=influx.server_address[1], database="test",
+                                spool={"path": str(spool_path), "interval": "1s", "max_backoff": "1s"})
+
+
+def _publish(client, value):
+    client.publish(HEADER, ["2020-01-01T000000", value], "Temperature", "node", "n1", "temp")
+
+
+def _wait(condition, timeout_s=10):
+    deadline = time.time() + timeout_s
+    while not condition():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+def test_spool_persists_points(tmp_path):
+    spool = InfluxSpool(str(tmp_path))
+    spool.append([{"measurement": "m", "fields": {"v": 1}}], {"host": "a"}, "s")
+    spool.append([{"measurement": "m", "fields": {"v": 2}}] * 2, {"host": "a"}, "s")
+
+    reopened = InfluxSpool(str(tmp_path))
+    assert reopened.points == 3
+
+    segment, entries = reopened.take_oldest()
+    assert [e["count"] for e in entries] == [1, 2]
+
+    reopened.remove(segment, entries)
+    assert reopened.points == 0
+    assert InfluxSpool(str(tmp_path)).points == 0
+
+
+def test_spool_evicts_oldest_segments(tmp_path):
+    spool = InfluxSpool(str(tmp_path), max_size_mib=0.001, segment_size_mib=0.0001)
+    for value in range(20):
+        spool.append([{"measurement": "m", "fields": {"v": value}}], {}, "s")
+
+    assert spool.evicted_points > 0
+    assert spool.points == 20 - spool.evicted_points
+
+
+def test_unavailable_server_is_spooled_and_replayed(influx, tmp_path):
+    influx.status = 503
+    client = _client(influx, tmp_path)
+
+    _publish(client, 21.5)
+    _publish(client, 22.5)
+    assert client.spool.points == 2
+    assert influx.lines == []
+
+    influx.status = 204
+    assert _wait(lambda: client.spool.points == 0)
+
+    assert len(influx.lines) == 2
+    assert "Temperature\\ (C)=21.5" in influx.lines[0]
+    assert client.replayer.replayed_points == 2
+
+
+def test_rejected_writes_are_not_spooled(influx, tmp_path):
+    influx.status = 400
+    client = _client(influx, tmp_path)
+
+    with pytest.raises(InfluxDBClientError):
+        _publish(client, 21.5)
+    assert client.spool.points == 0
+
+
+def test_rejected_replays_are_quarantined(influx, tmp_path):
+    influx.status = 503
+    client = _client(influx, tmp_path)
+    _publish(client, 21.5)
+
+    influx.status = 400
+    assert _wait(lambda: client.spool.points == 0)
+
+    assert client.spool.quarantined_points == 1
+    assert client.replayer.replayed_points == 0
+    assert list((tmp_path / InfluxSpool.QUARANTINE_DIR).iterdir())